@@ -1,10 +1,56 @@
 import click
+import importlib
 
 from modeling.config import logger
-from modeling.llm.__main__ import cli as llm_cli
-from modeling.docs.__main__ import cli as docs_cli
-from modeling.convolution.__main__ import cli as convolution_cli
-from modeling.recommendation.__main__ import cli as recommendation_cli
+from modeling.config.profiler import profiler
+
+
+class LazyGroup(click.Group):
+    """
+    Group whose `lazy_subcommands` ({name: ("module:attribute", short help)})
+    are imported only when they are invoked or their own help is shown, so
+    that a command doesn't pay for the torch, mlx, kaggle... imports of the
+    others. The group help lists them with their static short help.
+    """
+
+    def __init__(self, *args, lazy_subcommands: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted([*super().list_commands(ctx), *self.lazy_subcommands])
+
+    def get_command(self, ctx: click.Context, cmd_name: str):
+        if cmd_name in self.lazy_subcommands:
+            return self._lazy_load(cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter):
+        """`click.Group.format_commands` without importing the lazy subcommands"""
+        names = self.list_commands(ctx)
+        limit = formatter.width - 6 - max(map(len, names), default=0)
+        rows = []
+        for name in names:
+            if name in self.lazy_subcommands:
+                rows.append((name, self.lazy_subcommands[name][1]))
+                continue
+            command = super().get_command(ctx, name)
+            if command is not None and not command.hidden:
+                rows.append((name, command.get_short_help_str(limit)))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+    def _lazy_load(self, cmd_name: str) -> click.Command:
+        import_path, _ = self.lazy_subcommands[cmd_name]
+        module_name, attribute = import_path.split(":")
+        command = getattr(importlib.import_module(module_name), attribute)
+        if not isinstance(command, click.Command):
+            raise ValueError(
+                f"Lazy loading of {import_path} failed, "
+                f"it is a {type(command).__name__} not a click command"
+            )
+        return command
 
 
 def add_options(options):
@@ -21,13 +67,36 @@ common_options = [
         "--debug/--no-debug", "-d/-D", default=False, help="Enable debug mode"
     ),
     click.option("--config", "-c", type=click.Path(), help="Path to config file"),
+    click.option(
+        "--profile/--no-profile",
+        default=False,
+        help="Time the stages of the command and trace their memory",
+    ),
+    click.option(
+        "--profile-file",
+        default="profile.json",
+        type=click.Path(),
+        help="Chrome trace of the profiled stages (chrome://tracing or Perfetto)",
+    ),
 ]
 
 
-@click.group()
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "recommendation": (
+            "modeling.recommendation.__main__:cli",
+            "MovieLens Recommendation System CLI",
+        ),
+        "convolution": ("modeling.convolution.__main__:cli", "Convolutional Neural Network CLI"),
+        "llm": ("modeling.llm.__main__:cli", "Large Language Model CLI Example"),
+        "docs": ("modeling.docs.__main__:cli", "Documentation builder CLI tool"),
+        "bench": ("modeling.bench.__main__:cli", "Performance benchmarks CLI"),
+    },
+)
 @add_options(common_options)
 @click.pass_context
-def cli(ctx: click.Context, debug: bool, config: str):
+def cli(ctx: click.Context, debug: bool, config: str, profile: bool, profile_file: str):
     """Modeling CLI - Machine Learning Operations Tool"""
     ctx.ensure_object(dict)
     # Setup logging
@@ -40,12 +109,16 @@ def cli(ctx: click.Context, debug: bool, config: str):
         logger.debug("Debug mode enabled")
         if config:
             logger.debug(f"Using config file: {config}")
+    if profile:
+        profiler.enable()
+        ctx.call_on_close(lambda: write_profile(profile_file))
 
 
-cli.add_command(recommendation_cli, "recommendation")
-cli.add_command(convolution_cli, "convolution")
-cli.add_command(llm_cli, "llm")
-cli.add_command(docs_cli, "docs")
+def write_profile(profile_file: str):
+    """Dump the Chrome trace and log the summary of the profiled stages"""
+    profiler.disable()
+    profiler.dump(profile_file)
+    logger.info(f"Profiled stages, trace saved to {profile_file}\n{profiler.summary()}")
 
 
 @cli.command()
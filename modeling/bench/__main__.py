@@ -0,0 +1,350 @@
+import click
+import shutil
+import tempfile
+from pathlib import Path
+
+from modeling.config import logger
+from modeling.bench.measure import as_dicts, report, table, write_report
+
+
+def parse_count(value: str) -> int:
+    """Row counts like 1M, 500K or 20_000_000"""
+    value = value.strip().upper().replace("_", "")
+    scale = {"K": 10**3, "M": 10**6, "B": 10**9}.get(value[-1:], 1)
+    return int(float(value.rstrip("KMB")) * scale)
+
+
+@click.group("bench")
+def cli():
+    """Performance benchmarks CLI"""
+    pass
+
+
+@cli.command()
+@click.option(
+    "--rows",
+    multiple=True,
+    default=["1M"],
+    help="Synthetic ratings per run (repeatable), e.g. 1M, 10M, 20M, 100M",
+)
+@click.option(
+    "--stage",
+    "stages",
+    multiple=True,
+    help="Stages to report (repeatable), every stage when omitted",
+)
+@click.option(
+    "--data-dir",
+    default=None,
+    help="Directory of the synthetic data, a temporary one removed afterwards when omitted",
+)
+@click.option("--seed", default=0, help="Seed of the synthetic data")
+@click.option(
+    "--output-file", default=None, help="JSON results file, printed when omitted"
+)
+def recommendation(
+    rows: tuple, stages: tuple, data_dir: str, seed: int, output_file: str
+):
+    """Time the recommendation pipeline on synthetic MovieLens shaped ratings"""
+    from modeling.bench.recommendation import STAGES, run
+
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise click.BadParameter(f"Unknown stages {sorted(unknown)}, choose from {STAGES}")
+    runs = []
+    for n in map(parse_count, rows):
+        directory = Path(data_dir) / str(n) if data_dir else Path(tempfile.mkdtemp())
+        try:
+            logger.info(f"Benchmarking the recommendation pipeline on {n:,} ratings")
+            measurements = run(n, directory, list(stages) or None, seed=seed)
+        finally:
+            if data_dir is None:
+                shutil.rmtree(directory, ignore_errors=True)
+        logger.info(f"{n:,} ratings\n{table(measurements)}")
+        runs.append({"rows": n, "stages": as_dicts(measurements)})
+    write_report(output_file, report("recommendation", runs))
+
+
+@cli.command()
+@click.option(
+    "--context",
+    "contexts",
+    multiple=True,
+    default=["128", "512", "2048", "8192"],
+    help="Prompt lengths (repeatable), e.g. 128, 2048, 8192",
+)
+@click.option("--tokens", default=64, help="Generated tokens per prompt")
+@click.option("--layers", default=4, help="Number of layers of the model")
+@click.option("--dims", default=256, help="Model dimensions")
+@click.option("--mlp-dims", default=512, help="Hidden dimensions of the MLPs")
+@click.option("--heads", default=4, help="Number of attention heads")
+@click.option("--vocab-size", default=8192, help="Vocabulary size")
+@click.option("--prefill-step", default=512, help="Prompt tokens processed at once")
+@click.option("--seed", default=0, help="Seed of the weights and prompts")
+@click.option(
+    "--output-file", default=None, help="JSON results file, printed when omitted"
+)
+def llm(
+    contexts: tuple,
+    tokens: int,
+    layers: int,
+    dims: int,
+    mlp_dims: int,
+    heads: int,
+    vocab_size: int,
+    prefill_step: int,
+    seed: int,
+    output_file: str,
+):
+    """Time the prefill and decode tokens/s of the MLX Llama generator"""
+    from modeling.bench.llm import run
+
+    runs = run(
+        [parse_count(c) for c in contexts],
+        tokens,
+        num_layers=layers,
+        vocab_size=vocab_size,
+        dims=dims,
+        mlp_dims=mlp_dims,
+        num_heads=heads,
+        prefill_step=prefill_step,
+        seed=seed,
+    )
+    for r in runs:
+        logger.info(
+            f"context {r['context']:,}: MLX peak memory {r['mlx_peak_memory_mb']:,.0f}MB "
+            f"KV cache {r['cache_mb']:,.1f}MB\n{table(r['stages'])}"
+        )
+        r["stages"] = as_dicts(r["stages"])
+    write_report(output_file, report("llm", runs))
+
+
+@cli.command("llm-batch")
+@click.option(
+    "--batch-size",
+    "batch_sizes",
+    multiple=True,
+    default=[1, 4, 16, 64],
+    help="Prompts per batch (repeatable)",
+)
+@click.option("--prompt-tokens", default=128, help="Longest prompt, the shortest is half")
+@click.option("--tokens", default=64, help="Generated tokens per prompt")
+@click.option("--layers", default=4, help="Number of layers of the model")
+@click.option("--dims", default=256, help="Model dimensions")
+@click.option("--mlp-dims", default=512, help="Hidden dimensions of the MLPs")
+@click.option("--heads", default=4, help="Number of attention heads")
+@click.option("--vocab-size", default=8192, help="Vocabulary size")
+@click.option("--seed", default=0, help="Seed of the weights and prompts")
+@click.option(
+    "--output-file", default=None, help="JSON results file, printed when omitted"
+)
+def llm_batch(
+    batch_sizes: tuple,
+    prompt_tokens: int,
+    tokens: int,
+    layers: int,
+    dims: int,
+    mlp_dims: int,
+    heads: int,
+    vocab_size: int,
+    seed: int,
+    output_file: str,
+):
+    """Time the generated tokens/s of batches of prompts of different lengths"""
+    from modeling.bench.llm import run_batch
+
+    runs = run_batch(
+        list(batch_sizes),
+        prompt_tokens,
+        tokens,
+        num_layers=layers,
+        vocab_size=vocab_size,
+        dims=dims,
+        mlp_dims=mlp_dims,
+        num_heads=heads,
+        seed=seed,
+    )
+    for r in runs:
+        logger.info(
+            f"batch of {r['batch_size']}: MLX peak memory {r['mlx_peak_memory_mb']:,.0f}MB\n"
+            f"{table(r['stages'])}"
+        )
+        r["stages"] = as_dicts(r["stages"])
+    write_report(output_file, report("llm-batch", runs))
+
+
+@cli.command("llm-serve")
+@click.option("--requests", "n_requests", default=64, help="Number of requests")
+@click.option(
+    "--rate", multiple=True, default=[2.0, 8.0], help="Arrivals per second (repeatable)"
+)
+@click.option("--max-batch-size", default=16, help="Slots of the decode batch")
+@click.option("--prompt-tokens", default=128, help="Longest prompt, the shortest is half")
+@click.option("--tokens", default=64, help="Most tokens per request, the fewest is half")
+@click.option("--layers", default=4, help="Number of layers of the model")
+@click.option("--dims", default=256, help="Model dimensions")
+@click.option("--mlp-dims", default=512, help="Hidden dimensions of the MLPs")
+@click.option("--heads", default=4, help="Number of attention heads")
+@click.option("--vocab-size", default=8192, help="Vocabulary size")
+@click.option("--seed", default=0, help="Seed of the weights, prompts and arrivals")
+@click.option(
+    "--output-file", default=None, help="JSON results file, printed when omitted"
+)
+def llm_serve(
+    n_requests: int,
+    rate: tuple,
+    max_batch_size: int,
+    prompt_tokens: int,
+    tokens: int,
+    layers: int,
+    dims: int,
+    mlp_dims: int,
+    heads: int,
+    vocab_size: int,
+    seed: int,
+    output_file: str,
+):
+    """Time to first token and tokens/s of continuous batching under a Poisson load"""
+    from modeling.bench.llm import run_serve
+
+    runs = []
+    for r in rate:
+        stats = run_serve(
+            n_requests,
+            r,
+            max_batch_size,
+            prompt_tokens,
+            tokens,
+            num_layers=layers,
+            vocab_size=vocab_size,
+            dims=dims,
+            mlp_dims=mlp_dims,
+            num_heads=heads,
+            seed=seed,
+        )
+        logger.info(
+            f"{r} requests/s: {stats['tokens_per_s']:,.1f} tokens/s, time to first token "
+            f"p50 {stats['ttft_p50_s']:.3f}s p95 {stats['ttft_p95_s']:.3f}s"
+        )
+        runs.append(stats)
+    write_report(output_file, report("llm-serve", runs))
+
+
+@cli.command("torch-decode")
+@click.option(
+    "--context",
+    "contexts",
+    multiple=True,
+    default=["128", "2K", "8K"],
+    help="Prompt tokens before decoding (repeatable), e.g. 128, 2K",
+)
+@click.option("--steps", default=64, help="Timed decode steps per context")
+@click.option("--layers", default=12, help="Number of layers of the model")
+@click.option("--dims", default=512, help="Model dimensions")
+@click.option("--mlp-dims", default=1024, help="Hidden dimensions of the MLPs")
+@click.option("--heads", default=8, help="Number of attention heads")
+@click.option("--vocab-size", default=8192, help="Vocabulary size")
+@click.option("--seed", default=0, help="Seed of the weights and prompts")
+@click.option(
+    "--output-file", default=None, help="JSON results file, printed when omitted"
+)
+def torch_decode(
+    contexts: tuple,
+    steps: int,
+    layers: int,
+    dims: int,
+    mlp_dims: int,
+    heads: int,
+    vocab_size: int,
+    seed: int,
+    output_file: str,
+):
+    """Time the RoPE calls and decode steps of the PyTorch Llama model"""
+    from modeling.bench.torch_llm import run_decode
+
+    runs = run_decode(
+        [parse_count(c) for c in contexts],
+        steps,
+        num_layers=layers,
+        vocab_size=vocab_size,
+        dims=dims,
+        mlp_dims=mlp_dims,
+        num_heads=heads,
+        seed=seed,
+    )
+    for r in runs:
+        logger.info(
+            f"context {r['context']:,}: RoPE {r['rope_us']:.1f}µs "
+            f"decode step {r['decode_step_ms']:.2f}ms\n{table(r['stages'])}"
+        )
+        r["stages"] = as_dicts(r["stages"])
+    write_report(output_file, report("torch-decode", runs))
+
+
+@cli.command("torch-prefill")
+@click.option(
+    "--context",
+    "contexts",
+    multiple=True,
+    default=["1024", "2048", "4096", "8192", "16384"],
+    help="Prompt tokens (repeatable), e.g. 1024, 16K",
+)
+@click.option(
+    "--attention",
+    "attentions",
+    multiple=True,
+    type=click.Choice(["eager", "sdpa", "chunked"]),
+    default=["eager", "sdpa", "chunked"],
+    help="Attention implementations (repeatable)",
+)
+@click.option("--layers", default=2, help="Number of layers of the model")
+@click.option("--dims", default=256, help="Model dimensions")
+@click.option("--mlp-dims", default=512, help="Hidden dimensions of the MLPs")
+@click.option("--heads", default=4, help="Number of attention heads")
+@click.option("--vocab-size", default=8192, help="Vocabulary size")
+@click.option("--block-size", default=256, help="Queries and keys per block of the chunked attention")
+@click.option(
+    "--eager-max-context",
+    default=8192,
+    help="Longest prompt of the eager attention, which holds all the scores",
+)
+@click.option("--seed", default=0, help="Seed of the weights and prompts")
+@click.option(
+    "--output-file", default=None, help="JSON results file, printed when omitted"
+)
+def torch_prefill(
+    contexts: tuple,
+    attentions: tuple,
+    layers: int,
+    dims: int,
+    mlp_dims: int,
+    heads: int,
+    vocab_size: int,
+    block_size: int,
+    eager_max_context: int,
+    seed: int,
+    output_file: str,
+):
+    """Time the prefill tokens/s and peak memory of the PyTorch attention implementations"""
+    from modeling.bench.torch_llm import run_prefill
+
+    runs = run_prefill(
+        [parse_count(c) for c in contexts],
+        attentions,
+        num_layers=layers,
+        vocab_size=vocab_size,
+        dims=dims,
+        mlp_dims=mlp_dims,
+        num_heads=heads,
+        block_size=block_size,
+        eager_max_context=eager_max_context,
+        seed=seed,
+    )
+    logger.info(f"prefill\n{table([s for r in runs for s in r['stages']])}")
+    for r in runs:
+        r["stages"] = as_dicts(r["stages"])
+    write_report(output_file, report("torch-prefill", runs))
+
+
+if __name__ == "__main__":
+    cli()
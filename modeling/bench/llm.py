@@ -0,0 +1,144 @@
+import asyncio
+import numpy as np
+import mlx.core as mx
+
+from modeling.bench.measure import measure
+from modeling.llm.mlx__model import Llama
+from modeling.llm.mlx__scheduler import Scheduler
+
+
+def run(
+    contexts: list[int],
+    tokens: int = 64,
+    num_layers: int = 4,
+    vocab_size: int = 8192,
+    dims: int = 256,
+    mlp_dims: int = 512,
+    num_heads: int = 4,
+    prefill_step: int = 512,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Time `Llama.generate` of `tokens` tokens after random prompts of every
+    context length, on the default MLX device.
+
+    Every run has the prefill (the prompt up to the first token) and decode
+    (the other tokens, evaluated one at a time like a streaming client)
+    `Measurement`s, the MLX peak memory of the run and the size of the KV
+    caches at the end.
+    """
+    mx.random.seed(seed)
+    model = Llama(num_layers, vocab_size, dims, mlp_dims, num_heads)
+    mx.eval(model.parameters())
+    runs = []
+    for context in contexts:
+        prompt = mx.random.randint(0, vocab_size, (1, context))
+        cache = model.make_cache()
+        generator = model.generate(prompt, 1.0, cache=cache, prefill_step=prefill_step)
+        results = []
+        mx.reset_peak_memory()
+        with measure(f"prefill@{context}", context, results):
+            mx.eval(next(generator))
+        with measure(f"decode@{context}", tokens - 1, results):
+            for _ in range(tokens - 1):
+                mx.eval(next(generator))
+        runs.append(
+            {
+                "context": context,
+                "device": str(mx.default_device()),
+                "mlx_peak_memory_mb": mx.get_peak_memory() / 2**20,
+                "cache_mb": sum(c.nbytes() for c in cache) / 2**20,
+                "stages": results,
+            }
+        )
+    return runs
+
+
+def run_batch(
+    batch_sizes: list[int],
+    prompt_tokens: int = 128,
+    tokens: int = 64,
+    num_layers: int = 4,
+    vocab_size: int = 8192,
+    dims: int = 256,
+    mlp_dims: int = 512,
+    num_heads: int = 4,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Time `Llama.generate_batch` of `tokens` tokens after every prompt of
+    batches of random prompts of prompt_tokens / 2 to `prompt_tokens` tokens.
+
+    Every run has one `Measurement` of the whole batch, its rows/s being the
+    generated tokens/s, and the MLX peak memory of the run.
+    """
+    mx.random.seed(seed)
+    model = Llama(num_layers, vocab_size, dims, mlp_dims, num_heads)
+    mx.eval(model.parameters())
+    runs = []
+    for batch_size in batch_sizes:
+        lengths = mx.random.randint(prompt_tokens // 2, prompt_tokens + 1, (batch_size,))
+        prompts = [mx.random.randint(0, vocab_size, (n,)).tolist() for n in lengths.tolist()]
+        results = []
+        mx.reset_peak_memory()
+        with measure(f"batch@{batch_size}", batch_size * tokens, results):
+            for _ in model.generate_batch(prompts, 1.0, tokens):
+                pass
+        runs.append(
+            {
+                "batch_size": batch_size,
+                "device": str(mx.default_device()),
+                "mlx_peak_memory_mb": mx.get_peak_memory() / 2**20,
+                "stages": results,
+            }
+        )
+    return runs
+
+
+def run_serve(
+    n_requests: int,
+    rate: float,
+    max_batch_size: int = 16,
+    prompt_tokens: int = 128,
+    tokens: int = 64,
+    num_layers: int = 4,
+    vocab_size: int = 8192,
+    dims: int = 256,
+    mlp_dims: int = 512,
+    num_heads: int = 4,
+    seed: int = 0,
+) -> dict:
+    """
+    Serve `n_requests` requests arriving as a Poisson process of `rate`
+    requests/s through a continuous batching `Scheduler`, returns its stats
+    (time to first token, tokens/s).
+
+    Prompts have prompt_tokens / 2 to `prompt_tokens` random tokens and the
+    requests ask for tokens / 2 to `tokens` tokens.
+    """
+    mx.random.seed(seed)
+    model = Llama(num_layers, vocab_size, dims, mlp_dims, num_heads)
+    mx.eval(model.parameters())
+    rng = np.random.default_rng(seed)
+    arrivals = np.cumsum(rng.exponential(1 / rate, n_requests))
+    lengths = rng.integers(prompt_tokens // 2, prompt_tokens + 1, n_requests)
+    max_tokens = rng.integers(max(tokens // 2, 1), tokens + 1, n_requests)
+    prompts = [rng.integers(0, vocab_size, n).tolist() for n in lengths]
+
+    async def serve() -> dict:
+        async with Scheduler(model, max_batch_size) as scheduler:
+
+            async def client(i: int):
+                await asyncio.sleep(arrivals[i])
+                async for _ in scheduler.submit(prompts[i], int(max_tokens[i])):
+                    pass
+
+            await asyncio.gather(*(client(i) for i in range(n_requests)))
+            return scheduler.stats()
+
+    return {
+        "rate": rate,
+        "max_batch_size": max_batch_size,
+        "device": str(mx.default_device()),
+        **asyncio.run(serve()),
+    }
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import platform
+import subprocess
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+from modeling.config import logger
+from modeling.config.profiler import peak_rss_mb, reset_peak_rss
+
+
+@dataclass
+class Measurement:
+    """Wall time, peak resident memory and throughput of one benchmark stage"""
+
+    name: str
+    seconds: float = 0.0
+    rows: int = 0
+    rows_per_s: float = 0.0
+    peak_rss_mb: float = 0.0
+
+
+@contextmanager
+def measure(name: str, rows: int = 0, results: list = None):
+    """
+    Time the block and record its peak RSS into the yielded `Measurement`,
+    appended to `results` when given. `rows` can also be set inside the block.
+    """
+    m = Measurement(name, rows=rows)
+    if results is not None:
+        results.append(m)
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    try:
+        yield m
+    finally:
+        m.seconds = time.perf_counter() - t0
+        m.peak_rss_mb = peak_rss_mb()
+        m.rows_per_s = m.rows / m.seconds if m.seconds > 0 else 0.0
+        logger.info(
+            f"{m.name}: {m.seconds:.3f}s {m.rows_per_s:,.0f} rows/s "
+            f"peak RSS {m.peak_rss_mb:,.0f}MB"
+        )
+
+
+def environment() -> dict:
+    """Versions and machine of a benchmark run, to compare results across commits"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def report(suite: str, runs: list[dict]) -> dict:
+    return {"suite": suite, "environment": environment(), "runs": runs}
+
+
+def write_report(path: Path, data: dict):
+    """Write a report as JSON, to stdout when `path` is None"""
+    text = json.dumps(data, indent=2)
+    if path is None:
+        print(text)
+        return
+    Path(path).write_text(text + "\n")
+    logger.info(f"Saved benchmark results to {path}")
+
+
+def table(measurements: list[Measurement]) -> str:
+    """Fixed width summary of the measurements"""
+    lines = [f"{'stage':<24}{'seconds':>10}{'rows/s':>16}{'peak RSS MB':>14}"]
+    for m in measurements:
+        lines.append(
+            f"{m.name:<24}{m.seconds:>10.3f}{m.rows_per_s:>16,.0f}{m.peak_rss_mb:>14,.0f}"
+        )
+    return "\n".join(lines)
+
+
+def as_dicts(measurements: list[Measurement]) -> list[dict]:
+    return [asdict(m) for m in measurements]
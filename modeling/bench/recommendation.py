@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from modeling.bench.measure import Measurement, measure
+from modeling.config import logger
+from modeling.recommendation.matrix_factorization import (
+    ALS,
+    get_loss,
+    get_metrics,
+    update_W_and_b,
+)
+from modeling.recommendation.preprocess import (
+    basic_transform,
+    convert_data_to_dict,
+    save_as_sparse_data,
+    split_train_test,
+)
+from modeling.recommendation.store import STORE_DIR, RatingsStore
+from modeling.recommendation.synthetic import write_synthetic_ratings
+
+STAGES = [
+    "generate",
+    "read_parquet",
+    "basic_transform",
+    "split_train_test",
+    "convert_data_to_dict",
+    "get_loss",
+    "save_as_sparse_data",
+    "ratings_store",
+    "update_W_and_b",
+    "update_W_and_b_loops",
+    "update_U_and_c",
+    "get_metrics",
+]
+
+
+def run(
+    n_ratings: int,
+    data_dir: Path,
+    stages: list[str] = None,
+    K: int = 10,
+    seed: int = 0,
+) -> list[Measurement]:
+    """
+    Time the recommendation pipeline stages on `n_ratings` synthetic ratings.
+
+    Stages run in pipeline order and every stage needs the previous ones
+    except for the dictionaries: convert_data_to_dict, get_loss (which
+    scores its dictionary) and update_W_and_b_loops (the dictionary based
+    reference solver) can be left out of `stages`, they are the memory
+    hungry part of the pipeline. update_W_and_b / update_U_and_c are one
+    half-step of `ALS`, update_W_and_b_loops the same half-step from the
+    same factors with the loops, get_metrics scores every train rating.
+    """
+    stages = STAGES if stages is None else stages
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    parquet_file = data_dir / "rating.parquet"
+    results = []
+    if "generate" in stages or not parquet_file.exists():
+        with measure("generate", 0, results) as m:
+            m.rows = write_synthetic_ratings(parquet_file, n_ratings, seed=seed)
+    with measure("read_parquet", 0, results) as m:
+        df = pd.read_parquet(parquet_file)
+        m.rows = len(df)
+    rows = len(df)
+    with measure("basic_transform", rows, results):
+        df = basic_transform(df)
+    with measure("split_train_test", rows, results):
+        df_train, df_test = split_train_test(df, seed=seed)
+    del df
+    user2movie = usermovie2rating = None
+    loops = "update_W_and_b_loops" in stages
+    if "convert_data_to_dict" in stages or loops:
+        with measure("convert_data_to_dict", len(df_train), results):
+            user2movie, _, usermovie2rating = convert_data_to_dict(df_train, "train")
+        if "get_loss" in stages:
+            N = int(df_train["userId"].max()) + 1
+            M = int(df_train["movie_idx"].max()) + 1
+            rng = np.random.default_rng(seed)
+            W, U = rng.standard_normal((N, K)), rng.standard_normal((M, K))
+            with measure("get_loss", len(df_train), results):
+                get_loss(usermovie2rating, W, U, np.zeros(N), np.zeros(M), 3.5)
+        if not loops:
+            user2movie = usermovie2rating = None
+    if "save_as_sparse_data" in stages:
+        with measure("save_as_sparse_data", len(df_train), results):
+            save_as_sparse_data(df_train, data_dir=data_dir, subset="train")
+    with measure("ratings_store", rows, results):
+        store = RatingsStore.from_frames(df_train, df_test).save(data_dir / STORE_DIR)
+    del df_train, df_test
+    store = RatingsStore.open(data_dir / STORE_DIR)
+    nnz = len(store.user_data)
+    als = ALS(store, K, rng=np.random.default_rng(seed))
+    mu = store.mu
+    # the loops start from the same factors, after the vectorized half-step
+    # so that their dictionaries don't push the store out of the page cache
+    W, b = als.W.copy(), als.b.copy()
+    with measure("update_W_and_b", nnz, results):
+        als.update_W_and_b(mu, 20.0)
+    if loops:
+        with measure("update_W_and_b_loops", nnz, results):
+            update_W_and_b(
+                W, als.U, b, als.c, mu, len(W), K, 20.0, user2movie, usermovie2rating
+            )
+        logger.info(f"Loops - vectorized max difference: {np.abs(W - als.W).max():.3g}")
+    del W, b, user2movie, usermovie2rating
+    with measure("update_U_and_c", nnz, results):
+        als.update_U_and_c(mu, 20.0)
+    with measure("get_metrics", nnz, results):
+        get_metrics(
+            store.train_rows, store.user_indices, store.user_data, als.W, als.U, als.b, als.c, mu
+        )
+    return [r for r in results if r.name in stages]
@@ -0,0 +1,108 @@
+import torch
+
+from modeling.bench.measure import measure
+from modeling.llm.torch__model import Llama
+
+
+def run_decode(
+    contexts: list[int],
+    steps: int = 64,
+    num_layers: int = 12,
+    vocab_size: int = 8192,
+    dims: int = 512,
+    mlp_dims: int = 1024,
+    num_heads: int = 8,
+    rope_calls: int = 2000,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Per step latency of the torch `Llama.decode` after random prompts of every
+    context length, and of the RoPE of the queries of one token at that offset.
+
+    Every run has the `rope` (`rope_calls` calls) and `decode` (`steps` steps)
+    `Measurement`s, their rows/s being calls/s and tokens/s, and the latencies
+    in µs and ms.
+    """
+    torch.manual_seed(seed)
+    model = Llama(num_layers, vocab_size, dims, mlp_dims, num_heads).eval()
+    rope = model.layers[0].attention.rope
+    queries = torch.randn(1, num_heads, 1, dims // num_heads)
+    runs = []
+    with torch.inference_mode():
+        for context in contexts:
+            cache = model.make_cache()
+            model.prefill(torch.randint(0, vocab_size, (1, context)), cache)
+            y = torch.randint(0, vocab_size, (1,))
+            # warm up the RoPE tables and the allocator
+            for _ in range(4):
+                rope(queries, cache[0].offset)
+                model.decode(y, cache)
+            results = []
+            with measure(f"rope@{context}", rope_calls, results) as rope_run:
+                for _ in range(rope_calls):
+                    rope(queries, cache[0].offset)
+            with measure(f"decode@{context}", steps, results) as decode_run:
+                for _ in range(steps):
+                    y = model.decode(y, cache).argmax(dim=-1)
+            runs.append(
+                {
+                    "context": context,
+                    "rope_us": rope_run.seconds / rope_calls * 1e6,
+                    "decode_step_ms": decode_run.seconds / steps * 1e3,
+                    "threads": torch.get_num_threads(),
+                    "stages": results,
+                }
+            )
+    return runs
+
+
+def run_prefill(
+    contexts: list[int],
+    attentions: tuple = ("eager", "sdpa", "chunked"),
+    num_layers: int = 2,
+    vocab_size: int = 8192,
+    dims: int = 256,
+    mlp_dims: int = 512,
+    num_heads: int = 4,
+    block_size: int = 256,
+    eager_max_context: int = 8192,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Time the prefill of random prompts of every context length in a single
+    chunk with every attention implementation of the torch `Llama`, sharing
+    the same weights. The eager attention is skipped past
+    `eager_max_context` tokens, its (num_heads, L, L) scores wouldn't fit in
+    memory.
+
+    Every run has one `Measurement`, its rows/s being the prompt tokens/s
+    and its peak RSS the memory of the prefill.
+    """
+    torch.manual_seed(seed)
+    models = {}
+    for attention in attentions:
+        models[attention] = Llama(
+            num_layers, vocab_size, dims, mlp_dims, num_heads, attention, block_size
+        ).eval()
+        models[attention].load_state_dict(models[attentions[0]].state_dict())
+    runs = []
+    with torch.inference_mode():
+        for context in contexts:
+            prompt = torch.randint(0, vocab_size, (1, context))
+            for attention, model in models.items():
+                if attention == "eager" and context > eager_max_context:
+                    continue
+                cache = model.make_cache()
+                results = []
+                with measure(f"{attention}@{context}", context, results):
+                    model.prefill(prompt, cache, prefill_step=context)
+                del cache
+                runs.append(
+                    {
+                        "context": context,
+                        "attention": attention,
+                        "threads": torch.get_num_threads(),
+                        "stages": results,
+                    }
+                )
+    return runs
@@ -12,8 +12,8 @@ class ColorFormatter(logging.Formatter):
     bold_red = "\x1b[31;1m"
     reset = "\x1b[0m"
 
-    def __init__(self, fmt):
-        super().__init__()
+    def __init__(self, fmt, datefmt="%Y-%m-%d %H:%M:%S"):
+        super().__init__(fmt, datefmt=datefmt)
         self.fmt = fmt
         self.FORMATS = {
             logging.DEBUG: self.grey + self.fmt + self.reset,
@@ -22,8 +22,15 @@ class ColorFormatter(logging.Formatter):
             logging.ERROR: self.red + self.fmt + self.reset,
             logging.CRITICAL: self.bold_red + self.fmt + self.reset,
         }
+        # one formatter per level built once, not one per record
+        self.formatters = {
+            level: logging.Formatter(log_fmt, datefmt=datefmt)
+            for level, log_fmt in self.FORMATS.items()
+        }
 
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt, datefmt="%Y-%m-%d %H:%M:%S")
+        formatter = self.formatters.get(record.levelno)
+        if formatter is None:
+            # custom levels aren't colored
+            return super().format(record)
         return formatter.format(record)
@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+import functools
+import tracemalloc
+from pathlib import Path
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Event:
+    """One finished span, times in seconds and memory in MB"""
+
+    name: str
+    start: float
+    wall: float
+    cpu: float
+    peak_traced_mb: float
+    peak_rss_mb: float
+    tid: int
+    args: dict = field(default_factory=dict)
+
+
+class Profiler:
+    """
+    Records the spans opened with `span` once `enable` was called. Nested spans
+    share the process wide tracemalloc / RSS peaks: a span resets them when it
+    starts and hands the peak reached so far to its parent, so every span
+    reports the peak above the memory in use when it started.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events: list[Event] = []
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self, trace_memory: bool = True):
+        """Record the spans from now on, `trace_memory` starts tracemalloc"""
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.origin = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @property
+    def stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def record(self, event: Event):
+        with self._lock:
+            self.events.append(event)
+
+    def trace(self) -> dict:
+        """Chrome trace (chrome://tracing, Perfetto) of the recorded spans"""
+        pid = os.getpid()
+        events = [
+            {
+                "name": e.name,
+                "ph": "X",
+                "ts": round(e.start * 1e6, 3),
+                "dur": round(e.wall * 1e6, 3),
+                "pid": pid,
+                "tid": e.tid,
+                "args": {
+                    "cpu_ms": round(e.cpu * 1e3, 3),
+                    "peak_traced_mb": round(e.peak_traced_mb, 3),
+                    "peak_rss_mb": round(e.peak_rss_mb, 3),
+                    **e.args,
+                },
+            }
+            for e in self.events
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path: Path):
+        """Write the Chrome trace of the recorded spans to `path`"""
+        Path(path).write_text(json.dumps(self.trace()) + "\n")
+
+    def summary(self) -> str:
+        """Fixed width table of the spans by name, in the order they first ended"""
+        totals = {}
+        for e in self.events:
+            count, wall, cpu, traced, rss = totals.get(e.name, (0, 0.0, 0.0, 0.0, 0.0))
+            totals[e.name] = (
+                count + 1,
+                wall + e.wall,
+                cpu + e.cpu,
+                max(traced, e.peak_traced_mb),
+                max(rss, e.peak_rss_mb),
+            )
+        lines = [
+            f"{'span':<32}{'calls':>7}{'wall s':>10}{'cpu s':>10}"
+            f"{'traced MB':>12}{'RSS MB':>10}"
+        ]
+        for name, (count, wall, cpu, traced, rss) in totals.items():
+            lines.append(
+                f"{name:<32}{count:>7}{wall:>10.3f}{cpu:>10.3f}{traced:>12,.1f}{rss:>10,.1f}"
+            )
+        return "\n".join(lines)
+
+
+profiler = Profiler()
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak RSS of the process (Linux >= 4.0), False when it can't be reset"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS since the last `reset_peak_rss`, or since the process started"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024
+
+
+class span:
+    """
+    Named span of the profiler, as a context manager or a decorator:
+
+        with span("train.epoch", epoch=epoch):
+            ...
+
+        @span("preprocess.basic_transform")
+        def basic_transform(df): ...
+
+    A disabled profiler costs an attribute lookup per span. An enabled one
+    records the wall time, the CPU time of the process, and the peaks of the
+    tracemalloc traced memory and of the RSS above what was in use when the
+    span started. Keyword arguments end up in the args of the trace event.
+    """
+
+    __slots__ = ("name", "args", "active", "t0", "cpu0", "traced0", "rss0", "peaks")
+
+    def __init__(self, name: str, **args):
+        self.name = name
+        self.args = args
+        self.active = False
+
+    def __enter__(self):
+        if not profiler.enabled:
+            return self
+        stack = profiler.stack
+        traced, traced_peak = _traced_memory()
+        rss = peak_rss_mb()
+        if stack:
+            # the parent keeps the peaks it reached before they're reset
+            parent = stack[-1]
+            parent.peaks = (max(parent.peaks[0], traced_peak), max(parent.peaks[1], rss))
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        reset_peak_rss()
+        self.active = True
+        self.traced0, self.rss0 = traced, peak_rss_mb()
+        self.peaks = (traced, self.rss0)
+        stack.append(self)
+        self.cpu0 = time.process_time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if not self.active:
+            return False
+        wall = time.perf_counter() - self.t0
+        cpu = time.process_time() - self.cpu0
+        self.active = False
+        stack = profiler.stack
+        stack.pop()
+        traced_peak = max(self.peaks[0], _traced_memory()[1])
+        rss_peak = max(self.peaks[1], peak_rss_mb())
+        if stack:
+            parent = stack[-1]
+            parent.peaks = (max(parent.peaks[0], traced_peak), max(parent.peaks[1], rss_peak))
+        profiler.record(
+            Event(
+                self.name,
+                self.t0 - profiler.origin,
+                wall,
+                cpu,
+                (traced_peak - self.traced0) / 2**20,
+                rss_peak - self.rss0,
+                threading.get_ident(),
+                self.args,
+            )
+        )
+        return False
+
+    def __call__(self, func):
+        name, args = self.name, self.args
+
+        @functools.wraps(func)
+        def wrapper(*a, **kw):
+            if not profiler.enabled:
+                return func(*a, **kw)
+            with span(name, **args):
+                return func(*a, **kw)
+
+        return wrapper
+
+
+def _traced_memory() -> tuple[int, int]:
+    return tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
@@ -1,6 +1,10 @@
 import os
+import queue
+import atexit
 import logging
+import logging.handlers
 from enum import Enum
+from functools import cached_property
 from dotenv import load_dotenv
 from dataclasses import dataclass
 from modeling.config.formatter import ColorFormatter
@@ -15,9 +19,19 @@ class LogLevel(str, Enum):
 
 
 class Logger(logging.Logger):
-    def __init__(self, level=logging.NOTSET):
+    """
+    Colored logger of the package, a single instance shared through
+    `settings.logger`. Prefer lazy arguments in loops,
+    `logger.info("epoch:%s", epoch)` is only formatted when it's emitted.
+    """
+
+    def __init__(self, level=logging.NOTSET, use_queue: bool = False):
         super().__init__("", level)
+        self.listener = None
         self._setup_handlers()
+        if use_queue:
+            self.start_queue()
+        os.register_at_fork(after_in_child=self._after_fork)
 
     def _setup_handlers(self):
         fmt = "%(asctime)s | %(levelname)8s| %(message)s"
@@ -27,6 +41,53 @@ class Logger(logging.Logger):
         stdout_handler.setFormatter(color_formatter)
         self.addHandler(stdout_handler)
 
+    def setLevel(self, level):
+        super().setLevel(level)
+        # the logger isn't registered with logging.getLogger, so the logging
+        # manager doesn't clear its isEnabledFor cache
+        self._cache.clear()
+
+    def start_queue(self):
+        """
+        Hand the records to a `QueueListener` thread that formats and writes
+        them, the logging calls only enqueue them and never block on the terminal
+        """
+        if self.listener is not None:
+            return
+        records = queue.SimpleQueue()
+        handlers = self.handlers[:]
+        for handler in handlers:
+            self.removeHandler(handler)
+        self.addHandler(logging.handlers.QueueHandler(records))
+        self.listener = logging.handlers.QueueListener(
+            records, *handlers, respect_handler_level=True
+        )
+        self.listener.start()
+        atexit.register(self.stop_queue)
+
+    def stop_queue(self):
+        """Write the queued records and go back to writing them in the caller"""
+        if self.listener is None:
+            return
+        self.listener.stop()
+        for handler in self.handlers[:]:
+            self.removeHandler(handler)
+        for handler in self.listener.handlers:
+            self.addHandler(handler)
+        self.listener = None
+        atexit.unregister(self.stop_queue)
+
+    def _after_fork(self):
+        # the listener thread isn't forked, the child writes its own records
+        if self.listener is None:
+            return
+        for handler in self.handlers[:]:
+            self.removeHandler(handler)
+        for handler in self.listener.handlers:
+            self.addHandler(handler)
+        self.listener = None
+        atexit.unregister(self.stop_queue)
+
 
 @dataclass
 class DocSettings:
@@ -64,7 +125,9 @@ class Settings:
         )
         # set Log level using string value
         self.LOG_LEVEL = LogLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        # write the logs from a background thread
+        self.LOG_QUEUE = os.getenv("LOG_QUEUE", "false").lower() in ("1", "true", "yes")
 
-    @property
+    @cached_property
     def logger(self):
-        return Logger(level=self.LOG_LEVEL.value)
+        return Logger(level=self.LOG_LEVEL.value, use_queue=self.LOG_QUEUE)
@@ -1,6 +1,4 @@
 from click import command, option, group
-from .conv_1d_example import conv_1d_example
-from .conv_2d_example import conv_2d_example
 
 
 @group("convolution")
@@ -12,12 +10,16 @@ def cli():
 @cli.command()
 def conv_1d():
     """Run a 1D convolution example"""
+    from modeling.convolution.conv_1d_example import conv_1d_example
+
     conv_1d_example()
 
 
 @cli.command()
 def conv_2d():
     """Run a 2D convolution example"""
+    from modeling.convolution.conv_2d_example import conv_2d_example
+
     conv_2d_example()
 
 
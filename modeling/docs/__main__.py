@@ -1,7 +1,6 @@
 import os
 import time
 import click
-import requests
 import subprocess
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
@@ -104,6 +103,8 @@ class DocumentationBuilder(SphinxFileChangeHandler, HttpServer):
         logger.warning(filename)
         if not os.path.exists(filename):
             os.makedirs(self.dependencies_dir, exist_ok=True)
+            import requests
+
             response = requests.get(self.plantuml_jar_file)
             if response.status_code == 200:
                 with open(filename, "wb") as f:
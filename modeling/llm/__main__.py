@@ -1,6 +1,5 @@
-import mlx.core as mx
-from click import group
-from modeling.llm.mlx__model import Llama
+from click import Choice, ClickException, echo, group, option
+from modeling.config.profiler import span
 
 
 @group("llm")
@@ -10,25 +9,129 @@ def cli():
 
 
 @cli.command()
-def generate():
+@option("--batch-size", default=1, help="Number of prompts generated at once")
+@option("--max-tokens", default=10, help="Tokens generated per prompt")
+@option(
+    "--backend",
+    type=Choice(["mlx", "torch"]),
+    default="mlx",
+    help="MLX or PyTorch implementation of the model",
+)
+@option(
+    "--attention",
+    type=Choice(["eager", "sdpa", "chunked"]),
+    default="sdpa",
+    help="Attention implementation of the PyTorch model",
+)
+def generate(batch_size: int, max_tokens: int, backend: str, attention: str):
     """generate example"""
+    if backend == "torch":
+        generate_torch(batch_size, max_tokens, attention)
+        return
+    import mlx.core as mx
+    from modeling.llm.mlx__model import Llama
+
     model = Llama(num_layers=12, vocab_size=8192, dims=512, mlp_dims=1024, num_heads=8)
     # Since MLX is lazily evaluated nothing has actually been materialized yet.
     # We could have set the `dims` to 20_000 on a machine with 8GB of RAM and the
     # code above would still run. Let's actually materialize the model.
-    mx.eval(model.parameters())
+    with span("generate.init_model"):
+        mx.eval(model.parameters())
     prompt = mx.array(
         [[1, 10, 8, 32, 44, 7]]
     )  # <-- Note the double brackets because we
     #     have a batch dimension even
     #     though it is 1 in this case
-    generated = [t for i, t in zip(range(10), model.generate(prompt, 0.8))]
+    if batch_size > 1:
+        # Prompts of different lengths are left padded into one batch, the
+        # completions come out as the sequences finish
+        lengths = mx.random.randint(1, 17, (batch_size - 1,)).tolist()
+        prompts = [prompt[0].tolist()] + [
+            mx.random.randint(0, 8192, (n,)).tolist() for n in lengths
+        ]
+        with span("generate.batch", batch_size=batch_size):
+            for i, tokens in model.generate_batch(prompts, 0.8, max_tokens):
+                print(i, tokens)
+        return
+    with span("generate.build_graph"):
+        generated = [t for i, t in zip(range(max_tokens), model.generate(prompt, 0.8))]
     # Since we haven't evaluated anything, nothing is computed yet. The list
     # `generated` contains the arrays that hold the computation graph for the
-    # full processing of the prompt and the generation of 10 tokens.
+    # full processing of the prompt and the generation of max_tokens tokens.
     #
     # We can evaluate them one at a time, or all together. Concatenate them or
     # print them. They would all result in very similar runtimes and give exactly
     # the same results.
-    mx.eval(generated)
+    with span("generate.tokens", tokens=len(generated)):
+        mx.eval(generated)
+    print(generated)
+
+
+def generate_torch(batch_size: int, max_tokens: int, attention: str = "sdpa"):
+    """The generate example with the PyTorch model, computed eagerly token by token"""
+    import torch
+    from modeling.llm.torch__model import Llama
+
+    with span("generate.init_model"):
+        model = Llama(
+            num_layers=12,
+            vocab_size=8192,
+            dims=512,
+            mlp_dims=1024,
+            num_heads=8,
+            attention=attention,
+        )
+        model.eval()
+    prompt = [1, 10, 8, 32, 44, 7]
+    if batch_size > 1:
+        lengths = torch.randint(1, 17, (batch_size - 1,)).tolist()
+        prompts = [prompt] + [torch.randint(0, 8192, (n,)).tolist() for n in lengths]
+        with span("generate.batch", batch_size=batch_size):
+            for i, tokens in model.generate_batch(prompts, 0.8, max_tokens):
+                print(i, tokens)
+        return
+    with span("generate.tokens", tokens=max_tokens):
+        generator = model.generate(torch.tensor([prompt]), 0.8)
+        generated = [t for i, t in zip(range(max_tokens), generator)]
     print(generated)
+
+
+@cli.command()
+@option("--layers", default=2, help="Number of layers of the models")
+@option("--dims", default=128, help="Model dimensions")
+@option("--heads", default=4, help="Number of attention heads")
+@option("--seed", default=0, help="Seed of the shared weights and tokens")
+@option("--tolerance", default=1e-4, help="Largest difference relative to the largest logit")
+def parity(layers: int, dims: int, heads: int, seed: int, tolerance: float):
+    """
+    Compare the logits of the MLX and PyTorch models sharing their weights,
+    for every attention implementation of the PyTorch model, and those of
+    the fused and chunked attentions with the eager one
+    """
+    from modeling.llm.parity import attention_difference, logits_difference
+    from modeling.llm.torch__attention import ATTENTION
+
+    failed = []
+    for attention in ATTENTION:
+        diff = logits_difference(
+            layers, dims=dims, mlp_dims=2 * dims, num_heads=heads, seed=seed, attention=attention
+        )
+        echo(
+            f"{attention}: max |mlx - torch| forward: {diff['forward']:.3g} "
+            f"cached: {diff['cached']:.3g} (largest logit {diff['max_logit']:.3g})"
+        )
+        if max(diff["forward"], diff["cached"]) > tolerance * diff["max_logit"]:
+            failed.append(f"mlx/{attention}")
+        if attention == "eager":
+            continue
+        diff = attention_difference(
+            attention, layers, dims=dims, mlp_dims=2 * dims, num_heads=heads, seed=seed
+        )
+        echo(
+            f"{attention}: max |eager - {attention}| forward: {diff['forward']:.3g} "
+            f"cached: {diff['cached']:.3g} batch: {diff['batch']:.3g}"
+        )
+        if max(diff["forward"], diff["cached"], diff["batch"]) > tolerance * diff["max_logit"]:
+            failed.append(f"eager/{attention}")
+    if failed:
+        raise ClickException(f"The logits differ: {', '.join(failed)}")
@@ -29,13 +29,11 @@ class LlamaAttention(nn.Module):
         keys = keys.reshape(B, L, num_heads, -1).transpose(0, 2, 1, 3)
         values = values.reshape(B, L, num_heads, -1).transpose(0, 2, 1, 3)
 
-        # Add RoPE to the queries and keys and combine them with the cache
+        # Add RoPE to the queries and keys and write them into the cache
         if cache is not None:
-            key_cache, value_cache = cache
-            queries = self.rope(queries, offset=key_cache.shape[2])
-            keys = self.rope(keys, offset=key_cache.shape[2])
-            keys = mx.concatenate([key_cache, keys], axis=2)
-            values = mx.concatenate([value_cache, values], axis=2)
+            queries = self.rope(queries, offset=cache.positions)
+            keys = self.rope(keys, offset=cache.positions)
+            keys, values = cache.update_and_fetch(keys, values)
         else:
             queries = self.rope(queries)
             keys = self.rope(keys)
@@ -48,5 +46,4 @@ class LlamaAttention(nn.Module):
         scores = mx.softmax(scores, axis=-1)
         values_hat = (scores @ values).transpose(0, 2, 1, 3).reshape(B, L, -1)
 
-        # Note that we return the keys and values to possibly be used as a cache
-        return self.out_proj(values_hat), (keys, values)
+        return self.out_proj(values_hat), cache
@@ -0,0 +1,139 @@
+import mlx.core as mx
+
+
+class KVCache:
+    """
+    Keys and values of one attention layer, written into buffers that grow
+    `step` positions at a time instead of being concatenated at every token.
+
+    The buffers are (B, num_heads, capacity, head_dims) and the first `offset`
+    positions are in use. `update_and_fetch` writes the new keys and values
+    with a slice assignment, which MLX does in place when nothing else
+    references the buffer, so generating T tokens copies O(T) memory instead
+    of O(T^2). A buffer too small for the new positions is grown by whole
+    steps, the only time it's copied.
+    """
+
+    def __init__(self, step: int = 256):
+        self.step = step
+        self.keys = None
+        self.values = None
+        self.offset = 0
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self.keys is None else self.keys.shape[2]
+
+    @property
+    def positions(self):
+        """RoPE position of the next token, the same for every sequence"""
+        return self.offset
+
+    def _grow(self, keys: mx.array, values: mx.array):
+        B, H, L, _ = keys.shape
+        steps = (self.offset + L - self.capacity + self.step - 1) // self.step
+        new_keys = mx.zeros((B, H, steps * self.step, keys.shape[-1]), keys.dtype)
+        new_values = mx.zeros((B, H, steps * self.step, values.shape[-1]), values.dtype)
+        if self.keys is None:
+            self.keys, self.values = new_keys, new_values
+        else:
+            self.keys = mx.concatenate([self.keys, new_keys], axis=2)
+            self.values = mx.concatenate([self.values, new_values], axis=2)
+
+    def update_and_fetch(self, keys: mx.array, values: mx.array) -> tuple[mx.array, mx.array]:
+        """
+        Append the (B, num_heads, L, head_dims) keys and values, returns the
+        keys and values of all the positions so far
+        """
+        if self.offset + keys.shape[2] > self.capacity:
+            self._grow(keys, values)
+        start, self.offset = self.offset, self.offset + keys.shape[2]
+        self.keys[..., start : self.offset, :] = keys
+        self.values[..., start : self.offset, :] = values
+        return self.keys[..., : self.offset, :], self.values[..., : self.offset, :]
+
+    def filter(self, rows: mx.array):
+        """Keep the `rows` sequences of the batch"""
+        if self.keys is not None:
+            self.keys, self.values = self.keys[rows], self.values[rows]
+
+    def nbytes(self) -> int:
+        """Bytes of the allocated buffers"""
+        return 0 if self.keys is None else self.keys.nbytes + self.values.nbytes
+
+
+class BatchKVCache(KVCache):
+    """
+    `KVCache` of sequences of different lengths that join and leave the batch.
+
+    The sequences are right aligned, their next tokens are all written at
+    `offset`, and the first padding[b] positions of row b are padding to mask
+    out of the attention. The tokens of a row keep their own RoPE positions,
+    0 for its first token, whatever the padding, so a sequence that joins
+    the batch (`extend`) or has its padding trimmed (`filter`) sees the same
+    attention scores as if it were alone.
+    """
+
+    def __init__(self, step: int = 256):
+        super().__init__(step)
+        self.padding = mx.zeros((0,), dtype=mx.int32)
+
+    @property
+    def batch_size(self) -> int:
+        return len(self.padding)
+
+    @property
+    def positions(self):
+        """(B,) RoPE positions of the next tokens, 0 for an empty cache"""
+        return self.offset if self.keys is None else self.offset - self.padding
+
+    def update_and_fetch(self, keys: mx.array, values: mx.array) -> tuple[mx.array, mx.array]:
+        if self.keys is None:
+            self.padding = mx.zeros((keys.shape[0],), dtype=mx.int32)
+        return super().update_and_fetch(keys, values)
+
+    def _pad_left(self, n: int):
+        """Shift the positions in use `n` positions to the right"""
+        keys, values = self.keys[..., : self.offset, :], self.values[..., : self.offset, :]
+        if n:
+            B, H, _, D = keys.shape
+            keys = mx.concatenate([mx.zeros((B, H, n, D), keys.dtype), keys], axis=2)
+            values = mx.concatenate(
+                [mx.zeros((B, H, n, values.shape[-1]), values.dtype), values], axis=2
+            )
+        self.keys, self.values = keys, values
+        self.offset += n
+        self.padding = self.padding + n
+
+    def extend(self, other: "BatchKVCache"):
+        """Add the sequences of `other` to the batch, both right aligned at the longer offset"""
+        if other.keys is None:
+            return
+        if self.keys is None:
+            self.keys, self.values = other.keys, other.values
+            self.offset, self.padding = other.offset, other.padding
+            return
+        offset = max(self.offset, other.offset)
+        self._pad_left(offset - self.offset)
+        other._pad_left(offset - other.offset)
+        self.keys = mx.concatenate([self.keys, other.keys])
+        self.values = mx.concatenate([self.values, other.values])
+        self.padding = mx.concatenate([self.padding, other.padding])
+
+    def filter(self, rows: mx.array):
+        """Keep the `rows` sequences and drop the positions that are padding in all of them"""
+        if self.keys is None:
+            return
+        if not rows.size:
+            self.keys = self.values = None
+            self.offset = 0
+            self.padding = mx.zeros((0,), dtype=mx.int32)
+            return
+        super().filter(rows)
+        self.padding = self.padding[rows]
+        trim = min(self.padding.tolist())
+        if trim:
+            self.keys = self.keys[..., trim:, :]
+            self.values = self.values[..., trim:, :]
+            self.offset -= trim
+            self.padding = self.padding - trim
@@ -1,9 +1,32 @@
 import mlx.core as mx
 import mlx.nn as nn
 
+from modeling.llm.mlx__cache import BatchKVCache, KVCache
 from modeling.llm.mlx__encoder import LlamaEncoderLayer
 
 
+def causal_mask(L: int, offset: int = 0, dtype=mx.float32, padding: mx.array = None) -> mx.array:
+    """
+    Additive (L, offset + L) mask of L queries at positions offset..offset + L - 1,
+    each attending to the positions up to its own. With the (B,) `padding`
+    lengths of left padded sequences the mask is (B, 1, L, offset + L) and also
+    hides the padding positions of every sequence.
+    """
+    rows = mx.arange(offset, offset + L)[:, None]
+    cols = mx.arange(offset + L)[None]
+    mask = cols > rows
+    if padding is not None:
+        mask = (mask[None] | (cols[None] < padding[:, None, None]))[:, None]
+    return mask.astype(dtype) * -1e9
+
+
+def sample(logits: mx.array, temp: float) -> mx.array:
+    """Sample the (B,) next tokens from the (B, vocab_size) logits, greedily when temp is 0"""
+    if temp == 0:
+        return mx.argmax(logits, axis=-1)
+    return mx.random.categorical(logits * (1 / temp))
+
+
 class Llama(nn.Module):
     def __init__(
         self, num_layers: int, vocab_size: int, dims: int, mlp_dims: int, num_heads: int
@@ -27,24 +50,67 @@ class Llama(nn.Module):
         x = self.norm(x)
         return self.out_proj(x)
 
-    def generate(self, x, temp=1.0):
-        cache = []
+    def make_cache(self, step: int = 256, batched: bool = False) -> list[KVCache]:
+        """One `KVCache` per layer, `BatchKVCache`s for sequences joining and leaving"""
+        return [(BatchKVCache if batched else KVCache)(step) for _ in self.layers]
 
-        # Make an additive causal mask. We will need that to process the prompt.
-        mask = nn.MultiHeadAttention.create_additive_causal_mask(x.shape[1])
-        mask = mask.astype(self.embedding.weight.dtype)
+    def prefill(
+        self,
+        x: mx.array,
+        cache: list[KVCache],
+        prefill_step: int = 512,
+        padding: mx.array = None,
+    ) -> mx.array:
+        """
+        Write the keys and values of the (B, L) prompt `x` into `cache`, returns
+        the (B, vocab_size) logits of its last position. Long prompts go through
+        in chunks of `prefill_step`, each chunk's queries see the cached positions
+        and the causal part of the chunk itself, not the `padding` (B,) first
+        positions of every sequence.
+        """
+        for start in range(0, x.shape[1], prefill_step):
+            chunk = x[:, start : start + prefill_step]
+            mask = causal_mask(
+                chunk.shape[1], cache[0].offset, self.embedding.weight.dtype, padding
+            )
+            h = self.embedding(chunk)
+            for l, c in zip(self.layers, cache):
+                h, _ = l(h, mask=mask, cache=c)
+            if start + prefill_step < x.shape[1]:
+                # materialize the cache, the graphs of the chunks add up otherwise
+                mx.eval([(c.keys, c.values) for c in cache])
+        return self.out_proj(self.norm(h[:, -1]))
 
-        # First we process the prompt x the same way as in __call__ but
-        # save the caches in cache
-        x = self.embedding(x)
-        for l in self.layers:
-            x, c = l(x, mask=mask)
-            cache.append(c)  # <--- we store the per layer cache in a
-            #      simple python list
+    def decode(self, y: mx.array, cache: list[KVCache], mask: mx.array = None) -> mx.array:
+        """Logits (B, vocab_size) after the (B,) tokens `y`, written into `cache`"""
+        # Unsqueezing the last dimension to add a sequence length
+        # dimension of 1
+        x = self.embedding(y[:, None])
+        for l, c in zip(self.layers, cache):
+            # The keys and values of the new token are written in place
+            # into the preallocated cache buffers, no copy of the cache
+            x, _ = l(x, mask=mask, cache=c)
         x = self.norm(x)
-        y = self.out_proj(x[:, -1])  # <--- we only care about the last logits
-        #      that generate the next token
-        y = mx.random.categorical(y * (1 / temp))
+        return self.out_proj(x[:, -1])
+
+    def generate(self, x, temp=1.0, cache: list[KVCache] = None, prefill_step: int = 512):
+        """
+        Yield the tokens sampled after the prompt `x`, one (B,) array at a time.
+
+        Args:
+          - x (mx.array): (B, L) prompt tokens
+          - temp (float): sampling temperature, greedy decoding when 0
+          - cache (list[KVCache]): per layer caches to reuse (`make_cache`), the
+            prompt continues what they hold, new ones by default
+          - prefill_step (int): prompt tokens processed at once, bounds the
+            (prefill_step, L) attention scores of long prompts
+        """
+        cache = self.make_cache() if cache is None else cache
+
+        # First we process the prompt x the same way as in __call__ but
+        # write the keys and values of every layer in its cache, we only
+        # care about the last logits that generate the next token
+        y = sample(self.prefill(x, cache, prefill_step), temp)
 
         # y now has size [1]
         # Since MLX is lazily evaluated nothing is computed yet.
@@ -57,18 +123,60 @@ class Llama(nn.Module):
         # need to feed it back into the model and loop to generate the
         # rest.
         while True:
-            # Unsqueezing the last dimension to add a sequence length
-            # dimension of 1
-            x = y[:, None]
-
-            x = self.embedding(x)
-            for i in range(len(cache)):
-                # We are overwriting the arrays in the cache list. When
-                # the computation will happen, MLX will be discarding the
-                # old cache the moment it is not needed anymore.
-                x, cache[i] = self.layers[i](x, mask=None, cache=cache[i])
-            x = self.norm(x)
-            y = self.out_proj(x[:, -1])
-            y = mx.random.categorical(y * (1 / temp))
+            y = sample(self.decode(y, cache), temp)
 
             yield y
+
+    def generate_batch(
+        self,
+        prompts: list[list[int]],
+        temp: float = 1.0,
+        max_tokens: int = 256,
+        stop_tokens: tuple = (),
+        prefill_step: int = 512,
+    ):
+        """
+        Generate the completions of prompts of different lengths in one batch,
+        yield (index of the prompt, generated tokens) as the sequences finish.
+
+        Args:
+          - prompts (list[list[int]]): prompt tokens
+          - temp (float): sampling temperature, greedy decoding when 0
+          - max_tokens (int): a sequence finishes after max_tokens tokens
+          - stop_tokens (tuple): a sequence finishes after generating one of them,
+            included in its tokens
+          - prefill_step (int): prompt tokens processed at once
+
+        The prompts are left padded to the longest one, so every sequence's
+        next token is at the same cache offset, and the padding positions are
+        masked out of every attention. Left padding shifts the positions of a
+        sequence by its padding length, which RoPE doesn't see since the
+        attention scores only depend on the distance between the positions.
+        Finished sequences are dropped from the batch and the caches.
+        """
+        L = max(len(p) for p in prompts)
+        padding = mx.array([L - len(p) for p in prompts])
+        x = mx.array([[0] * (L - len(p)) + list(p) for p in prompts])
+        cache = self.make_cache()
+        y = sample(self.prefill(x, cache, prefill_step, padding), temp)
+        stop_tokens = set(stop_tokens)
+        active = list(range(len(prompts)))
+        tokens = [[] for _ in prompts]
+        while True:
+            keep = []
+            for row, (i, token) in enumerate(zip(active, y.tolist())):
+                tokens[i].append(token)
+                if token in stop_tokens or len(tokens[i]) >= max_tokens:
+                    yield i, tokens[i]
+                else:
+                    keep.append(row)
+            if not keep:
+                return
+            if len(keep) < len(active):
+                rows = mx.array(keep)
+                for c in cache:
+                    c.filter(rows)
+                active = [active[row] for row in keep]
+                y, padding = y[rows], padding[rows]
+            mask = causal_mask(1, cache[0].offset, self.embedding.weight.dtype, padding)
+            y = sample(self.decode(y, cache, mask), temp)
@@ -0,0 +1,182 @@
+import time
+import asyncio
+import numpy as np
+import mlx.core as mx
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+from modeling.llm.mlx__model import Llama, causal_mask, sample
+
+
+@dataclass
+class Request:
+    """A prompt submitted to the `Scheduler`, its tokens and timings (perf_counter seconds)"""
+
+    prompt: list[int]
+    max_tokens: int
+    tokens: list[int] = field(default_factory=list)
+    stream: asyncio.Queue = field(default_factory=asyncio.Queue)
+    submitted: float = field(default_factory=time.perf_counter)
+    first_token: float = None
+    finished: float = None
+
+    @property
+    def ttft(self) -> float:
+        """Time to first token"""
+        return self.first_token - self.submitted
+
+    @property
+    def tokens_per_s(self) -> float:
+        """Decoding rate after the first token"""
+        elapsed = self.finished - self.first_token
+        return (len(self.tokens) - 1) / elapsed if elapsed > 0 else 0.0
+
+
+class Scheduler:
+    """
+    Continuous batching of the generations of a `Llama` model: one decode
+    batch keeps running, a submitted prompt joins it as soon as a slot is free
+    and leaves it at its stop token or max_tokens.
+
+        async with Scheduler(model, max_batch_size=16) as scheduler:
+            async for token in scheduler.submit([1, 10, 8, 32]):
+                ...
+
+    A joining prompt is prefilled alone into its own `BatchKVCache`s, which
+    are then merged into the batch caches (right aligned, left padded, every
+    row keeping its own RoPE positions). Finished rows are dropped from the
+    caches before the next decode step. The model runs on a single worker
+    thread, so the event loop keeps accepting submissions while it computes.
+    """
+
+    def __init__(
+        self,
+        model: Llama,
+        max_batch_size: int = 16,
+        temp: float = 1.0,
+        max_tokens: int = 256,
+        stop_tokens: tuple = (),
+        prefill_step: int = 512,
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.temp = temp
+        self.max_tokens = max_tokens
+        self.stop_tokens = set(stop_tokens)
+        self.prefill_step = prefill_step
+        self.pending: asyncio.Queue = asyncio.Queue()
+        self.running: list[Request] = []
+        self.finished: list[Request] = []
+        self.cache = model.make_cache(batched=True)
+        # last token of every running request, the input of the next decode step
+        self.y = None
+        self._wake = asyncio.Event()
+        self._executor = ThreadPoolExecutor(1)
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown()
+
+    async def submit(self, prompt: list[int], max_tokens: int = None):
+        """Async iterator of the tokens generated after `prompt`"""
+        request = Request(list(prompt), max_tokens or self.max_tokens)
+        self.pending.put_nowait(request)
+        self._wake.set()
+        while (token := await request.stream.get()) is not None:
+            if isinstance(token, Exception):
+                raise token
+            yield token
+
+    async def _run(self):
+        try:
+            await self._schedule()
+        except Exception as error:
+            # fail the requests instead of leaving them waiting
+            while not self.pending.empty():
+                self.running.append(self.pending.get_nowait())
+            for request in self.running:
+                request.stream.put_nowait(error)
+            raise
+
+    async def _schedule(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(self._executor, self._drop_finished)
+            if not self.running and self.pending.empty():
+                self._wake.clear()
+                await self._wake.wait()
+            while len(self.running) < self.max_batch_size and not self.pending.empty():
+                request = self.pending.get_nowait()
+                token = await loop.run_in_executor(self._executor, self._prefill, request)
+                self.running.append(request)
+                self._emit(request, token)
+            if any(r.finished is None for r in self.running):
+                tokens = await loop.run_in_executor(self._executor, self._decode)
+                for request, token in zip(self.running, tokens):
+                    # rows that finished at their first token wait for the next drop
+                    if request.finished is None:
+                        self._emit(request, token)
+
+    def _prefill(self, request: Request) -> int:
+        cache = self.model.make_cache(batched=True)
+        logits = self.model.prefill(mx.array([request.prompt]), cache, self.prefill_step)
+        y = sample(logits, self.temp)
+        mx.eval(y)
+        for c, new in zip(self.cache, cache):
+            c.extend(new)
+        self.y = y if self.y is None else mx.concatenate([self.y, y])
+        return y.item()
+
+    def _decode(self) -> list[int]:
+        c = self.cache[0]
+        mask = causal_mask(1, c.offset, self.model.embedding.weight.dtype, c.padding)
+        self.y = sample(self.model.decode(self.y, self.cache, mask), self.temp)
+        mx.eval(self.y)
+        return self.y.tolist()
+
+    def _emit(self, request: Request, token: int):
+        now = time.perf_counter()
+        if request.first_token is None:
+            request.first_token = now
+        request.tokens.append(token)
+        request.stream.put_nowait(token)
+        if token in self.stop_tokens or len(request.tokens) >= request.max_tokens:
+            request.finished = now
+            request.stream.put_nowait(None)
+            self.finished.append(request)
+
+    def _drop_finished(self):
+        keep = [row for row, r in enumerate(self.running) if r.finished is None]
+        if len(keep) == len(self.running):
+            return
+        rows = mx.array(keep, dtype=mx.int32)
+        for c in self.cache:
+            c.filter(rows)
+        self.running = [self.running[row] for row in keep]
+        self.y = self.y[rows] if keep else None
+
+    def stats(self) -> dict:
+        """Time to first token and tokens/s of the finished requests"""
+        if not self.finished:
+            return {"requests": 0}
+        ttft = np.array([r.ttft for r in self.finished])
+        tokens = sum(len(r.tokens) for r in self.finished)
+        elapsed = max(r.finished for r in self.finished) - min(r.submitted for r in self.finished)
+        return {
+            "requests": len(self.finished),
+            "tokens": tokens,
+            "tokens_per_s": tokens / elapsed if elapsed > 0 else 0.0,
+            "ttft_mean_s": float(ttft.mean()),
+            "ttft_p50_s": float(np.percentile(ttft, 50)),
+            "ttft_p95_s": float(np.percentile(ttft, 95)),
+            "request_tokens_per_s": float(np.mean([r.tokens_per_s for r in self.finished])),
+        }
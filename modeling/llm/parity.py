@@ -0,0 +1,115 @@
+import numpy as np
+import mlx.core as mx
+import torch
+from mlx.utils import tree_flatten
+
+from modeling.llm import mlx__model, torch__model
+
+
+def copy_mlx_weights(mlx_model: mlx__model.Llama, torch_model: torch__model.Llama):
+    """Load the parameters of the MLX model into the torch one, they share names and shapes"""
+    state = {
+        name: torch.from_numpy(np.array(value.astype(mx.float32)))
+        for name, value in tree_flatten(mlx_model.parameters())
+    }
+    torch_model.load_state_dict(state, strict=True)
+
+
+def logits_difference(
+    num_layers: int = 2,
+    vocab_size: int = 256,
+    dims: int = 128,
+    mlp_dims: int = 256,
+    num_heads: int = 4,
+    prompt_tokens: int = 24,
+    decode_tokens: int = 8,
+    seed: int = 0,
+    attention: str = "sdpa",
+    block_size: int = 8,
+) -> dict:
+    """
+    Largest absolute differences between the logits of the MLX and torch models
+    sharing the same random weights, on the full forward pass and through the KV
+    caches (the prompt in two prefill chunks, then one token at a time).
+    `attention` and `block_size` are those of the torch model, small blocks
+    for the chunked attention to go through several of them.
+
+    Returns:
+      dict: forward and cached differences and the largest logit magnitude
+    """
+    mx.random.seed(seed)
+    mlx_model = mlx__model.Llama(num_layers, vocab_size, dims, mlp_dims, num_heads)
+    mx.eval(mlx_model.parameters())
+    torch_model = torch__model.Llama(
+        num_layers, vocab_size, dims, mlp_dims, num_heads, attention, block_size
+    )
+    copy_mlx_weights(mlx_model, torch_model)
+    tokens = np.random.default_rng(seed).integers(
+        0, vocab_size, (1, prompt_tokens + decode_tokens)
+    )
+    expected = np.array(mlx_model(mx.array(tokens)))
+    with torch.inference_mode():
+        forward = torch_model(torch.from_numpy(tokens)).numpy()
+    # through the caches, every logit after the prompt
+    mlx_cache, torch_cache = mlx_model.make_cache(step=8), torch_model.make_cache(step=8)
+    step = max(prompt_tokens // 2, 1)
+    mlx_logits = [mlx_model.prefill(mx.array(tokens[:, :prompt_tokens]), mlx_cache, step)]
+    torch_logits = [torch_model.prefill(torch.from_numpy(tokens[:, :prompt_tokens]), torch_cache, step)]
+    for t in range(prompt_tokens, prompt_tokens + decode_tokens - 1):
+        mlx_logits.append(mlx_model.decode(mx.array(tokens[:, t]), mlx_cache))
+        torch_logits.append(torch_model.decode(torch.from_numpy(tokens[:, t]), torch_cache))
+    cached = np.abs(
+        np.stack([np.array(l) for l in mlx_logits]) - np.stack([l.numpy() for l in torch_logits])
+    )
+    return {
+        "forward": float(np.abs(expected - forward).max()),
+        "cached": float(cached.max()),
+        "max_logit": float(np.abs(expected).max()),
+    }
+
+
+def attention_difference(
+    attention: str,
+    num_layers: int = 2,
+    vocab_size: int = 256,
+    dims: int = 128,
+    mlp_dims: int = 256,
+    num_heads: int = 4,
+    prompt_tokens: int = 40,
+    block_size: int = 8,
+    seed: int = 0,
+) -> dict:
+    """
+    Largest absolute differences between the logits of the torch model with
+    the `attention` implementation and with the eager one, on the full
+    forward pass, through the KV caches (the prompt in three prefill chunks
+    of different lengths, then one token) and on a left padded batch of
+    prompts of different lengths
+    """
+    torch.manual_seed(seed)
+    eager = torch__model.Llama(num_layers, vocab_size, dims, mlp_dims, num_heads, "eager")
+    model = torch__model.Llama(
+        num_layers, vocab_size, dims, mlp_dims, num_heads, attention, block_size
+    )
+    model.load_state_dict(eager.state_dict())
+    tokens = torch.randint(0, vocab_size, (1, prompt_tokens + 1))
+    prompts = [tokens[0, :n].tolist() for n in (prompt_tokens, prompt_tokens // 2, 3)]
+    outputs = {}
+    for name, m in (("eager", eager), (attention, model)):
+        with torch.inference_mode():
+            forward = m(tokens)
+            cache = m.make_cache(step=8)
+            cached = [m.prefill(tokens[:, :prompt_tokens], cache, prompt_tokens // 3 + 1)]
+            cached.append(m.decode(tokens[:, prompt_tokens], cache))
+            L = max(len(p) for p in prompts)
+            padding = torch.tensor([L - len(p) for p in prompts])
+            x = torch.tensor([[0] * (L - len(p)) + p for p in prompts])
+            batch = m.prefill(x, m.make_cache(), L // 2 + 1, padding)
+        outputs[name] = forward, torch.stack(cached), batch
+    (forward, cached, batch), (forward_, cached_, batch_) = outputs.values()
+    return {
+        "forward": float((forward - forward_).abs().max()),
+        "cached": float((cached - cached_).abs().max()),
+        "batch": float((batch - batch_).abs().max()),
+        "max_logit": float(forward.abs().max()),
+    }
@@ -1,12 +1,113 @@
 import math
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+
+# implementations of the attention of `LlamaAttention`
+ATTENTION = ("eager", "sdpa", "chunked")
+
+
+def causal_block(rows: int, cols: int, start: int, dtype, device=None) -> torch.Tensor:
+    """
+    Additive (rows, cols) mask of the queries at positions start..start + rows - 1
+    attending to the keys at positions 0..cols - 1 up to their own
+    """
+    return torch.full((rows, cols), -1e9, dtype=dtype, device=device).triu(start + 1)
+
+
+def eager_attention(queries, keys, values, scale: float, mask=None) -> torch.Tensor:
+    """Softmax of the whole (B, H, L, S) scores matrix, then its product with the values"""
+    if isinstance(mask, str):
+        L, S = queries.shape[-2], keys.shape[-2]
+        mask = causal_block(L, S, S - L, queries.dtype, queries.device)
+    scores = torch.matmul(queries * scale, keys.transpose(-2, -1))
+    if mask is not None:
+        scores = scores + mask
+    return torch.matmul(torch.softmax(scores, dim=-1), values)
+
+
+def sdpa_attention(queries, keys, values, scale: float, mask=None) -> torch.Tensor:
+    """
+    `torch.nn.functional.scaled_dot_product_attention`, which picks a fused
+    kernel. The causal mask of a prompt attending only to itself is the
+    `is_causal` flag instead of a tensor, a single token needs no mask.
+    """
+    is_causal = False
+    if isinstance(mask, str):
+        L, S = queries.shape[-2], keys.shape[-2]
+        if L == S:
+            mask, is_causal = None, True
+        elif L == 1:
+            mask = None
+        else:
+            # is_causal aligns the queries with the first keys, not the last ones
+            mask = causal_block(L, S, S - L, queries.dtype, queries.device)
+    return F.scaled_dot_product_attention(
+        queries, keys, values, attn_mask=mask, is_causal=is_causal, scale=scale
+    )
+
+
+def chunked_attention(
+    queries, keys, values, scale: float, mask=None, block_size: int = 256
+) -> torch.Tensor:
+    """
+    Flash attention style pure torch attention: blocks of `block_size` queries
+    go through blocks of `block_size` keys keeping a running max, sum and
+    output of the softmax (online softmax), so only (B, H, block_size,
+    block_size) scores are materialized at a time. With the causal mask the
+    blocks of keys after the last query of a block are skipped.
+    """
+    L, S = queries.shape[-2], keys.shape[-2]
+    causal = isinstance(mask, str)
+    output = torch.empty_like(queries)
+    for q0 in range(0, L, block_size):
+        q1 = min(q0 + block_size, L)
+        q = queries[..., q0:q1, :] * scale
+        # position of the first query of the block among the keys
+        start = S - L + q0
+        end = min(S, start + q1 - q0) if causal else S
+        m = torch.full(q.shape[:-1] + (1,), -math.inf, dtype=q.dtype, device=q.device)
+        total = torch.zeros_like(m)
+        acc = torch.zeros_like(q)
+        for k0 in range(0, end, block_size):
+            k1 = min(k0 + block_size, end)
+            scores = torch.matmul(q, keys[..., k0:k1, :].transpose(-2, -1))
+            if causal:
+                if k1 > start + 1:
+                    scores = scores + causal_block(q1 - q0, k1 - k0, start - k0, q.dtype, q.device)
+            elif mask is not None:
+                scores = scores + mask[..., q0:q1, k0:k1]
+            new_m = torch.maximum(m, scores.amax(dim=-1, keepdim=True))
+            p = torch.exp(scores - new_m)
+            correction = torch.exp(m - new_m)
+            total = total * correction + p.sum(dim=-1, keepdim=True)
+            acc = acc * correction + torch.matmul(p, values[..., k0:k1, :])
+            m = new_m
+        output[..., q0:q1, :] = acc / total
+    return output
 
 
 class LlamaAttention(nn.Module):
-    def __init__(self, dims: int, num_heads: int):
+    """
+    Multi-head attention with RoPE. `attention` selects the implementation of
+    softmax(QK^T)V, one of `ATTENTION`:
+
+    - eager: the explicit (B, H, L, S) scores, O(L^2) memory per head
+    - sdpa: torch.nn.functional.scaled_dot_product_attention
+    - chunked: `chunked_attention` in blocks of `block_size` queries and keys
+
+    The mask is an additive tensor, None or "causal" for queries attending
+    to the keys up to their own position, the queries being the last
+    positions of the keys.
+    """
+
+    def __init__(self, dims: int, num_heads: int, attention: str = "sdpa", block_size: int = 256):
         super().__init__()
+        if attention not in ATTENTION:
+            raise ValueError(f"Unknown attention {attention!r}, expected one of {ATTENTION}")
         self.num_heads = num_heads
+        self.attention = attention
+        self.block_size = block_size
         head_dim = dims // num_heads
 
         # Initialize projections
@@ -31,81 +132,84 @@ class LlamaAttention(nn.Module):
         batch_size, seq_len, _ = queries.shape
         head_dim = queries.shape[-1] // self.num_heads
 
-        # Reshape for multi-head attention
-        queries = queries.view(batch_size, seq_len, self.num_heads, head_dim)
-        keys = keys.view(batch_size, seq_len, self.num_heads, head_dim)
-        values = values.view(batch_size, seq_len, self.num_heads, head_dim)
+        # Split the heads, (batch, num_heads, seq_len, head_dim) views
+        queries = queries.view(batch_size, seq_len, self.num_heads, head_dim).transpose(1, 2)
+        keys = keys.view(batch_size, seq_len, self.num_heads, head_dim).transpose(1, 2)
+        values = values.view(batch_size, seq_len, self.num_heads, head_dim).transpose(1, 2)
 
-        # Transpose for attention computation
-        queries = queries.transpose(1, 2)  # (batch, num_heads, seq_len, head_dim)
-        keys = keys.transpose(1, 2)
-        values = values.transpose(1, 2)
-
-        # Apply RoPE and handle cache if provided
+        # Apply RoPE and write the keys and values into the cache if provided
         if cache is not None:
-            key_cache, value_cache = cache
-            offset = key_cache.size(2)  # Get current position for RoPE
-            queries = self.rope(queries, offset=offset)
-            keys = self.rope(keys, offset=offset)
-            keys = torch.cat([key_cache, keys], dim=2)
-            values = torch.cat([value_cache, values], dim=2)
+            queries = self.rope(queries, offset=cache.positions)
+            keys = self.rope(keys, offset=cache.positions)
+            keys, values = cache.update_and_fetch(keys, values)
         else:
             queries = self.rope(queries)
             keys = self.rope(keys)
 
-        # Compute attention scores
-        scores = torch.matmul(queries * self.scale, keys.transpose(-2, -1))
-
-        # Apply mask if provided
-        if mask is not None:
-            scores = scores + mask
-
-        # Apply softmax
-        attention_weights = torch.softmax(scores, dim=-1)
-
-        # Compute weighted sum
-        output = torch.matmul(attention_weights, values)
+        if self.attention == "sdpa":
+            output = sdpa_attention(queries, keys, values, self.scale, mask)
+        elif self.attention == "chunked":
+            output = chunked_attention(queries, keys, values, self.scale, mask, self.block_size)
+        else:
+            output = eager_attention(queries, keys, values, self.scale, mask)
 
-        # Reshape and project output
-        output = output.transpose(1, 2).contiguous()
-        output = output.view(batch_size, seq_len, -1)
+        # Merge the heads, the only copy of the output, and project it
+        output = output.transpose(1, 2).reshape(batch_size, seq_len, -1)
         output = self.out_proj(output)
 
-        return output, (keys, values)
+        return output, cache
 
 
 class RoPE(nn.Module):
-    def __init__(self, dim: int, traditional: bool = True):
+    """
+    Rotary position embedding rotating by +angles like mlx.nn.RoPE: consecutive
+    pairs of features for the traditional implementation, the two halves of the
+    features otherwise.
+
+    The cos / sin tables of the angles are computed once per device and dtype
+    for the first `max_positions` positions and doubled when a call needs
+    positions past them, every call slices them at its offset and rotates
+    with real multiply-adds.
+    """
+
+    def __init__(
+        self, dim: int, traditional: bool = True, base: float = 10000.0, max_positions: int = 2048
+    ):
         super().__init__()
         self.dim = dim
         self.traditional = traditional
+        self.base = base
+        self.max_positions = max_positions
+        # (device, dtype) to the (max_positions, dim / 2) cos and sin tables
+        self._tables = {}
+
+    def tables(self, positions: int, device: torch.device, dtype: torch.dtype):
+        """cos and sin tables of at least `positions` positions"""
+        key = (device, dtype)
+        if key not in self._tables or self._tables[key][0].shape[0] < positions:
+            size = self.max_positions
+            while size < positions:
+                size *= 2
+            self.max_positions = size
+            # plain tensors even when first called in inference mode, the
+            # tables may be used later on with autograd
+            with torch.inference_mode(False), torch.no_grad():
+                # float32 angles like mlx.core.fast.rope
+                freq = torch.exp(
+                    torch.arange(0, self.dim, 2, device=device, dtype=torch.float32)
+                    * -(math.log(self.base) / self.dim)
+                )
+                angles = torch.arange(size, device=device, dtype=torch.float32)[:, None] * freq
+                self._tables[key] = (angles.cos().to(dtype), angles.sin().to(dtype))
+        return self._tables[key]
 
     def forward(self, x: torch.Tensor, offset: int = 0):
-        shape = x.shape
-        x = x.view(-1, shape[-2], shape[-1])
-
-        # Generate position encodings
-        position = torch.arange(
-            offset, offset + x.shape[-2], device=x.device
-        ).unsqueeze(1)
-
-        # Generate frequency bands
-        freq = torch.exp(
-            torch.arange(0, self.dim, 2, device=x.device)
-            * -(math.log(10000.0) / self.dim)
-        )
-
-        # Compute angles
-        angles = position * freq
-
-        # Apply rotary embeddings
-        x_complex = torch.view_as_complex(x.reshape(*x.shape[:-1], -1, 2))
-        angles = angles.unsqueeze(0).expand(x_complex.shape[:-1] + (angles.shape[-1],))
-
+        L = x.shape[-2]
+        cos, sin = self.tables(offset + L, x.device, x.dtype)
+        cos, sin = cos[offset : offset + L], sin[offset : offset + L]
         if self.traditional:
-            x_rotated = x_complex * torch.exp(-1j * angles)
-        else:
-            x_rotated = x_complex * (torch.cos(angles) - 1j * torch.sin(angles))
-
-        x_out = torch.view_as_real(x_rotated).reshape(*shape)
-        return x_out.view(*shape)
+            x1, x2 = x[..., 0::2], x[..., 1::2]
+            return torch.stack([x1 * cos - x2 * sin, x1 * sin + x2 * cos], dim=-1).flatten(-2)
+        half = x.shape[-1] // 2
+        x1, x2 = x[..., :half], x[..., half:]
+        return torch.cat([x1 * cos - x2 * sin, x1 * sin + x2 * cos], dim=-1)
@@ -0,0 +1,64 @@
+import torch
+
+
+class KVCache:
+    """
+    Keys and values of one attention layer, written into buffers that grow
+    `step` positions at a time, the torch counterpart of `mlx__cache.KVCache`.
+
+    The buffers are (B, num_heads, capacity, head_dims) and the first `offset`
+    positions are in use. `update_and_fetch` copies the new keys and values
+    into the buffers in place, a buffer too small for the new positions is
+    grown by whole steps, the only time it's copied.
+    """
+
+    def __init__(self, step: int = 256):
+        self.step = step
+        self.keys = None
+        self.values = None
+        self.offset = 0
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self.keys is None else self.keys.shape[2]
+
+    @property
+    def positions(self) -> int:
+        """RoPE position of the next token"""
+        return self.offset
+
+    def _grow(self, keys: torch.Tensor, values: torch.Tensor):
+        B, H, L, _ = keys.shape
+        steps = (self.offset + L - self.capacity + self.step - 1) // self.step
+        capacity = self.capacity + steps * self.step
+        new_keys = keys.new_zeros((B, H, capacity, keys.shape[-1]))
+        new_values = values.new_zeros((B, H, capacity, values.shape[-1]))
+        if self.keys is not None:
+            new_keys[..., : self.offset, :] = self.keys[..., : self.offset, :]
+            new_values[..., : self.offset, :] = self.values[..., : self.offset, :]
+        self.keys, self.values = new_keys, new_values
+
+    def update_and_fetch(
+        self, keys: torch.Tensor, values: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Append the (B, num_heads, L, head_dims) keys and values, returns views
+        of the keys and values of all the positions so far
+        """
+        if self.offset + keys.shape[2] > self.capacity:
+            self._grow(keys, values)
+        start, self.offset = self.offset, self.offset + keys.shape[2]
+        self.keys[..., start : self.offset, :] = keys
+        self.values[..., start : self.offset, :] = values
+        return self.keys[..., : self.offset, :], self.values[..., : self.offset, :]
+
+    def filter(self, rows: torch.Tensor):
+        """Keep the `rows` sequences of the batch"""
+        if self.keys is not None:
+            self.keys, self.values = self.keys[rows], self.values[rows]
+
+    def nbytes(self) -> int:
+        """Bytes of the allocated buffers"""
+        if self.keys is None:
+            return 0
+        return (self.keys.numel() + self.values.numel()) * self.keys.element_size()
@@ -0,0 +1,35 @@
+import torch
+import torch.nn as nn
+
+from modeling.llm.torch__attention import LlamaAttention
+
+
+class LlamaEncoderLayer(nn.Module):
+    def __init__(
+        self, dims: int, mlp_dims: int, num_heads: int, attention: str = "sdpa", block_size: int = 256
+    ):
+        super().__init__()
+
+        self.attention = LlamaAttention(dims, num_heads, attention, block_size)
+
+        # the epsilon of mlx.nn.RMSNorm, torch defaults to the dtype's epsilon
+        self.norm1 = nn.RMSNorm(dims, eps=1e-5)
+        self.norm2 = nn.RMSNorm(dims, eps=1e-5)
+
+        self.linear1 = nn.Linear(dims, mlp_dims, bias=False)
+        self.linear2 = nn.Linear(dims, mlp_dims, bias=False)
+        self.linear3 = nn.Linear(mlp_dims, dims, bias=False)
+
+    def forward(self, x, mask=None, cache=None):
+        y = self.norm1(x)
+        y, cache = self.attention(y, y, y, mask, cache)
+        x = x + y
+
+        y = self.norm2(x)
+        a = self.linear1(y)
+        b = self.linear2(y)
+        y = a * torch.sigmoid(a) * b
+        y = self.linear3(y)
+        x = x + y
+
+        return x, cache
@@ -0,0 +1,172 @@
+import torch
+import torch.nn as nn
+
+from modeling.llm.torch__cache import KVCache
+from modeling.llm.torch__encoder import LlamaEncoderLayer
+
+
+def causal_mask(
+    L: int, offset: int = 0, dtype=torch.float32, padding: torch.Tensor = None, device=None
+) -> torch.Tensor:
+    """
+    Additive (L, offset + L) mask of L queries at positions offset..offset + L - 1,
+    each attending to the positions up to its own. With the (B,) `padding`
+    lengths of left padded sequences the mask is (B, 1, L, offset + L) and also
+    hides the padding positions of every sequence.
+    """
+    rows = torch.arange(offset, offset + L, device=device)[:, None]
+    cols = torch.arange(offset + L, device=device)[None]
+    mask = cols > rows
+    if padding is not None:
+        mask = (mask[None] | (cols[None] < padding[:, None, None]))[:, None]
+    return mask.to(dtype) * -1e9
+
+
+def sample(logits: torch.Tensor, temp: float) -> torch.Tensor:
+    """Sample the (B,) next tokens from the (B, vocab_size) logits, greedily when temp is 0"""
+    if temp == 0:
+        return torch.argmax(logits, dim=-1)
+    probabilities = torch.softmax(logits.float() * (1 / temp), dim=-1)
+    return torch.multinomial(probabilities, 1)[:, 0]
+
+
+class Llama(nn.Module):
+    """
+    PyTorch counterpart of `mlx__model.Llama`, same parameter names and shapes.
+    `attention` and `block_size` select the attention implementation of the
+    layers, see `LlamaAttention`.
+    """
+
+    def __init__(
+        self,
+        num_layers: int,
+        vocab_size: int,
+        dims: int,
+        mlp_dims: int,
+        num_heads: int,
+        attention: str = "sdpa",
+        block_size: int = 256,
+    ):
+        super().__init__()
+
+        self.attention = attention
+        self.embedding = nn.Embedding(vocab_size, dims)
+        self.layers = nn.ModuleList(
+            [
+                LlamaEncoderLayer(dims, mlp_dims, num_heads, attention, block_size)
+                for _ in range(num_layers)
+            ]
+        )
+        self.norm = nn.RMSNorm(dims, eps=1e-5)
+        self.out_proj = nn.Linear(dims, vocab_size, bias=False)
+
+    def mask(self, L: int, offset: int = 0, padding: torch.Tensor = None):
+        """
+        Mask of L queries after `offset` cached positions: "causal" for the
+        fused and chunked attentions, which never build the whole matrix,
+        the additive `causal_mask` for the eager one and left padded batches
+        """
+        if padding is None and self.attention != "eager":
+            return "causal"
+        return causal_mask(
+            L, offset, self.embedding.weight.dtype, padding, device=self.embedding.weight.device
+        )
+
+    def forward(self, x):
+        mask = self.mask(x.shape[1])
+
+        x = self.embedding(x)
+        for l in self.layers:
+            x, _ = l(x, mask)
+        x = self.norm(x)
+        return self.out_proj(x)
+
+    def make_cache(self, step: int = 256) -> list[KVCache]:
+        """One `KVCache` per layer"""
+        return [KVCache(step) for _ in self.layers]
+
+    @torch.inference_mode()
+    def prefill(
+        self,
+        x: torch.Tensor,
+        cache: list[KVCache],
+        prefill_step: int = 512,
+        padding: torch.Tensor = None,
+    ) -> torch.Tensor:
+        """
+        Write the keys and values of the (B, L) prompt `x` into `cache`, returns
+        the (B, vocab_size) logits of its last position, see `mlx__model.Llama.prefill`
+        """
+        for start in range(0, x.shape[1], prefill_step):
+            chunk = x[:, start : start + prefill_step]
+            mask = self.mask(chunk.shape[1], cache[0].offset, padding)
+            h = self.embedding(chunk)
+            for l, c in zip(self.layers, cache):
+                h, _ = l(h, mask=mask, cache=c)
+        return self.out_proj(self.norm(h[:, -1]))
+
+    @torch.inference_mode()
+    def decode(self, y: torch.Tensor, cache: list[KVCache], mask: torch.Tensor = None) -> torch.Tensor:
+        """Logits (B, vocab_size) after the (B,) tokens `y`, written into `cache`"""
+        x = self.embedding(y[:, None])
+        for l, c in zip(self.layers, cache):
+            x, _ = l(x, mask=mask, cache=c)
+        x = self.norm(x)
+        return self.out_proj(x[:, -1])
+
+    @torch.inference_mode()
+    def generate(self, x, temp=1.0, cache: list[KVCache] = None, prefill_step: int = 512):
+        """
+        Yield the tokens sampled after the (B, L) prompt `x`, one (B,) tensor at
+        a time, see `mlx__model.Llama.generate`. Unlike MLX, torch computes
+        every token as soon as it's asked for.
+        """
+        cache = self.make_cache() if cache is None else cache
+        y = sample(self.prefill(x, cache, prefill_step), temp)
+        yield y
+        while True:
+            y = sample(self.decode(y, cache), temp)
+            yield y
+
+    @torch.inference_mode()
+    def generate_batch(
+        self,
+        prompts: list[list[int]],
+        temp: float = 1.0,
+        max_tokens: int = 256,
+        stop_tokens: tuple = (),
+        prefill_step: int = 512,
+    ):
+        """
+        Generate the completions of prompts of different lengths in one batch,
+        yield (index of the prompt, generated tokens) as the sequences finish,
+        see `mlx__model.Llama.generate_batch`
+        """
+        device = self.embedding.weight.device
+        dtype = self.embedding.weight.dtype
+        L = max(len(p) for p in prompts)
+        padding = torch.tensor([L - len(p) for p in prompts], device=device)
+        x = torch.tensor([[0] * (L - len(p)) + list(p) for p in prompts], device=device)
+        cache = self.make_cache()
+        y = sample(self.prefill(x, cache, prefill_step, padding), temp)
+        stop_tokens = set(stop_tokens)
+        active = list(range(len(prompts)))
+        tokens = [[] for _ in prompts]
+        while True:
+            keep = []
+            for row, (i, token) in enumerate(zip(active, y.tolist())):
+                tokens[i].append(token)
+                if token in stop_tokens or len(tokens[i]) >= max_tokens:
+                    yield i, tokens[i]
+                else:
+                    keep.append(row)
+            if not keep:
+                return
+            if len(keep) < len(active):
+                rows = torch.tensor(keep, device=device)
+                for c in cache:
+                    c.filter(rows)
+                active = [active[row] for row in keep]
+                y, padding = y[rows], padding[rows]
+            mask = causal_mask(1, cache[0].offset, dtype, padding, device=device)
+            y = sample(self.decode(y, cache, mask), temp)
@@ -1,22 +1,15 @@
 import click
-import kaggle
-import zipfile
-import pandas as pd
 from pathlib import Path
 from modeling.config import logger
-from kaggle.api.kaggle_api_extended import KaggleApi
+from modeling.config.profiler import span
 
-from modeling.recommendation.helper import save_user_movie_ratings
-from modeling.recommendation.matrix_factorization import (
-    plot_train_test_loss,
-    train_for_recommendation,
-)
-from modeling.recommendation.preprocess import (
-    basic_transform,
-    convert_data_to_dict,
-    save_as_sparse_data,
-    split_train_test,
-)
+
+def parse_space(value: str, cast: type):
+    """"a,b,c" to a list of values, "low:high" to a (low, high) range"""
+    if ":" in value:
+        low, high = value.split(":")
+        return cast(low), cast(high)
+    return [cast(v) for v in value.split(",")]
 
 
 @click.group("recommendation")
@@ -34,8 +27,22 @@ def cli():
 @click.option(
     "--force/--no-force", default=False, help="Force download even if files exist"
 )
-def download(data_dir: str, force: bool):
+@click.option(
+    "--source",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Local rating.csv (or zip archive of it) to convert instead of downloading",
+)
+@click.option(
+    "--chunk-size",
+    default=1_000_000,
+    type=click.IntRange(min=1),
+    help="Number of CSV rows per parquet row group",
+)
+def download(data_dir: str, force: bool, source: str, chunk_size: int):
     """Download the MovieLens 20M dataset"""
+    from modeling.recommendation.helper import csv_to_parquet
+
     try:
         # Create directory structure
         data_dir: Path = Path(data_dir)
@@ -51,37 +58,57 @@ def download(data_dir: str, force: bool):
             logger.info(f"Dataset already exists at {ratings_parquet}")
             return
 
-        # Download dataset
-        logger.info(f"Downloading dataset to {ratings_csv}")
-        api = KaggleApi()
-        api.authenticate()
-        kaggle.api.dataset_download_file(
-            dataset="grouplens/movielens-20m-dataset",
-            file_name="rating.csv",
-            path=data_dir,
-        )
-        # Extract zip file
-        logger.info(f"Extracting {zip_file}")
-        with zipfile.ZipFile(zip_file, "r") as zip_ref:
-            zip_ref.extractall(data_dir)
-
-        # Convert to parquet
-        if ratings_csv.exists():
-            logger.info("Converting to parquet format...")
-            df = pd.read_csv(ratings_csv)
-            df.to_parquet(ratings_parquet)
+        downloaded = source is None
+        if downloaded:
+            # Download dataset
+            logger.info(f"Downloading dataset to {ratings_csv}")
+            # imported here, kaggle asks for credentials as soon as it's imported
+            import kaggle
+            from kaggle.api.kaggle_api_extended import KaggleApi
+
+            api = KaggleApi()
+            api.authenticate()
+            kaggle.api.dataset_download_file(
+                dataset="grouplens/movielens-20m-dataset",
+                file_name="rating.csv",
+                path=data_dir,
+            )
+            source = zip_file if zip_file.exists() else ratings_csv
+        source = Path(source)
+        if not source.exists():
+            raise FileNotFoundError(f"Failed to download dataset to {source}")
+
+        # Convert to parquet, streaming the CSV in chunks (straight out of the zip file)
+        logger.info(f"Converting {source} to parquet format...")
+        rows = csv_to_parquet(source, ratings_parquet, chunk_size=chunk_size)
+        if downloaded:
             # Cleanup temporary files
-            ratings_csv.unlink()  # Remove CSV
-            zip_file.unlink()  # Remove ZIP
-            logger.info(f"Dataset saved to {ratings_parquet}")
-        else:
-            raise FileNotFoundError(f"Failed to extract dataset to {ratings_csv}")
+            source.unlink()
+        logger.info(f"Dataset saved to {ratings_parquet} ({rows} rows)")
 
     except Exception as e:
         logger.error(f"Error downloading dataset: {str(e)}")
         raise
 
 
+@cli.command()
+@click.option(
+    "--data-dir",
+    default=".local/large_files/movielens-20m-dataset",
+    help="Directory to store the dataset",
+)
+@click.option(
+    "--rows", default=1_000_000, type=click.IntRange(min=1), help="Number of ratings"
+)
+@click.option("--seed", default=0, help="Seed of the generator")
+def synthetic(data_dir: str, rows: int, seed: int):
+    """Generate MovieLens shaped power law ratings as rating.parquet, without downloading"""
+    from modeling.recommendation.synthetic import write_synthetic_ratings
+
+    data_dir: Path = Path(data_dir)
+    write_synthetic_ratings(data_dir / "rating.parquet", rows, seed=seed)
+
+
 @cli.command()
 @click.option(
     "--data-dir",
@@ -93,32 +120,134 @@ def download(data_dir: str, force: bool):
     default="edited_rating.parquet",
     help="Output file name for preprocessed data",
 )
-def preprocess(data_dir: str, output_file: str):
-    """Preprocess the MovieLens dataset"""
+@click.option(
+    "--split",
+    type=click.Choice(["random", "hash", "holdout"]),
+    default="random",
+    help="random shuffle, seeded hash of (user, movie) or per user holdout by timestamp",
+)
+@click.option("--test-size", default=0.2, help="Fraction of ratings in the test set")
+@click.option("--seed", default=None, type=int, help="Seed of the random / hash split")
+@click.option(
+    "--holdout", default=1, help="Ratings held out per user with --split holdout"
+)
+def preprocess(
+    data_dir: str,
+    output_file: str,
+    split: str,
+    test_size: float,
+    seed: int,
+    holdout: int,
+):
+    """
+    Preprocess the MovieLens dataset. The hash split streams the ratings one
+    row group at a time (`split_parquet`), the random and holdout splits
+    need the whole data frame.
+    """
+    import numpy as np
+    import pandas as pd
+    from modeling.recommendation.preprocess import (
+        basic_transform,
+        save_as_sparse_data,
+        read_split_arrays,
+        split_parquet,
+        split_train_test,
+    )
+    from modeling.recommendation.store import STORE_DIR, RatingsStore
+
     data_dir: Path = Path(data_dir)
     output_file: Path = data_dir / output_file
     ratings_parquet: Path = data_dir / "rating.parquet"
     if not data_dir.exists():
         logger.error(f"Directory not found: {data_dir}")
         return
-    df = pd.read_parquet(ratings_parquet)
-    df = basic_transform(df)
-    logger.info(f"Saving basic transformed data as {output_file}")
-    df.to_parquet(output_file, index=False)
-    # spliting data into train and test datasets
-    df_train, df_test = split_train_test(df)
-    # convert the MovieLens dataset to DICT format
-    user2movie, movie2user, usermovie2rating = convert_data_to_dict(
-        df_train, subset="train"
-    )
-    _, _, usermovie2rating_test = convert_data_to_dict(df_test, subset="test")
-    # Saving data as pickle files
-    save_user_movie_ratings(
-        data_dir, user2movie, movie2user, usermovie2rating, usermovie2rating_test
-    )
+    if split == "hash":
+        train_file = output_file.with_name(f"{output_file.stem}_train.parquet")
+        test_file = output_file.with_name(f"{output_file.stem}_test.parquet")
+        logger.info(f"Saving basic transformed data as {output_file}")
+        with span("preprocess.split_parquet"):
+            movie_ids = split_parquet(
+                ratings_parquet, train_file, test_file, test_size, seed or 0, output_file
+            )
+        train, test = read_split_arrays(train_file), read_split_arrays(test_file)
+        # basic_transform shifts the MovieLens user ids down by one
+        N = int(max(train[0].max(initial=-1), test[0].max(initial=-1))) + 1
+        with span("preprocess.ratings_store"):
+            RatingsStore.from_arrays(
+                train, test, user_ids=np.arange(1, N + 1), movie_ids=movie_ids
+            ).save(data_dir / STORE_DIR)
+        columns = ["userId", "movie_idx", "rating"]
+        df_train = pd.DataFrame(dict(zip(columns, train)))
+        df_test = pd.DataFrame(dict(zip(columns, test)))
+    else:
+        with span("preprocess.read_parquet"):
+            df = pd.read_parquet(ratings_parquet)
+        with span("preprocess.basic_transform"):
+            df = basic_transform(df, keep_timestamp=split == "holdout")
+        logger.info(f"Saving basic transformed data as {output_file}")
+        with span("preprocess.to_parquet"):
+            df.to_parquet(output_file, index=False)
+        # spliting data into train and test datasets
+        with span("preprocess.split_train_test", method=split):
+            df_train, df_test = split_train_test(
+                df, method=split, test_size=test_size, seed=seed, holdout=holdout
+            )
+        # save the ratings as memory-mappable arrays
+        with span("preprocess.ratings_store"):
+            RatingsStore.from_frames(df_train, df_test).save(data_dir / STORE_DIR)
     # save as sparse data
-    save_as_sparse_data(df_train, data_dir=data_dir, subset="train")
-    save_as_sparse_data(df_test, data_dir=data_dir, subset="test")
+    with span("preprocess.save_as_sparse_data"):
+        save_as_sparse_data(df_train, data_dir=data_dir, subset="train")
+        save_as_sparse_data(df_test, data_dir=data_dir, subset="test")
+
+
+@cli.command()
+@click.option(
+    "--data-dir",
+    default=".local/large_files/movielens-20m-dataset",
+    help="Directory containing the dataset",
+)
+@click.option(
+    "--input-file", default="rating.parquet", help="MovieLens parquet file of ratings to split"
+)
+@click.option(
+    "--output-file",
+    default="edited_rating.parquet",
+    help="Transformed ratings, the splits are <stem>_train / <stem>_test.parquet",
+)
+@click.option("--test-size", default=0.2, help="Fraction of ratings in the test set")
+@click.option("--seed", default=0, help="Seed of the hash split")
+def split(data_dir: str, input_file: str, output_file: str, test_size: float, seed: int):
+    """
+    Transform and hash split a ratings parquet file row group by row group
+    into the files `preprocess --split hash` builds its store from
+    """
+    from modeling.recommendation.preprocess import split_parquet
+
+    data_dir: Path = Path(data_dir)
+    output_file: Path = data_dir / output_file
+    split_parquet(
+        data_dir / input_file,
+        output_file.with_name(f"{output_file.stem}_train.parquet"),
+        output_file.with_name(f"{output_file.stem}_test.parquet"),
+        test_size=test_size,
+        seed=seed,
+        output_file=output_file,
+    )
+
+
+@cli.command()
+@click.option(
+    "--data-dir",
+    default=".local/large_files/movielens-20m-dataset",
+    help="Directory containing the dataset",
+)
+def convert(data_dir: str):
+    """Convert the pickled dictionaries of an older preprocess run to a ratings store"""
+    from modeling.recommendation.store import STORE_DIR, RatingsStore
+
+    data_dir: Path = Path(data_dir)
+    RatingsStore.from_pickles(data_dir).save(data_dir / STORE_DIR)
 
 
 @cli.command()
@@ -128,12 +257,426 @@ def preprocess(data_dir: str, output_file: str):
     help="Directory containing the dataset",
 )
 @click.option("--plot", default=False, help="Output plot for train and test")
-def train(data_dir: str, plot: bool):
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of processes solving the ALS half-steps",
+)
+@click.option(
+    "--ann/--no-ann", default=True, help="Build the ANN indexes of the trained factors"
+)
+@click.option(
+    "--epochs", default=25, type=click.IntRange(min=1), help="Total number of epochs"
+)
+@click.option(
+    "--resume/--no-resume", default=False, help="Continue from the last checkpoint"
+)
+@click.option(
+    "--checkpoint-every",
+    default=1,
+    type=click.IntRange(min=0),
+    help="Epochs between checkpoints, 0 disables checkpointing",
+)
+@click.option(
+    "--patience",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Stop after that many epochs without test loss improvement",
+)
+@click.option(
+    "--min-delta", default=0.0, help="Smallest test loss decrease counted as improvement"
+)
+@click.option("--seed", default=None, type=int, help="Seed of the factors initialization")
+@click.option("--reg", default=20.0, help="Regularization penalty")
+@click.option(
+    "--factors", default=10, type=click.IntRange(min=1), help="Latent dimensionality K"
+)
+@click.option(
+    "--mode",
+    type=click.Choice(["explicit", "implicit"]),
+    default="explicit",
+    help="Rating prediction or confidence weighted implicit feedback ALS",
+)
+@click.option("--alpha", default=10.0, help="Confidence scale of the implicit mode")
+@click.option(
+    "--cg-steps",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Conjugate gradient steps of the implicit mode, direct solves when omitted",
+)
+@click.option(
+    "--solver",
+    type=click.Choice(["als", "sgd"]),
+    default="als",
+    help="Alternating least squares or mini-batch gradient descent with torch",
+)
+@click.option("--batch-size", default=8192, help="Ratings per batch of the sgd solver")
+@click.option("--lr", default=0.01, help="Learning rate of the sgd solver")
+@click.option(
+    "--optimizer",
+    type=click.Choice(["adam", "sgd"]),
+    default="adam",
+    help="Optimizer of the sgd solver",
+)
+@click.option(
+    "--sparse/--no-sparse",
+    default=False,
+    help="Sparse embedding gradients (SparseAdam with --optimizer adam)",
+)
+@click.option(
+    "--loss",
+    type=click.Choice(["mse", "huber"]),
+    default="mse",
+    help="Training loss of the sgd solver",
+)
+@click.option(
+    "--threads", default=None, type=click.IntRange(min=1), help="torch intra-op threads"
+)
+@click.option(
+    "--eval-k",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Log the ranking metrics of the top K lists every epoch",
+)
+def train(
+    data_dir: str,
+    plot: bool,
+    workers: int,
+    ann: bool,
+    epochs: int,
+    resume: bool,
+    checkpoint_every: int,
+    patience: int,
+    min_delta: float,
+    seed: int,
+    reg: float,
+    factors: int,
+    mode: str,
+    alpha: float,
+    cg_steps: int,
+    solver: str,
+    batch_size: int,
+    lr: float,
+    optimizer: str,
+    sparse: bool,
+    loss: str,
+    threads: int,
+    eval_k: int,
+):
+    from modeling.recommendation.matrix_factorization import (
+        plot_train_test_loss,
+        train_for_recommendation,
+    )
+
+    if mode == "implicit" and workers > 1:
+        raise click.BadParameter(
+            "Implicit ALS runs in a single process, use --workers 1", param_hint="--workers"
+        )
     data_dir: Path = Path(data_dir)
-    train_losses, test_losses = train_for_recommendation(data_dir)
+    train_losses, test_losses = train_for_recommendation(
+        data_dir,
+        workers=workers,
+        ann=ann,
+        epochs=epochs,
+        resume=resume,
+        checkpoint_every=checkpoint_every,
+        patience=patience,
+        min_delta=min_delta,
+        seed=seed,
+        reg=reg,
+        K=factors,
+        mode=mode,
+        alpha=alpha,
+        cg_steps=cg_steps,
+        solver=solver,
+        sgd_options={
+            "batch_size": batch_size,
+            "lr": lr,
+            "optimizer": optimizer,
+            "sparse": sparse,
+            "loss": loss,
+            "threads": threads,
+        },
+        eval_k=eval_k,
+    )
     if plot:
         plot_train_test_loss(train_losses, test_losses)
 
 
+@cli.command()
+@click.option(
+    "--data-dir",
+    default=".local/large_files/movielens-20m-dataset",
+    help="Directory containing the dataset",
+)
+@click.option("--k", "ks", default="10", help="Latent dimensionalities, 'a,b,c' or 'low:high'")
+@click.option("--reg", "regs", default="20", help="Regularization penalties, 'a,b,c' or 'low:high'")
+@click.option("--epochs", default="25", help="Epochs, 'a,b,c' or 'low:high'")
+@click.option(
+    "--search",
+    type=click.Choice(["grid", "random"]),
+    default="grid",
+    help="Every combination or random samples (ranges are sampled log-uniformly)",
+)
+@click.option("--trials", default=10, help="Number of trials of a random search")
+@click.option(
+    "--workers", default=1, type=click.IntRange(min=1), help="Trials trained at once"
+)
+@click.option(
+    "--min-epochs",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Epochs of the first successive halving rung, no halving when omitted",
+)
+@click.option("--eta", default=3, type=click.IntRange(min=2), help="Halving rate")
+@click.option("--seed", default=0, help="Seed of the search and of the trials")
+def sweep(
+    data_dir: str,
+    ks: str,
+    regs: str,
+    epochs: str,
+    search: str,
+    trials: int,
+    workers: int,
+    min_epochs: int,
+    eta: int,
+    seed: int,
+):
+    """Hyperparameter search over K, reg and epochs of ALS"""
+    from modeling.recommendation.sweep import grid, random_search, sweep as run_sweep
+
+    data_dir: Path = Path(data_dir)
+    space = {
+        "K": parse_space(ks, int),
+        "reg": parse_space(regs, float),
+        "epochs": parse_space(epochs, int),
+    }
+    if search == "grid":
+        if any(isinstance(values, tuple) for values in space.values()):
+            raise click.BadParameter("Grid search needs lists of values, not ranges")
+        params = grid(space)
+    else:
+        params = random_search(space, trials, seed=seed)
+    results = run_sweep(
+        data_dir, params, workers=workers, min_epochs=min_epochs, eta=eta, seed=seed
+    )
+    click.echo(results.to_string(index=False))
+
+
+@cli.command()
+@click.option(
+    "--data-dir",
+    default=".local/large_files/movielens-20m-dataset",
+    help="Directory containing the dataset",
+)
+@click.option(
+    "--input-file",
+    default="new_rating.parquet",
+    help="Parquet file of new ratings (userId, movieId, rating columns)",
+)
+@click.option(
+    "--refresh-items/--no-refresh-items",
+    default=False,
+    help="Also re-solve the movies rated since the last refresh",
+)
+@click.option("--reg", default=20.0, help="Regularization penalty")
+@click.option(
+    "--n-iter", default=3, type=click.IntRange(min=1), help="Half-steps per fold-in"
+)
+def update(data_dir: str, input_file: str, refresh_items: bool, reg: float, n_iter: int):
+    """Fold new ratings and users into the trained factors without retraining"""
+    import pyarrow.parquet as pq
+    from modeling.recommendation.ann import ANN_DIR, build_indexes
+    from modeling.recommendation.incremental import IncrementalALS
+
+    data_dir: Path = Path(data_dir)
+    input_file: Path = data_dir / input_file
+    als = IncrementalALS(data_dir, reg=reg, n_iter=n_iter)
+    # one fold-in per row group keeps the batches bounded
+    parquet_file = pq.ParquetFile(input_file)
+    for i in range(parquet_file.num_row_groups):
+        table = parquet_file.read_row_group(i, columns=["userId", "movieId", "rating"])
+        als.add_ratings(
+            table["userId"].to_numpy(),
+            table["movieId"].to_numpy(),
+            table["rating"].to_numpy(),
+        )
+    if refresh_items:
+        als.refresh_items()
+    als.save()
+    if refresh_items and (data_dir / ANN_DIR).exists():
+        build_indexes(als.W, als.U, als.c, data_dir / ANN_DIR)
+
+
+@cli.command()
+@click.option(
+    "--data-dir",
+    default=".local/large_files/movielens-20m-dataset",
+    help="Directory containing the dataset",
+)
+@click.option(
+    "--user",
+    "users",
+    multiple=True,
+    type=int,
+    help="MovieLens user id (repeatable), every user when omitted",
+)
+@click.option("--k", default=10, type=click.IntRange(min=1), help="Movies per user")
+@click.option(
+    "--memory-budget", default=256, help="Memory (MB) for one block of scores"
+)
+@click.option(
+    "--output-file",
+    default="recommendations.parquet",
+    help="Output file name when recommending for every user",
+)
+def recommend(data_dir: str, users: tuple, k: int, memory_budget: int, output_file: str):
+    """Recommend the top K unseen movies for users"""
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from modeling.recommendation.factors import FACTORS_DIR, Factors
+    from modeling.recommendation.incremental import DELTA_DIR, RatingsDelta
+    from modeling.recommendation.recommend import Recommender
+    from modeling.recommendation.store import STORE_DIR, RatingsStore
+
+    data_dir: Path = Path(data_dir)
+    store = RatingsStore.open(data_dir / STORE_DIR)
+    factors = Factors.open(data_dir / FACTORS_DIR)
+    # folded-in ratings and users of `update`
+    delta = RatingsDelta.open(data_dir / DELTA_DIR)
+    user_ids = np.concatenate([store.user_ids, delta.new_user_ids])
+    recommender = Recommender(
+        factors, seen=delta.seen(store), memory_budget=memory_budget * 2**20
+    )
+    if users:
+        index = pd.Index(user_ids).get_indexer(list(users))
+        if (index < 0).any():
+            raise click.BadParameter(f"Unknown user ids: {np.array(users)[index < 0]}")
+        movies, ratings = recommender.recommend(index, k)
+        for user, m, r in zip(users, movies, ratings):
+            top = ", ".join(f"{i} ({x:.2f})" for i, x in zip(store.movie_ids[m], r))
+            click.echo(f"user {user}: {top}")
+        return
+    output_file: Path = data_dir / output_file
+    logger.info(f"Saving recommendations for every user as {output_file}")
+    schema = pa.schema(
+        [
+            ("userId", pa.int64()),
+            ("rank", pa.int32()),
+            ("movieId", pa.int64()),
+            ("rating", pa.float32()),
+        ]
+    )
+    with pq.ParquetWriter(output_file, schema) as writer:
+        for index, movies, ratings in recommender.recommend_all(k):
+            n, k_ = movies.shape
+            table = pa.table(
+                {
+                    "userId": np.repeat(user_ids[index], k_),
+                    "rank": np.tile(np.arange(1, k_ + 1, dtype=np.int32), n),
+                    "movieId": store.movie_ids[movies.ravel()],
+                    "rating": ratings.ravel(),
+                },
+                schema=schema,
+            )
+            writer.write_table(table)
+
+
+@cli.command()
+@click.option(
+    "--data-dir",
+    default=".local/large_files/movielens-20m-dataset",
+    help="Directory containing the dataset",
+)
+@click.option("--k", default=10, type=click.IntRange(min=1), help="Length of the ranked lists")
+@click.option(
+    "--min-rating",
+    default=None,
+    type=float,
+    help="Test ratings below it are not relevant, every test rating is when omitted",
+)
+@click.option(
+    "--memory-budget", default=256, help="Memory (MB) for the blocks of scores"
+)
+@click.option(
+    "--threads",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Blocks scored at once, the number of CPUs by default",
+)
+def evaluate(data_dir: str, k: int, min_rating: float, memory_budget: int, threads: int):
+    """Ranking metrics of the trained factors on the test split"""
+    from modeling.recommendation.evaluate import ranking_metrics
+    from modeling.recommendation.factors import FACTORS_DIR, Factors
+    from modeling.recommendation.store import STORE_DIR, RatingsStore
+
+    data_dir: Path = Path(data_dir)
+    store = RatingsStore.open(data_dir / STORE_DIR)
+    factors = Factors.open(data_dir / FACTORS_DIR)
+    metrics = ranking_metrics(
+        factors,
+        store,
+        k=k,
+        min_rating=min_rating,
+        memory_budget=memory_budget * 2**20,
+        threads=threads,
+    )
+    for name, value in metrics.items():
+        click.echo(f"{name}: {value:.4f}")
+
+
+@cli.command()
+@click.option(
+    "--data-dir",
+    default=".local/large_files/movielens-20m-dataset",
+    help="Directory containing the dataset",
+)
+@click.option(
+    "--movie", "movies", multiple=True, type=int, help="MovieLens movie id (repeatable)"
+)
+@click.option("--k", default=10, type=click.IntRange(min=1), help="Movies per query")
+@click.option("--n-probe", default=8, help="Inverted lists scored per query")
+@click.option(
+    "--recall/--no-recall",
+    default=False,
+    help="Report recall@K against exact search over every movie",
+)
+def similar(data_dir: str, movies: tuple, k: int, n_probe: int, recall: bool):
+    """Find similar movies with the approximate nearest neighbour index"""
+    import numpy as np
+    import pandas as pd
+    from modeling.recommendation.ann import ANN_DIR, IVFIndex
+    from modeling.recommendation.store import STORE_DIR, RatingsStore
+
+    data_dir: Path = Path(data_dir)
+    store = RatingsStore.open(data_dir / STORE_DIR)
+    index = IVFIndex.open(data_dir / ANN_DIR / "similar")
+    if movies:
+        movie_index = pd.Index(store.movie_ids).get_indexer(list(movies))
+        if (movie_index < 0).any():
+            raise click.BadParameter(
+                f"Unknown movie ids: {np.array(movies)[movie_index < 0]}"
+            )
+        # the movie itself is usually, but not always, its first hit, drop it
+        # wherever it is and keep the best k others
+        items, scores = index.search(index.vectors[movie_index], k + 1, n_probe)
+        keep = (items != movie_index[:, None]) & (items >= 0)
+        order = np.argsort(~keep, axis=1, kind="stable")[:, :k]
+        items, scores, keep = (np.take_along_axis(a, order, axis=1) for a in (items, scores, keep))
+        for movie, m, s, kept in zip(movies, items, scores, keep):
+            top = ", ".join(
+                f"{i} ({x:.2f})" for i, x in zip(store.movie_ids[m[kept]], s[kept])
+            )
+            click.echo(f"movie {movie}: {top}")
+    if recall:
+        click.echo(
+            f"recall@{k} (n_probe={n_probe}): "
+            f"{index.recall_at_k(index.vectors, k, n_probe):.4f}"
+        )
+
+
 if __name__ == "__main__":
     cli()
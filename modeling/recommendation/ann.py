@@ -0,0 +1,195 @@
+import numpy as np
+from pathlib import Path
+
+from modeling.config import logger
+from modeling.recommendation.helper import load_arrays, save_arrays
+
+ANN_DIR = "ann_index"
+
+
+def kmeans(
+    X: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """Lloyd's k-means, returns the centroids and the cluster of every row of `X`"""
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        # argmin |x - c|^2 == argmax x.c - |c|^2 / 2
+        labels = np.argmax(X @ centroids.T - 0.5 * (centroids**2).sum(1), axis=1)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, X)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # reseed empty clusters with random points
+        centroids[empty] = X[rng.choice(len(X), int(empty.sum()), replace=False)]
+    labels = np.argmax(X @ centroids.T - 0.5 * (centroids**2).sum(1), axis=1)
+    return centroids, labels
+
+
+class IVFIndex:
+    """
+    Inverted file index over item vectors for approximate top-K search.
+
+    The items are clustered with k-means (the coarse quantizer) and stored
+    list by list; a query only scores the items of the `n_probe` lists whose
+    centroids score best, instead of every item. Scores are inner products,
+    with `metric="cosine"` the vectors and queries are L2 normalized first.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+        list_indptr: np.ndarray,
+        list_items: np.ndarray,
+        metric: str = "ip",
+    ):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_indptr = list_indptr
+        self.list_items = list_items
+        self.metric = metric
+
+    @classmethod
+    def build(
+        cls,
+        X: np.ndarray,
+        metric: str = "ip",
+        n_lists: int = None,
+        n_iter: int = 10,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Cluster the rows of `X` into `n_lists` (sqrt(len(X)) by default) inverted lists"""
+        X = np.asarray(X, dtype=np.float32)
+        if metric == "cosine":
+            X = _normalize(X)
+        n_lists = n_lists or max(1, int(np.sqrt(len(X))))
+        centroids, labels = kmeans(X, min(n_lists, len(X)), n_iter, seed)
+        list_items = np.argsort(labels, kind="stable")
+        list_indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))]
+        )
+        return cls(X, centroids, list_indptr, list_items, metric)
+
+    def search(
+        self, Q: np.ndarray, k: int = 10, n_probe: int = 8
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+          - Q (np.ndarray): batch of queries, one per row
+          - k (int): number of items per query
+          - n_probe (int): number of inverted lists scored per query
+
+        Returns:
+          tuple[np.ndarray, np.ndarray]: item indices and scores, both (len(Q), k)
+          best first, padded with -1 / -inf when the probed lists hold less than k items
+        """
+        Q = self._queries(Q)
+        n_probe = min(n_probe, len(self.centroids))
+        probes = np.argpartition(Q @ self.centroids.T, -n_probe, axis=1)[:, -n_probe:]
+        # best k of every probed list of every query, one slot per probe
+        items = np.full((len(Q), n_probe, k), -1, dtype=np.int64)
+        scores = np.full((len(Q), n_probe, k), -np.inf, dtype=np.float32)
+        # group the (query, probe) pairs by list, every list is scored against
+        # all of its queries with one product
+        lists = probes.ravel()
+        by_list = np.argsort(lists, kind="stable")
+        bounds = np.searchsorted(lists[by_list], np.arange(len(self.centroids) + 1))
+        starts, stops = self.list_indptr[:-1], self.list_indptr[1:]
+        for l in np.flatnonzero((np.diff(bounds) > 0) & (stops > starts)):
+            pairs = by_list[bounds[l] : bounds[l + 1]]
+            queries, slots = pairs // n_probe, pairs % n_probe
+            members = np.asarray(self.list_items[starts[l] : stops[l]])
+            S = Q[queries] @ self.vectors[members].T
+            n = min(k, len(members))
+            top = np.argpartition(S, -n, axis=1)[:, -n:]
+            items[queries[:, None], slots[:, None], np.arange(n)] = members[top]
+            scores[queries[:, None], slots[:, None], np.arange(n)] = np.take_along_axis(
+                S, top, axis=1
+            )
+        items, scores = items.reshape(len(Q), -1), scores.reshape(len(Q), -1)
+        if scores.shape[1] > k:
+            top = np.argpartition(scores, -k, axis=1)[:, -k:]
+            items = np.take_along_axis(items, top, axis=1)
+            scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        return np.take_along_axis(items, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+    def exact_search(self, Q: np.ndarray, k: int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """Brute-force top-K over every item, same output as `search`"""
+        S = self._queries(Q) @ self.vectors.T
+        k = min(k, S.shape[1])
+        top = np.argpartition(S, -k, axis=1)[:, -k:]
+        top_scores = np.take_along_axis(S, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return (
+            np.take_along_axis(top, order, axis=1),
+            np.take_along_axis(top_scores, order, axis=1),
+        )
+
+    def recall_at_k(self, Q: np.ndarray, k: int = 10, n_probe: int = 8) -> float:
+        """Fraction of the exact top-K items found by `search`"""
+        approx, _ = self.search(Q, k, n_probe)
+        exact, _ = self.exact_search(Q, k)
+        hits = sum(len(np.intersect1d(a, e)) for a, e in zip(approx, exact))
+        return hits / exact.size
+
+    def _queries(self, Q: np.ndarray) -> np.ndarray:
+        Q = np.atleast_2d(np.asarray(Q, dtype=np.float32))
+        return _normalize(Q) if self.metric == "cosine" else Q
+
+    def save(self, path: Path) -> "IVFIndex":
+        """Write the index as `.npy` files in `path`, replacing the directory atomically"""
+        save_arrays(
+            path,
+            {
+                "vectors": self.vectors,
+                "centroids": self.centroids,
+                "list_indptr": self.list_indptr,
+                "list_items": self.list_items,
+                "cosine": np.asarray(self.metric == "cosine"),
+            },
+        )
+        logger.info(f"Saved ANN index to {path}")
+        return self
+
+    @classmethod
+    def open(cls, path: Path, mmap_mode: str = "r") -> "IVFIndex":
+        """Open a saved index, memory-mapping the arrays unless `mmap_mode` is None"""
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(
+                f"ANN index {path} must exists. Try running training step before this step."
+            )
+        arrays = load_arrays(
+            path,
+            ["vectors", "centroids", "list_indptr", "list_items", "cosine"],
+            mmap_mode,
+        )
+        metric = "cosine" if bool(arrays.pop("cosine")) else "ip"
+        return cls(**arrays, metric=metric)
+
+
+def _normalize(X: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.maximum(norms, 1e-12)
+
+
+def build_indexes(W: np.ndarray, U: np.ndarray, c: np.ndarray, path: Path):
+    """
+    Build and save the ANN indexes of trained factors in `path`:
+
+      - similar: cosine over the movie embeddings U, for "movies like this".
+      - retrieval: inner product over [U, c], queried with `user_queries`
+        so the scores rank movies like the predicted ratings do.
+    """
+    path = Path(path)
+    IVFIndex.build(U, metric="cosine").save(path / "similar")
+    IVFIndex.build(np.hstack([U, np.asarray(c)[:, None]])).save(path / "retrieval")
+
+
+def user_queries(W: np.ndarray) -> np.ndarray:
+    """Queries [W_i, 1] for the retrieval index, b_i + mu doesn't change the ranking"""
+    W = np.atleast_2d(np.asarray(W))
+    return np.hstack([W, np.ones((len(W), 1), dtype=W.dtype)])
@@ -0,0 +1,69 @@
+import numpy as np
+from pathlib import Path
+from dataclasses import dataclass
+
+from modeling.recommendation.helper import ArraysDirectory
+
+CHECKPOINT_DIR = "checkpoint"
+
+_MASK64 = (1 << 64) - 1
+
+
+@dataclass
+class Checkpoint(ArraysDirectory):
+    """
+    Training state after `epoch` epochs, one `.npy` file per field.
+
+    Besides the parameters it holds the state of the random generator
+    (`rng_state`) and the loss history, so a resumed run continues exactly
+    where the interrupted one stopped. `implicit` and `alpha` record the
+    training mode, None in the checkpoints of the explicit only versions.
+    """
+
+    W: np.ndarray
+    U: np.ndarray
+    b: np.ndarray
+    c: np.ndarray
+    mu: np.ndarray
+    epoch: np.ndarray
+    rng_state: np.ndarray
+    train_losses: np.ndarray
+    test_losses: np.ndarray
+    implicit: np.ndarray = None
+    alpha: np.ndarray = None
+    path: Path = None
+
+    description = "checkpoint"
+    missing_hint = "Try running training step without --resume."
+
+    def saved_description(self) -> str:
+        return f"checkpoint of epoch {int(self.epoch)}"
+
+    def mode(self) -> tuple[str, float]:
+        """Training mode and confidence scale (None in explicit mode) of the checkpoint"""
+        if self.implicit is None or not bool(self.implicit):
+            return "explicit", None
+        return "implicit", float(self.alpha)
+
+
+def rng_state(rng: np.random.Generator) -> np.ndarray:
+    """State of a PCG64 generator as uint64 words, the 128 bit integers split in two"""
+    state = rng.bit_generator.state
+    s, inc = state["state"]["state"], state["state"]["inc"]
+    return np.array(
+        [s >> 64, s & _MASK64, inc >> 64, inc & _MASK64, state["has_uint32"], state["uinteger"]],
+        dtype=np.uint64,
+    )
+
+
+def restore_rng(words: np.ndarray) -> np.random.Generator:
+    """Inverse of `rng_state`"""
+    w = [int(x) for x in words]
+    bit_generator = np.random.PCG64()
+    bit_generator.state = {
+        "bit_generator": "PCG64",
+        "state": {"state": (w[0] << 64) | w[1], "inc": (w[2] << 64) | w[3]},
+        "has_uint32": w[4],
+        "uinteger": w[5],
+    }
+    return np.random.Generator(bit_generator)
@@ -0,0 +1,86 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from modeling.recommendation.factors import Factors
+from modeling.recommendation.recommend import MEMORY_BUDGET, Recommender
+from modeling.recommendation.store import RatingsStore
+
+
+def ranking_metrics(
+    factors: Factors,
+    store: RatingsStore,
+    k: int = 10,
+    min_rating: float = None,
+    memory_budget: int = MEMORY_BUDGET,
+    threads: int = None,
+) -> dict:
+    """
+    Args:
+      - factors (Factors): trained factors
+      - store (RatingsStore): ratings, the train ones are masked out of the rankings
+        and the test ones are the relevant movies
+      - k (int): length of the ranked lists
+      - min_rating (float): test ratings below it are not relevant, every test
+        rating is when None
+      - memory_budget (int): bytes of scores of all the blocks scored at once
+      - threads (int): number of blocks scored at once, the number of CPUs by default
+
+    Returns:
+      dict: precision@k, recall@k, ndcg@k and map@k averaged over the users with
+      at least one relevant movie, and the catalog coverage, the fraction of
+      movies recommended to at least one of them
+
+    The users are scored block by block with `Recommender` (one matmul, the train
+    movies masked through the CSR matrix, `np.argpartition`), the blocks spread
+    across a thread pool since numpy releases the GIL in those calls. A hit is a
+    recommended movie among the relevant ones, looked up in the sorted
+    user * M + movie keys of the test set.
+    """
+    threads = threads or os.cpu_count()
+    N, M = store.shape
+    rows, cols = store.test_rows, store.test_cols
+    if min_rating is not None:
+        relevant = store.test_ratings >= min_rating
+        rows, cols = rows[relevant], cols[relevant]
+    keys = np.unique(rows.astype(np.int64) * M + cols)
+    n_relevant = np.bincount(keys // M, minlength=N)
+    users = np.flatnonzero(n_relevant)
+    k = min(k, M)
+    names = [f"precision@{k}", f"recall@{k}", f"ndcg@{k}", f"map@{k}", "coverage"]
+    if not len(users):
+        return dict.fromkeys(names, 0.0)
+    recommender = Recommender(factors, seen=store.train, memory_budget=memory_budget // threads)
+    discount = 1 / np.log2(np.arange(2, k + 2))
+    # ideal DCG of n relevant movies, n = 0..k
+    ideal = np.concatenate([[0.0], np.cumsum(discount)])
+
+    def score_block(block: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        movies, _ = recommender.recommend(block, k)
+        found = np.searchsorted(keys, block[:, None] * M + movies)
+        hits = keys[np.minimum(found, len(keys) - 1)] == block[:, None] * M + movies
+        n = n_relevant[block]
+        # precision at every rank of a hit, for the average precision
+        precision_at = np.cumsum(hits, axis=1) / np.arange(1, k + 1)
+        sums = np.array(
+            [
+                (hits.sum(1) / k).sum(),
+                (hits.sum(1) / n).sum(),
+                ((hits @ discount) / ideal[np.minimum(n, k)]).sum(),
+                ((precision_at * hits).sum(1) / np.minimum(n, k)).sum(),
+            ]
+        )
+        return sums, np.unique(movies)
+
+    blocks = [
+        users[s : s + recommender.block_size]
+        for s in range(0, len(users), recommender.block_size)
+    ]
+    totals = np.zeros(4)
+    recommended = np.zeros(M, dtype=bool)
+    with ThreadPoolExecutor(threads) as pool:
+        for sums, movies in pool.map(score_block, blocks):
+            totals += sums
+            recommended[movies] = True
+    totals /= len(users)
+    return dict(zip(names, [*totals.tolist(), float(recommended.mean())]))
@@ -0,0 +1,40 @@
+import numpy as np
+from pathlib import Path
+from dataclasses import dataclass
+
+from modeling.recommendation.helper import ArraysDirectory
+
+FACTORS_DIR = "factors"
+
+
+@dataclass
+class Factors(ArraysDirectory):
+    """
+    Trained matrix factorization parameters, one `.npy` file per field.
+
+    prediction[i, j] = W[i].dot(U[j]) + b[i] + c[j] + mu
+    """
+
+    W: np.ndarray
+    U: np.ndarray
+    b: np.ndarray
+    c: np.ndarray
+    mu: np.ndarray
+    path: Path = None
+
+    description = "factors"
+    missing_hint = "Try running training step before this step."
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        """Number of users, movies and latent dimensions"""
+        return self.W.shape[0], self.U.shape[0], self.W.shape[1]
+
+    def predict(self, users: np.ndarray, movies: np.ndarray) -> np.ndarray:
+        """Predicted ratings of (user, movie) index pairs"""
+        return (
+            np.einsum("nk,nk->n", self.W[users], self.U[movies])
+            + self.b[users]
+            + self.c[movies]
+            + self.mu
+        )
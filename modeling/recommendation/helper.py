@@ -1,8 +1,16 @@
 import pickle
+import shutil
+import zipfile
+import numpy as np
 from pathlib import Path
-from typing import Tuple
+from typing import Self, Tuple
+from dataclasses import MISSING, fields
+from contextlib import ExitStack
 from modeling.config import logger
 
+# compact dtypes of the MovieLens rating.csv columns, timestamp is left as is
+RATING_DTYPES = {"userId": np.int32, "movieId": np.int32, "rating": np.float32}
+
 
 def load_data(
     data_dir: Path = ".local/large_files/movielens-20m-dataset",
@@ -31,20 +39,151 @@ def load_data(
     return user2movie, movie2user, usermovie2rating, usermovie2rating_test
 
 
-def save_user_movie_ratings(
-    data_dir: Path,
-    user2movie: dict,
-    movie2user: dict,
-    usermovie2rating: dict,
-    usermovie2rating_test: dict,
-):
-    # Saving data as pickle files
-    logger.info("Saving dictionary files as pickles")
-    with open(data_dir / "user2movie.pickle", "wb") as f:
-        pickle.dump(user2movie, f)
-    with open(data_dir / "movie2user.pickle", "wb") as f:
-        pickle.dump(movie2user, f)
-    with open(data_dir / "usermovie2rating.pickle", "wb") as f:
-        pickle.dump(usermovie2rating, f)
-    with open(data_dir / "usermovie2rating_test.pickle", "wb") as f:
-        pickle.dump(usermovie2rating_test, f)
+def csv_to_parquet(
+    source: Path, parquet_file: Path, chunk_size: int = 1_000_000, member: str = None
+) -> int:
+    """
+    Stream a ratings CSV into parquet, one row group per chunk of `chunk_size` rows.
+
+    `source` is either the CSV itself or a zip archive, read in place from its
+    `member` (the first .csv in the archive by default), so the memory in use
+    is bounded by one chunk whatever the size of the file. The parquet file is
+    written next to `parquet_file` and renamed once complete. Returns the
+    number of rows written.
+    """
+    # only the download needs pandas / pyarrow, the stores are plain numpy
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    source = Path(source)
+    parquet_file = Path(parquet_file)
+    tmp_file = parquet_file.with_name(parquet_file.name + ".tmp")
+    rows = 0
+    with ExitStack() as stack:
+        if zipfile.is_zipfile(source):
+            archive = stack.enter_context(zipfile.ZipFile(source))
+            if member is None:
+                csv_members = [n for n in archive.namelist() if n.endswith(".csv")]
+                if not csv_members:
+                    raise FileNotFoundError(f"No CSV file found in {source}")
+                member = csv_members[0]
+            f = stack.enter_context(archive.open(member))
+        else:
+            f = stack.enter_context(open(source, "rb"))
+        writer = None
+        for chunk in pd.read_csv(f, dtype=RATING_DTYPES, chunksize=chunk_size):
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = stack.enter_context(pq.ParquetWriter(tmp_file, table.schema))
+            else:
+                table = pa.Table.from_pandas(
+                    chunk, schema=writer.schema, preserve_index=False
+                )
+            writer.write_table(table)
+            rows += len(chunk)
+            logger.debug(f"Written {rows} rows to {tmp_file}")
+    if writer is None:
+        raise ValueError(f"No ratings found in {source}")
+    tmp_file.replace(parquet_file)
+    return rows
+
+
+def save_arrays(path: Path, arrays: dict[str, np.ndarray]):
+    """
+    Write every array as `<name>.npy` in the directory `path`, replacing it.
+
+    The arrays are written to `<path>.tmp`, then the current directory is
+    renamed to `<path>.old` and the new one renamed to `path`. Each rename is
+    atomic but the pair isn't: a crash in between leaves no `path`, only
+    `<path>.old`, which `arrays_path` falls back to.
+    """
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    old = path.with_name(path.name + ".old")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, value in arrays.items():
+        np.save(tmp / f"{name}.npy", value)
+    if path.exists():
+        # swap the old directory out before moving the new one in
+        shutil.rmtree(old, ignore_errors=True)
+        path.rename(old)
+    tmp.rename(path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def arrays_path(path: Path) -> Path:
+    """
+    Directory of the arrays saved by `save_arrays` to `path`: `path` itself, or
+    the previous arrays in `<path>.old` when a save was interrupted between
+    its two renames
+    """
+    path = Path(path)
+    old = path.with_name(path.name + ".old")
+    if not path.exists() and old.exists():
+        logger.warning(f"{path} is missing, using the previous version {old}")
+        return old
+    return path
+
+
+def load_arrays(
+    path: Path, names: list[str], mmap_mode: str = "r"
+) -> dict[str, np.ndarray]:
+    """Load the `<name>.npy` arrays of the directory `path`, memory-mapped by default"""
+    path = Path(path)
+    return {name: np.load(path / f"{name}.npy", mmap_mode=mmap_mode) for name in names}
+
+
+class ArraysDirectory:
+    """
+    Mixin of the dataclasses saved as one `<field>.npy` file per field (every
+    field but `path`) in a directory, with `save_arrays` / `load_arrays`.
+    `description` names the data in the messages, `missing_hint` tells how
+    to create a missing directory. Fields with a default are optional, they
+    aren't saved when None and may be missing from older directories.
+    """
+
+    description = "arrays"
+    missing_hint = ""
+
+    def save(self, path: Path) -> Self:
+        """Write every array as `<field>.npy` in `path`, see `save_arrays`"""
+        path = Path(path)
+        save_arrays(path, self.arrays())
+        self.path = path
+        logger.info(f"Saved {self.saved_description()} to {path}")
+        return self
+
+    @classmethod
+    def open(cls, path: Path, mmap_mode: str = "r") -> Self:
+        """Open saved arrays, memory-mapping them unless `mmap_mode` is None"""
+        path = arrays_path(path)
+        if not path.exists():
+            raise FileNotFoundError(
+                f"{cls.description.capitalize()} {path} must exists. {cls.missing_hint}"
+            )
+        names = [
+            name
+            for name in cls.array_names()
+            if name not in cls.optional_names() or (path / f"{name}.npy").exists()
+        ]
+        return cls(**load_arrays(path, names, mmap_mode), path=path)
+
+    def saved_description(self) -> str:
+        return self.description
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {
+            name: np.asarray(getattr(self, name))
+            for name in self.array_names()
+            if getattr(self, name) is not None
+        }
+
+    @classmethod
+    def array_names(cls) -> list[str]:
+        return [f.name for f in fields(cls) if f.name != "path"]
+
+    @classmethod
+    def optional_names(cls) -> set[str]:
+        return {f.name for f in fields(cls) if f.name != "path" and f.default is not MISSING}
@@ -0,0 +1,259 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+from dataclasses import dataclass
+from scipy.sparse import coo_matrix, csr_matrix
+
+from modeling.config import logger
+from modeling.recommendation.factors import FACTORS_DIR, Factors
+from modeling.recommendation.helper import ArraysDirectory, arrays_path, load_arrays
+from modeling.recommendation.matrix_factorization import solve_rows
+from modeling.recommendation.store import STORE_DIR, RatingsStore
+
+DELTA_DIR = "ratings_delta"
+
+
+@dataclass
+class RatingsDelta(ArraysDirectory):
+    """
+    Ratings received after the `RatingsStore` was built, in arrival order.
+
+    rows / cols are user / movie indices, users past the store are new users
+    whose MovieLens ids are new_user_ids (user index N + k for new_user_ids[k]).
+    A later rating of the same (user, movie) pair replaces the earlier ones.
+    stale_movies holds the movies rated since the last item refresh.
+    """
+
+    rows: np.ndarray
+    cols: np.ndarray
+    ratings: np.ndarray
+    new_user_ids: np.ndarray
+    stale_movies: np.ndarray
+    path: Path = None
+
+    description = "ratings delta"
+
+    @classmethod
+    def empty(cls) -> "RatingsDelta":
+        return cls(
+            rows=np.empty(0, dtype=np.int64),
+            cols=np.empty(0, dtype=np.int64),
+            ratings=np.empty(0, dtype=np.float32),
+            new_user_ids=np.empty(0, dtype=np.int64),
+            stale_movies=np.empty(0, dtype=np.int64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ratings)
+
+    def append(
+        self, rows: np.ndarray, cols: np.ndarray, ratings: np.ndarray, new_user_ids: np.ndarray
+    ):
+        cols = np.asarray(cols, dtype=np.int64)
+        self.rows = np.concatenate([self.rows, np.asarray(rows, dtype=np.int64)])
+        self.cols = np.concatenate([self.cols, cols])
+        self.ratings = np.concatenate([self.ratings, np.asarray(ratings, dtype=np.float32)])
+        self.new_user_ids = np.concatenate(
+            [self.new_user_ids, np.asarray(new_user_ids, dtype=np.int64)]
+        )
+        self.stale_movies = np.union1d(self.stale_movies, cols)
+
+    def seen(self, store: RatingsStore) -> csr_matrix:
+        """Rating pattern of the store train ratings plus the delta, for masking seen movies"""
+        if not len(self):
+            return store.train
+        N, M = store.shape
+        N += len(self.new_user_ids)
+        A = store.train
+        # pad the store ratings with empty rows for the new users
+        indptr = np.concatenate(
+            [A.indptr, np.full(N - A.shape[0], A.indptr[-1], dtype=A.indptr.dtype)]
+        )
+        A = csr_matrix((A.data, A.indices, indptr), shape=(N, M))
+        return A + coo_matrix((self.ratings, (self.rows, self.cols)), shape=(N, M)).tocsr()
+
+    @classmethod
+    def open(cls, path: Path) -> "RatingsDelta":
+        """Load a saved delta, an empty one when `path` doesn't exist"""
+        path = arrays_path(path)
+        if not path.exists():
+            delta = cls.empty()
+        else:
+            delta = cls(**load_arrays(path, cls.array_names(), mmap_mode=None))
+        delta.path = path
+        return delta
+
+
+def gather_rows(
+    A: csr_matrix,
+    rows: np.ndarray,
+    extra_rows: np.ndarray,
+    extra_cols: np.ndarray,
+    extra_data: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Args:
+      - A (csr_matrix): base ratings, rows past A.shape[0] have none
+      - rows (np.ndarray): unique row indices to gather
+      - extra_rows, extra_cols, extra_data (np.ndarray): newer ratings (COO arrays)
+        replacing the ratings of A and the earlier extra ratings of the same cell
+
+    Returns:
+      tuple[np.ndarray, np.ndarray, np.ndarray]: indptr, indices and data of the
+      gathered rows, in the order of `rows`
+    """
+    known = np.flatnonzero(rows < A.shape[0])
+    sub = A[rows[known]].tocoo()
+    local = pd.Index(rows).get_indexer(extra_rows)
+    keep = local >= 0
+    r = np.concatenate([known[sub.row], local[keep]])
+    c = np.concatenate([sub.col, extra_cols[keep]]).astype(np.int64)
+    d = np.concatenate([sub.data, extra_data[keep]])
+    # lexsort is stable, the last rating of a cell is the newest one
+    order = np.lexsort((c, r))
+    r, c, d = r[order], c[order], d[order]
+    last = np.ones(len(r), dtype=bool)
+    last[:-1] = (r[1:] != r[:-1]) | (c[1:] != c[:-1])
+    r, c, d = r[last], c[last], d[last]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(r, minlength=len(rows)))])
+    return indptr, c, d
+
+
+def fold_in(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    data: np.ndarray,
+    X: np.ndarray,
+    x_bias: np.ndarray,
+    Y: np.ndarray,
+    y_bias: np.ndarray,
+    mu: float,
+    reg: float,
+    n_iter: int = 3,
+):
+    """
+    Solve the rows of `X` / `x_bias` in place against the fixed `Y` / `y_bias`.
+
+    This is the half-step of `solve_rows` restricted to the columns the rows
+    rated, repeated `n_iter` times since a half-step solves X_i with the
+    previous b_i and b_i with the previous X_i.
+    """
+    cols, local = np.unique(indices, return_inverse=True)
+    Y, y_bias = np.asarray(Y[cols], dtype=X.dtype), np.asarray(y_bias[cols])
+    for _ in range(n_iter):
+        solve_rows(indptr, local, data, X, Y, x_bias, y_bias, mu, reg)
+
+
+class IncrementalALS:
+    """
+    Fold new ratings into trained factors without retraining.
+
+    `add_ratings` appends the ratings to the `RatingsDelta` and re-solves the
+    rows of W and b of the users who rated, against the fixed U and c, from
+    their store and delta ratings; unknown users are appended to W and b.
+    `refresh_items` does the same for the rows of U and c of the movies rated
+    since the last refresh, against the updated W and b. `save` persists the
+    factors and the delta.
+    """
+
+    def __init__(self, data_dir: Path, reg: float = 20.0, n_iter: int = 3):
+        data_dir = Path(data_dir)
+        self.data_dir = data_dir
+        self.reg = reg
+        self.n_iter = n_iter
+        self.store = RatingsStore.open(data_dir / STORE_DIR)
+        self.delta = RatingsDelta.open(data_dir / DELTA_DIR)
+        # loaded in memory, the factors are rewritten by `save`
+        factors = Factors.open(data_dir / FACTORS_DIR, mmap_mode=None)
+        self.W, self.U = factors.W, factors.U
+        self.b, self.c = factors.b, factors.c
+        self.mu = float(factors.mu)
+        self.user_index = pd.Index(
+            np.concatenate([self.store.user_ids, self.delta.new_user_ids])
+        )
+        self.movie_index = pd.Index(self.store.movie_ids)
+        if len(self.W) < len(self.user_index):
+            # factors retrained from the store alone, fold the whole delta in again
+            logger.warning(
+                f"Factors have {len(self.W)} users, ratings have {len(self.user_index)}, "
+                "folding in every user of the ratings delta"
+            )
+            self._grow(len(self.user_index))
+            self.fold_in_users(np.unique(self.delta.rows))
+
+    def add_ratings(
+        self, user_ids: np.ndarray, movie_ids: np.ndarray, ratings: np.ndarray
+    ) -> np.ndarray:
+        """
+        Args:
+          - user_ids, movie_ids (np.ndarray): MovieLens ids, new user ids add users
+          - ratings (np.ndarray): the ratings
+
+        Returns:
+          np.ndarray: indices of the users whose factors were updated
+
+        Ratings of movies unknown to the store are dropped, adding movies needs
+        retraining.
+        """
+        t0 = datetime.now()
+        user_ids, ratings = np.asarray(user_ids), np.asarray(ratings)
+        cols = self.movie_index.get_indexer(np.asarray(movie_ids))
+        unknown = cols < 0
+        if unknown.any():
+            logger.warning(f"Dropping {unknown.sum()} ratings of unknown movies")
+            user_ids, cols, ratings = user_ids[~unknown], cols[~unknown], ratings[~unknown]
+        rows = self.user_index.get_indexer(user_ids)
+        new_user_ids = pd.unique(user_ids[rows < 0])
+        if len(new_user_ids):
+            self.user_index = self.user_index.append(pd.Index(new_user_ids))
+            rows = self.user_index.get_indexer(user_ids)
+            self._grow(len(self.user_index))
+        self.delta.append(rows, cols, ratings, new_user_ids)
+        users = np.unique(rows)
+        self.fold_in_users(users)
+        logger.info(
+            f"Folded in {len(ratings)} ratings of {len(users)} users "
+            f"({len(new_user_ids)} new): {datetime.now() - t0}"
+        )
+        return users
+
+    def fold_in_users(self, users: np.ndarray):
+        """Re-solve the rows of W and b of `users` from their store and delta ratings"""
+        d = self.delta
+        indptr, indices, data = gather_rows(self.store.train, users, d.rows, d.cols, d.ratings)
+        X, x_bias = self.W[users], self.b[users]
+        fold_in(indptr, indices, data, X, x_bias, self.U, self.c, self.mu, self.reg, self.n_iter)
+        self.W[users], self.b[users] = X, x_bias
+
+    def refresh_items(self, movies: np.ndarray = None) -> np.ndarray:
+        """
+        Re-solve the rows of U and c of `movies`, by default the movies rated since
+        the last refresh, against the current W and b. Returns the refreshed movies.
+        """
+        t0 = datetime.now()
+        d = self.delta
+        movies = d.stale_movies if movies is None else np.unique(movies)
+        # movie-major view of the store ratings, the delta transposed
+        A = self.store.train_csc.T
+        indptr, indices, data = gather_rows(A, movies, d.cols, d.rows, d.ratings)
+        X, x_bias = self.U[movies], self.c[movies]
+        fold_in(indptr, indices, data, X, x_bias, self.W, self.b, self.mu, self.reg, self.n_iter)
+        self.U[movies], self.c[movies] = X, x_bias
+        d.stale_movies = np.setdiff1d(d.stale_movies, movies)
+        logger.info(f"Refreshed {len(movies)} movies: {datetime.now() - t0}")
+        return movies
+
+    def factors(self) -> Factors:
+        return Factors(self.W, self.U, self.b, self.c, np.asarray(self.mu))
+
+    def save(self):
+        """Write the factors with the folded-in users appended, and the ratings delta"""
+        self.factors().save(self.data_dir / FACTORS_DIR)
+        self.delta.save(self.data_dir / DELTA_DIR)
+
+    def _grow(self, N: int):
+        # new users start from zero factors and bias
+        n = N - len(self.W)
+        self.W = np.concatenate([self.W, np.zeros((n, self.W.shape[1]), dtype=self.W.dtype)])
+        self.b = np.concatenate([self.b, np.zeros(n, dtype=self.b.dtype)])
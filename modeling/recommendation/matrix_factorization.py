@@ -1,11 +1,27 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 from pathlib import Path
 from datetime import datetime
 
+from scipy.sparse import csr_matrix
+
 from modeling.config import logger
-from modeling.recommendation.helper import load_data
+from modeling.config.profiler import span
+from modeling.recommendation.ann import ANN_DIR, build_indexes
+from modeling.recommendation.checkpoint import (
+    CHECKPOINT_DIR,
+    Checkpoint,
+    restore_rng,
+    rng_state,
+)
+from modeling.recommendation.evaluate import ranking_metrics
+from modeling.recommendation.factors import FACTORS_DIR, Factors
+from modeling.recommendation.helper import arrays_path
+from modeling.recommendation.store import STORE_DIR, RatingsStore
+
+# upper bound on the number of float64 elements of the flattened K x K matrices
+# materialized by `solve_rows` at once (2**24 * 8 bytes = 128MB)
+BLOCK_ELEMENTS = 1 << 24
 
 
 def get_loss(d: dict, W: np.ndarray, U: np.ndarray, b: np.ndarray, c: np.ndarray, mu: np.ndarray) -> float:
@@ -34,24 +50,53 @@ def get_loss(d: dict, W: np.ndarray, U: np.ndarray, b: np.ndarray, c: np.ndarray
       - $$N$$ is the total number of ratings in the dataset.
     
     Python Implementation:
-      - Iterate over each (user, movie) pair in d, extracting the rating r.
-      - Predicts the rating using:
+      - Turns d into row, column and rating arrays.
+      - Delegates to `get_metrics`, which predicts the ratings chunk by chunk using:
 
         $$p=W[i]⋅U[j]+b[i]+c[j]+\mu$$
-      - Computes squared error and accumulates it.
       - Returns the mean squared error (MSE).
 
     Potential Improvements:
-      - Could use NumPy vectorization to improve performance instead of looping.
       - Adding regularization would help avoid overfitting.
     """
-    N = float(len(d))
-    sse = 0
-    for k, r in d.items():
-        i, j = k
-        p = W[i].dot(U[j]) + b[i] + c[j] + mu
-        sse += (p - r) * (p - r)
-    return sse / N
+    keys = np.array(list(d.keys()), dtype=np.int64).reshape(-1, 2)
+    ratings = np.fromiter(d.values(), dtype=np.float64, count=len(d))
+    return get_metrics(keys[:, 0], keys[:, 1], ratings, W, U, b, c, mu)["mse"]
+
+
+def get_metrics(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    ratings: np.ndarray,
+    W: np.ndarray,
+    U: np.ndarray,
+    b: np.ndarray,
+    c: np.ndarray,
+    mu: float,
+    chunk_size: int = 1 << 18,
+) -> dict:
+    """
+    Args:
+      - rows, cols, ratings (np.ndarray): user indices, movie indices and ratings (COO arrays)
+      - W, U, b, c, mu: model parameters, see `get_loss`
+      - chunk_size (int): number of ratings predicted at once, bounds the memory to
+        two (chunk_size, K) gathers
+
+    Returns:
+      dict: mean squared error "mse", its root "rmse" and mean absolute error "mae"
+    """
+    n = len(ratings)
+    sse = 0.0
+    sae = 0.0
+    for s in range(0, n, chunk_size):
+        i = rows[s : s + chunk_size]
+        j = cols[s : s + chunk_size]
+        p = np.einsum("nk,nk->n", W[i], U[j]) + b[i] + c[j] + mu
+        err = p - ratings[s : s + chunk_size]
+        sse += float(err @ err)
+        sae += float(np.abs(err).sum())
+    mse = sse / max(n, 1)
+    return {"mse": mse, "rmse": float(np.sqrt(mse)), "mae": sae / max(n, 1)}
 
 
 def update_W_and_b(
@@ -83,8 +128,8 @@ def update_W_and_b(
         W[i] = np.linalg.solve(matrix, vector)
         b[i] = bi / (len(user2movie[i]) + reg)
         if i % (N // 10) == 0:
-            logger.info(f"i:{i} N:{N}")
-    logger.info(f"updated W and b: {datetime.now() - t0}")
+            logger.info("i:%s N:%s", i, N)
+    logger.info("updated W and b: %s", datetime.now() - t0)
 
 
 def update_U_and_c(
@@ -117,64 +162,519 @@ def update_U_and_c(
             U[j] = np.linalg.solve(matrix, vector)
             c[j] = cj / (len(movie2user[j]) + reg)
             if j % (M // 10) == 0:
-                logger.info(f"j:{j} M:{M}")
+                logger.info("j:%s M:%s", j, M)
         except KeyError:
             # possible not to have any ratings for a movie
             pass
-    logger.info(f"updated U and c: {datetime.now() - t0}")
+    logger.info("updated U and c: %s", datetime.now() - t0)
 
 
-def get_dimensions(
-    user2movie: dict, movie2user: dict, usermovie2rating_test: dict
-) -> tuple[int, int]:
-    N = np.max(list(user2movie.keys())) + 1
-    # the test set may contain movies the train set doesn't have data on
-    m1 = np.max(list(movie2user.keys()))
-    m2 = np.max([m for (u, m), r in usermovie2rating_test.items()])
-    M = max(m1, m2) + 1
-    logger.info(f"N:{N} M:{M}")
-    return N, M
+def triangle_size(K: int) -> int:
+    """Number of entries of the upper triangle of a K x K matrix"""
+    return K * (K + 1) // 2
 
 
-def train_for_recommendation(data_dir: Path) -> tuple[list, list]:
-    # initialize variables
-    user2movie, movie2user, usermovie2rating, usermovie2rating_test = load_data(
-        data_dir
+def outer_products(Y: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    Upper triangles of the outer products $$Y_j Y_j^T$$ of every row of `Y`,
+    shape (len(Y), K (K + 1) / 2), see `symmetric_matrices`
+    """
+    M, K = Y.shape
+    rows, cols = np.triu_indices(K)
+    if out is None:
+        out = np.empty((M, len(rows)), dtype=Y.dtype)
+    np.multiply(Y[:, rows], Y[:, cols], out=out)
+    return out
+
+
+def symmetric_matrices(packed: np.ndarray, K: int) -> np.ndarray:
+    """(n, K, K) symmetric matrices from the (n, K (K + 1) / 2) rows of their upper triangles"""
+    rows, cols = np.triu_indices(K)
+    index = np.empty((K, K), dtype=np.intp)
+    index[rows, cols] = index[cols, rows] = np.arange(len(rows))
+    return packed[:, index]
+
+
+def weighted_outer_products(P: csr_matrix, Y: np.ndarray, YY: np.ndarray = None) -> np.ndarray:
+    r"""
+    Upper triangles of $$\sum_j P_{ij} Y_j Y_j^T$$ of every row of `P`, shape
+    (P.shape[0], K (K + 1) / 2), from `YY = outer_products(Y)` when given, in
+    chunks of `Y` bounded by `BLOCK_ELEMENTS` otherwise.
+    """
+    if YY is not None:
+        return P @ YY
+    M, K = Y.shape
+    block = max(1, BLOCK_ELEMENTS // triangle_size(K))
+    return sum(
+        P[:, m : m + block] @ outer_products(Y[m : m + block])
+        for m in range(0, M, block)
     )
-    N, M = get_dimensions(user2movie, movie2user, usermovie2rating_test)
-    K = 10  # latent dimensionality
-    W = np.random.randn(N, K)
-    b = np.zeros(N)
-    U = np.random.randn(M, K)
-    c = np.zeros(M)
-    mu = np.mean(list(usermovie2rating.values()))
-    # train the parameters
-    epochs = 25
-    reg = 20.0  # regularization penalty
+
+
+def solve_rows(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    data: np.ndarray,
+    X: np.ndarray,
+    Y: np.ndarray,
+    x_bias: np.ndarray,
+    y_bias: np.ndarray,
+    mu: float,
+    reg: float,
+    start: int = 0,
+    stop: int = None,
+    YY: np.ndarray = None,
+):
+    r"""
+    Args:
+      - indptr, indices, data (np.ndarray): compressed sparse rows of the ratings,
+        CSR (users x movies) to update users, CSC (movies x users) to update movies
+      - X (np.ndarray): embedding matrix being updated in place
+      - Y (np.ndarray): fixed embedding matrix of the other side
+      - x_bias (np.ndarray): bias being updated in place
+      - y_bias (np.ndarray): fixed bias of the other side
+      - mu (float): global bias
+      - reg (float): regularization penalty
+      - start, stop (int): range of rows to update, all rows by default
+      - YY (np.ndarray): precomputed `outer_products(Y)`, computed here when omitted
+
+    Vectorized version of the loops in `update_W_and_b` and `update_U_and_c`.
+    For every row $$i$$ with at least one rating it solves
+
+    $$\left( \lambda I + \sum_{j} Y_j Y_j^T \right) X_i = \sum_{j} (r_{ij} - b_i - c_j - \mu) Y_j$$
+
+    and sets $$b_i = \sum_{j} (r_{ij} - X_i \cdot Y_j - c_j - \mu) / (n_i + \lambda)$$
+    with the previous $$X_i$$, exactly like the loops do.
+
+    Python Implementation:
+      - Rows are processed in blocks of at most `BLOCK_ELEMENTS` / K^2 rows.
+      - The per row sums over $$j$$ are segment sums over the row pointers, computed as
+        sparse-dense products of the block with $$Y$$ and with the upper triangles of
+        the outer products $$Y_j Y_j^T$$ (K (K + 1) / 2 columns, the matrices are
+        symmetric), so no (nnz, K, K) stack is ever materialized.
+      - All the K x K systems of a block are solved by one batched `np.linalg.solve` call.
+      - Rows without ratings are left untouched.
+    """
+    stop = len(indptr) - 1 if stop is None else stop
+    M, K = Y.shape
+    block = max(1, BLOCK_ELEMENTS // (K * K))
+    # outer products of the whole Y when they fit the budget, per chunk otherwise
+    if YY is None and M <= block:
+        YY = outer_products(Y)
+    eye = np.eye(K) * reg
+    for s in range(start, stop, block):
+        e = min(s + block, stop)
+        p0, p1 = indptr[s], indptr[e]
+        counts = np.diff(indptr[s : e + 1])
+        nonempty = counts > 0
+        if p1 == p0:
+            continue
+        idx = indices[p0:p1]
+        ptr = indptr[s : e + 1] - p0
+        # P holds the rating pattern, R the ratings less the fixed biases
+        P = csr_matrix((np.ones(p1 - p0), idx, ptr), shape=(e - s, M))
+        offsets = y_bias[idx]
+        offsets += mu
+        R = csr_matrix((data[p0:p1] - offsets, idx, ptr), shape=(e - s, M))
+        matrix = symmetric_matrices(weighted_outer_products(P, Y, YY)[nonempty], K) + eye
+        PY = P @ Y
+        vector = R @ Y - x_bias[s:e, None] * PY
+        bias = np.asarray(R.sum(axis=1)).ravel() - np.einsum("nk,nk->n", X[s:e], PY)
+        rows = np.arange(s, e)[nonempty]
+        # set the updates
+        X[rows] = np.linalg.solve(matrix, vector[nonempty][..., None])[..., 0]
+        x_bias[rows] = bias[nonempty] / (counts[nonempty] + reg)
+
+
+def solve_rows_implicit(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    data: np.ndarray,
+    X: np.ndarray,
+    Y: np.ndarray,
+    alpha: float,
+    reg: float,
+    start: int = 0,
+    stop: int = None,
+    YtY: np.ndarray = None,
+    YY: np.ndarray = None,
+    cg_steps: int = None,
+):
+    r"""
+    Args:
+      - indptr, indices, data (np.ndarray): compressed sparse rows of the
+        interactions (ratings, counts, ...), see `solve_rows`
+      - X (np.ndarray): embedding matrix being updated in place
+      - Y (np.ndarray): fixed embedding matrix of the other side
+      - alpha (float): confidence scale, $$c_{ij} = 1 + \alpha r_{ij}$$
+      - reg (float): regularization penalty
+      - start, stop (int): range of rows to update, all rows by default
+      - YtY (np.ndarray): precomputed $$Y^T Y$$, computed here when omitted
+      - YY (np.ndarray): precomputed `outer_products(Y)` for the direct solver
+      - cg_steps (int): conjugate gradient steps warm started from the current
+        rows, None solves the systems directly
+
+    Implicit feedback ALS (Hu, Koren and Volinsky): every cell is a preference
+    $$p_{ij}$$, 1 when row $$i$$ interacted with column $$j$$ and 0 otherwise,
+    weighted by the confidence $$c_{ij}$$ (1 for the zeros). Every row solves
+
+    $$\left( Y^T Y + \sum_{j} \alpha r_{ij} Y_j Y_j^T + \lambda I \right) X_i = \sum_{j} (1 + \alpha r_{ij}) Y_j$$
+
+    where the sums only run over the interactions of the row: $$Y^T Y$$ accounts for
+    every cell with confidence 1 and is shared by all the rows.
+
+    Python Implementation:
+      - The direct solver adds the sparse correction (nnz K^2 per row) to
+        $$Y^T Y + \lambda I$$ and solves the systems of a block in one batched call.
+      - The conjugate gradient solver never forms the matrices: a product with
+        the matrix of row $$i$$ costs K^2 for $$Y^T Y$$ and nnz K for the correction,
+        which keeps large K (64 to 256) affordable. A few steps are enough since
+        every half-step starts from the previous solution.
+    """
+    stop = len(indptr) - 1 if stop is None else stop
+    M, K = Y.shape
+    block = max(1, BLOCK_ELEMENTS // (K * K))
+    if YtY is None:
+        YtY = Y.T @ Y
+    A = YtY + np.eye(K) * reg
+    if cg_steps is None and YY is None and M <= block:
+        YY = outer_products(Y)
+    for s in range(start, stop, block):
+        e = min(s + block, stop)
+        p0, p1 = indptr[s], indptr[e]
+        idx = indices[p0:p1]
+        ptr = indptr[s : e + 1] - p0
+        # C holds the confidences less one, the part on top of Y^T Y
+        C = csr_matrix((alpha * data[p0:p1], idx, ptr), shape=(e - s, M))
+        rhs = C @ Y + csr_matrix((np.ones(p1 - p0), idx, ptr), shape=C.shape) @ Y
+        if cg_steps is None:
+            matrix = symmetric_matrices(weighted_outer_products(C, Y, YY), K) + A
+            X[s:e] = np.linalg.solve(matrix, rhs[..., None])[..., 0]
+        else:
+            X[s:e] = conjugate_gradient(C, Y, A, rhs, X[s:e], cg_steps)
+
+
+def conjugate_gradient(
+    C: csr_matrix, Y: np.ndarray, A: np.ndarray, rhs: np.ndarray, x: np.ndarray, steps: int
+) -> np.ndarray:
+    r"""
+    Batched conjugate gradient on the systems $$(A + Y^T C_i Y) x_i = rhs_i$$ of every
+    row $$i$$ of the sparse `C`, starting from `x`
+    """
+    rows = np.repeat(np.arange(C.shape[0]), np.diff(C.indptr))
+    Yc = Y[C.indices]
+
+    def matvec(v: np.ndarray) -> np.ndarray:
+        # C_i (Y v_i) for every interaction, then summed back onto the rows
+        t = C.data * np.einsum("nk,nk->n", Yc, v[rows])
+        return v @ A + csr_matrix((t, C.indices, C.indptr), shape=C.shape) @ Y
+
+    x = np.array(x)
+    r = rhs - matvec(x)
+    p = r.copy()
+    rs = np.einsum("nk,nk->n", r, r)
+    for _ in range(steps):
+        Ap = matvec(p)
+        pAp = np.einsum("nk,nk->n", p, Ap)
+        step = np.divide(rs, pAp, out=np.zeros_like(rs), where=pAp > 0)
+        x += step[:, None] * p
+        r -= step[:, None] * Ap
+        rs_new = np.einsum("nk,nk->n", r, r)
+        beta = np.divide(rs_new, rs, out=np.zeros_like(rs), where=rs > 0)
+        p = r + beta[:, None] * p
+        rs = rs_new
+    return x
+
+
+def get_implicit_loss(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    ratings: np.ndarray,
+    W: np.ndarray,
+    U: np.ndarray,
+    alpha: float,
+    chunk_size: int = 1 << 18,
+) -> float:
+    r"""
+    Confidence weighted squared error of the implicit model over every cell,
+    averaged over the N x M cells, with (rows, cols, ratings) as the interactions.
+
+    $$\sum_{i,j} c_{ij} (p_{ij} - W_i \cdot U_j)^2 = \text{tr}(W^T W U^T U) + \sum_{(i,j)} \left( c_{ij} (1 - s_{ij})^2 - s_{ij}^2 \right)$$
+
+    with $$s_{ij} = W_i \cdot U_j$$, so only the interactions are visited.
+    """
+    total = float(np.sum((W.T @ W) * (U.T @ U)))
+    for s in range(0, len(ratings), chunk_size):
+        i = rows[s : s + chunk_size]
+        j = cols[s : s + chunk_size]
+        p = np.einsum("nk,nk->n", W[i], U[j])
+        confidence = 1 + alpha * ratings[s : s + chunk_size]
+        total += float((confidence * (1 - p) ** 2 - p**2).sum())
+    return total / (len(W) * len(U))
+
+
+class ALS:
+    """Alternating least squares over the train ratings, one `solve_rows` call per half-step"""
+
+    def __init__(self, store: RatingsStore, K: int, rng: np.random.Generator = None):
+        N, M = store.shape
+        rng = np.random.default_rng() if rng is None else rng
+        self.A_train = store.train
+        # movie-major view of the ratings for updating U and c
+        self.A_train_csc = store.train_csc
+        self.W = rng.standard_normal((N, K))
+        self.b = np.zeros(N)
+        self.U = rng.standard_normal((M, K))
+        self.c = np.zeros(M)
+
+    def update_W_and_b(self, mu: float, reg: float):
+        A = self.A_train
+        solve_rows(A.indptr, A.indices, A.data, self.W, self.U, self.b, self.c, mu, reg)
+
+    def update_U_and_c(self, mu: float, reg: float):
+        A = self.A_train_csc
+        solve_rows(A.indptr, A.indices, A.data, self.U, self.W, self.c, self.b, mu, reg)
+
+    def load(self, W: np.ndarray, U: np.ndarray, b: np.ndarray, c: np.ndarray):
+        """Copy saved parameters into the (possibly shared) factor arrays"""
+        self.W[:], self.U[:], self.b[:], self.c[:] = W, U, b, c
+
+    def close(self):
+        pass
+
+
+class ImplicitALS(ALS):
+    """
+    Implicit feedback ALS, one `solve_rows_implicit` call per half-step.
+
+    The biases stay at zero and mu is ignored, the predictions are W[i].dot(U[j]).
+    """
+
+    def __init__(
+        self,
+        store: RatingsStore,
+        K: int,
+        alpha: float,
+        cg_steps: int = None,
+        rng: np.random.Generator = None,
+    ):
+        super().__init__(store, K, rng)
+        self.alpha = alpha
+        self.cg_steps = cg_steps
+        # small initial factors, Y^T Y of standard normal ones dominates the first solves
+        self.W *= 0.01
+        self.U *= 0.01
+
+    def update_W_and_b(self, mu: float, reg: float):
+        A = self.A_train
+        solve_rows_implicit(
+            A.indptr, A.indices, A.data, self.W, self.U, self.alpha, reg, cg_steps=self.cg_steps
+        )
+
+    def update_U_and_c(self, mu: float, reg: float):
+        A = self.A_train_csc
+        solve_rows_implicit(
+            A.indptr, A.indices, A.data, self.U, self.W, self.alpha, reg, cg_steps=self.cg_steps
+        )
+
+
+def train_for_recommendation(
+    data_dir: Path,
+    workers: int = 1,
+    ann: bool = True,
+    epochs: int = 25,
+    resume: bool = False,
+    checkpoint_every: int = 1,
+    patience: int = None,
+    min_delta: float = 0.0,
+    seed: int = None,
+    K: int = 10,
+    mode: str = "explicit",
+    alpha: float = 10.0,
+    cg_steps: int = None,
+    solver: str = "als",
+    sgd_options: dict = None,
+    reg: float = 20.0,
+    output_dir: Path = None,
+    store: RatingsStore = None,
+    eval_k: int = None,
+) -> tuple[list, list]:
+    """
+    Args:
+      - data_dir (Path): directory of the ratings store
+      - workers (int): number of processes solving the half-steps, `ParallelALS` when > 1
+      - ann (bool): build the ANN indexes of the trained factors
+      - epochs (int): total number of epochs, including the ones of a resumed checkpoint
+      - resume (bool): continue from the checkpoint in `output_dir`
+      - checkpoint_every (int): epochs between checkpoints, 0 disables them
+      - patience (int): stop after that many epochs without the test loss improving
+        by more than `min_delta`, never stops early when None
+      - seed (int): seed of the factors initialization
+      - K (int): latent dimensionality
+      - mode (str): "explicit" rating prediction or "implicit" feedback (`ImplicitALS`)
+      - alpha (float): confidence scale of the implicit mode
+      - cg_steps (int): conjugate gradient steps of the implicit mode, direct solves when None
+      - solver (str): "als" or mini-batch "sgd" (explicit mode only)
+      - sgd_options (dict): keyword arguments of `SGD` (batch_size, lr, optimizer, ...)
+      - reg (float): regularization penalty
+      - output_dir (Path): directory of the checkpoint, factors and ANN indexes,
+        `data_dir` by default
+      - store (RatingsStore): already opened ratings store of `data_dir`
+      - eval_k (int): also log the `ranking_metrics` of the top eval_k lists every epoch
+
+    Returns:
+      tuple[list, list]: train and test losses of every epoch, the MSE of the
+      ratings or the implicit loss (`get_implicit_loss`)
+    """
+    # initialize variables
+    data_dir = Path(data_dir)
+    output_dir = data_dir if output_dir is None else Path(output_dir)
+    if store is None:
+        with span("train.open_store"):
+            store = RatingsStore.open(data_dir / STORE_DIR)
+    N, M = store.shape
+    logger.info(f"N:{N} M:{M} K:{K}")
+    implicit = mode == "implicit"
+    if implicit and workers > 1:
+        raise ValueError("Implicit ALS runs in a single process, use workers=1")
+    if solver == "sgd" and (implicit or workers > 1):
+        raise ValueError("The sgd solver is explicit only and multi-threaded, use workers=1")
+    checkpoint = None
+    if resume:
+        if arrays_path(output_dir / CHECKPOINT_DIR).exists():
+            checkpoint = Checkpoint.open(output_dir / CHECKPOINT_DIR)
+            if checkpoint.W.shape != (N, K) or checkpoint.U.shape != (M, K):
+                raise ValueError(
+                    f"Checkpoint factors {checkpoint.W.shape} / {checkpoint.U.shape} "
+                    f"don't match the ratings store ({N}, {M}) with K={K}"
+                )
+            # alpha only matters in implicit mode
+            saved_mode, saved_alpha = checkpoint.mode()
+            if (saved_mode, saved_alpha) != (mode, alpha if implicit else None):
+                raise ValueError(
+                    f"Checkpoint was trained with mode={saved_mode} alpha={saved_alpha}, "
+                    f"can't resume it with mode={mode} alpha={alpha if implicit else None}"
+                )
+        else:
+            logger.warning(f"No checkpoint in {output_dir}, training from scratch")
+    rng = np.random.default_rng(seed)
+    # the implicit model has no biases
+    mu = 0.0 if implicit else store.mu
+    if solver == "sgd":
+        from modeling.recommendation.sgd import SGD
+
+        model = SGD(store, K, mu, rng=rng, **(sgd_options or {}))
+    elif workers > 1:
+        from modeling.recommendation.parallel import ParallelALS
+
+        model = ParallelALS(store, K, workers, rng=rng)
+    elif implicit:
+        model = ImplicitALS(store, K, alpha, cg_steps=cg_steps, rng=rng)
+    else:
+        model = ALS(store, K, rng=rng)
     train_losses = []
     test_losses = []
-    for epoch in range(epochs):
-        logger.info(f"epoch:{epoch}")
-        epoch_start = datetime.now()
-        # perform updates
-        # prediction[i,j] = W[i].dot(U[j]) + b[i] + c.T[j] + mu
-        update_W_and_b(W, U, b, c, mu, N, K, reg, user2movie, usermovie2rating)
-        update_U_and_c(W, U, b, c, mu, M, K, reg, movie2user, usermovie2rating)
-        logger.info(f"epoch duration:{datetime.now() - epoch_start}")
-        # store train loss
-        t0 = datetime.now()
-        train_losses.append(get_loss(usermovie2rating, W, U, b, c, mu))
-        # store test loss
-        test_losses.append(get_loss(usermovie2rating_test, W, U, b, c, mu))
-        logger.info(f"calculate cost:{datetime.now() - t0}")
-        logger.info(f"train loss:{train_losses[-1]}")
-        logger.info(f"test loss:{test_losses[-1]}")
+    start = 0
+    if checkpoint is not None:
+        model.load(checkpoint.W, checkpoint.U, checkpoint.b, checkpoint.c)
+        rng = restore_rng(checkpoint.rng_state)
+        mu = float(checkpoint.mu)
+        start = int(checkpoint.epoch)
+        train_losses = checkpoint.train_losses.tolist()
+        test_losses = checkpoint.test_losses.tolist()
+        logger.info(f"Resuming from epoch {start}")
+    # (user, movie, rating) arrays for evaluation
+    train = (store.train_rows, store.user_indices, store.user_data)
+    test = (store.test_rows, store.test_cols, store.test_ratings)
+    # train the parameters
+    # epochs since the test loss last improved by more than min_delta
+    best_loss, stale = np.inf, 0
+    for loss in test_losses:
+        if loss < best_loss - min_delta:
+            best_loss, stale = loss, 0
+        else:
+            stale += 1
+    try:
+        for epoch in range(start, epochs):
+            if patience is not None and stale >= patience:
+                logger.info(
+                    "Early stopping at epoch %s, test loss didn't improve for %s epochs",
+                    epoch,
+                    stale,
+                )
+                break
+            logger.info("epoch:%s", epoch)
+            epoch_start = datetime.now()
+            # perform updates
+            # prediction[i,j] = W[i].dot(U[j]) + b[i] + c.T[j] + mu
+            if solver == "sgd":
+                # the epoch shuffle is seeded from `rng`, checkpointed with the factors
+                with span("train.sgd_epoch", epoch=epoch):
+                    sgd_loss = model.epoch(reg, int(rng.integers(2**63)))
+                logger.info("sgd epoch: %s loss:%s", datetime.now() - epoch_start, sgd_loss)
+            else:
+                t0 = datetime.now()
+                with span("train.update_W_and_b", epoch=epoch):
+                    model.update_W_and_b(mu, reg)
+                logger.info("updated W and b: %s", datetime.now() - t0)
+                t0 = datetime.now()
+                with span("train.update_U_and_c", epoch=epoch):
+                    model.update_U_and_c(mu, reg)
+                logger.info("updated U and c: %s", datetime.now() - t0)
+            logger.info("epoch duration:%s", datetime.now() - epoch_start)
+            # store train loss
+            t0 = datetime.now()
+            with span("train.metrics", epoch=epoch):
+                if implicit:
+                    train_metrics = {"implicit": get_implicit_loss(*train, model.W, model.U, alpha)}
+                    test_metrics = {"implicit": get_implicit_loss(*test, model.W, model.U, alpha)}
+                else:
+                    params = (model.W, model.U, model.b, model.c, mu)
+                    train_metrics = get_metrics(*train, *params)
+                    # store test loss
+                    test_metrics = get_metrics(*test, *params)
+                if eval_k:
+                    factors = Factors(model.W, model.U, model.b, model.c, np.asarray(mu))
+                    test_metrics.update(ranking_metrics(factors, store, eval_k))
+            train_losses.append(train_metrics["implicit" if implicit else "mse"])
+            test_losses.append(test_metrics["implicit" if implicit else "mse"])
+            logger.info("calculate cost:%s", datetime.now() - t0)
+            logger.info("train loss:%s %s", train_losses[-1], train_metrics)
+            logger.info("test loss:%s %s", test_losses[-1], test_metrics)
+            if test_losses[-1] < best_loss - min_delta:
+                best_loss, stale = test_losses[-1], 0
+            else:
+                stale += 1
+            if checkpoint_every and (epoch + 1) % checkpoint_every == 0:
+                with span("train.checkpoint", epoch=epoch):
+                    Checkpoint(
+                        model.W,
+                        model.U,
+                        model.b,
+                        model.c,
+                        np.asarray(mu),
+                        np.asarray(epoch + 1),
+                        rng_state(rng),
+                        np.asarray(train_losses),
+                        np.asarray(test_losses),
+                        np.asarray(implicit),
+                        np.asarray(alpha),
+                    ).save(output_dir / CHECKPOINT_DIR)
+    finally:
+        model.close()
+    with span("train.save_factors"):
+        Factors(model.W, model.U, model.b, model.c, np.asarray(mu)).save(output_dir / FACTORS_DIR)
+    if ann:
+        with span("train.build_indexes"):
+            build_indexes(model.W, model.U, model.c, output_dir / ANN_DIR)
     logger.info(f"train losses:{train_losses}")
     logger.info(f"test losses:{test_losses}")
     return train_losses, test_losses
 
 
 def plot_train_test_loss(train_losses: list, test_losses: list):
+    import matplotlib.pyplot as plt
+
     # plot losses
     plt.plot(train_losses, label="train loss")
     plt.plot(test_losses, label="test loss")
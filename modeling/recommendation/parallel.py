@@ -0,0 +1,135 @@
+import numpy as np
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+from modeling.config import logger
+from modeling.recommendation.matrix_factorization import (
+    ALS,
+    BLOCK_ELEMENTS,
+    outer_products,
+    solve_rows,
+    triangle_size,
+)
+from modeling.recommendation.store import RatingsStore
+
+# arrays of the worker process, filled once by `_init_worker`
+_worker: dict = {}
+
+
+def chunk_rows(indptr: np.ndarray, n_chunks: int) -> list[tuple[int, int]]:
+    """Split the rows of a compressed sparse matrix into ranges with about the same number of ratings"""
+    bounds = np.searchsorted(indptr, np.linspace(0, indptr[-1], n_chunks + 1))
+    bounds[0], bounds[-1] = 0, len(indptr) - 1
+    bounds = np.unique(bounds)
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def _init_worker(shared: dict, ratings: dict):
+    # attach to the factors without registering them with the resource tracker,
+    # the parent process owns and unlinks the shared memory blocks
+    for key, (name, shape, dtype) in shared.items():
+        shm = SharedMemory(name=name, track=False)
+        _worker[f"{key}_shm"] = shm
+        _worker[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    for key, path in ratings.items():
+        _worker[key] = np.load(path, mmap_mode="r")
+
+
+def _solve_chunk(side: str, start: int, stop: int, mu: float, reg: float):
+    w = _worker
+    if side == "users":
+        X, Y, x_bias, y_bias, view = w["W"], w["U"], w["b"], w["c"], "user"
+    else:
+        X, Y, x_bias, y_bias, view = w["U"], w["W"], w["c"], w["b"], "movie"
+    solve_rows(
+        w[f"{view}_indptr"],
+        w[f"{view}_indices"],
+        w[f"{view}_data"],
+        X,
+        Y,
+        x_bias,
+        y_bias,
+        mu,
+        reg,
+        start,
+        stop,
+        YY=w.get("UU" if side == "users" else "WW"),
+    )
+
+
+class ParallelALS(ALS):
+    """
+    ALS with every half-step split into chunks of rows solved in a process pool.
+
+    W, U, b and c (and their outer products when those fit `BLOCK_ELEMENTS`)
+    live in `multiprocessing.shared_memory` and the workers memory-map the
+    CSR / CSC arrays of the saved `RatingsStore`, so they update their rows in
+    place and a task only carries its (start, stop) range.
+    """
+
+    def __init__(
+        self,
+        store: RatingsStore,
+        K: int,
+        workers: int,
+        chunks_per_worker: int = 4,
+        rng: np.random.Generator = None,
+    ):
+        if store.path is None:
+            raise ValueError("ParallelALS needs a RatingsStore saved on disk")
+        N, M = store.shape
+        rng = np.random.default_rng() if rng is None else rng
+        self._shm: list[SharedMemory] = []
+        self._specs: dict = {}
+        self.W = self._share("W", rng.standard_normal((N, K)))
+        self.b = self._share("b", np.zeros(N))
+        self.U = self._share("U", rng.standard_normal((M, K)))
+        self.c = self._share("c", np.zeros(M))
+        block = max(1, BLOCK_ELEMENTS // (K * K))
+        self.WW = self._share("WW", np.empty((N, triangle_size(K)))) if N <= block else None
+        self.UU = self._share("UU", np.empty((M, triangle_size(K)))) if M <= block else None
+        # the workers memory-map the ratings straight from the store files
+        ratings = {
+            name: str(path)
+            for name, path in store.files().items()
+            if name.startswith(("user_", "movie_"))
+        }
+        n_chunks = workers * chunks_per_worker
+        self.user_chunks = chunk_rows(store.user_indptr, n_chunks)
+        self.movie_chunks = chunk_rows(store.movie_indptr, n_chunks)
+        logger.info(f"Starting {workers} ALS workers")
+        self.pool = Pool(workers, initializer=_init_worker, initargs=(self._specs, ratings))
+
+    def _share(self, key: str, value: np.ndarray) -> np.ndarray:
+        shm = SharedMemory(create=True, size=max(1, value.nbytes))
+        self._shm.append(shm)
+        self._specs[key] = (shm.name, value.shape, value.dtype.str)
+        array = np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf)
+        array[:] = value
+        return array
+
+    def update_W_and_b(self, mu: float, reg: float):
+        if self.UU is not None:
+            outer_products(self.U, out=self.UU)
+        self.pool.starmap(
+            _solve_chunk, [("users", s, e, mu, reg) for s, e in self.user_chunks]
+        )
+
+    def update_U_and_c(self, mu: float, reg: float):
+        if self.WW is not None:
+            outer_products(self.W, out=self.WW)
+        self.pool.starmap(
+            _solve_chunk, [("movies", s, e, mu, reg) for s, e in self.movie_chunks]
+        )
+
+    def close(self):
+        """Stop the workers and release the shared memory, copying the factors out of it"""
+        self.pool.close()
+        self.pool.join()
+        self.W, self.b = np.array(self.W), np.array(self.b)
+        self.U, self.c = np.array(self.U), np.array(self.c)
+        self.WW = self.UU = None
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self._shm = []
@@ -1,12 +1,14 @@
+import contextlib
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
+import pyarrow as pa
+import pyarrow.parquet as pq
 from modeling.config import logger
-from sklearn.utils import shuffle
-from scipy.sparse import lil_matrix, csr_matrix, save_npz, load_npz
+from scipy.sparse import coo_matrix, save_npz
 
 
-def basic_transform(df: pd.DataFrame) -> pd.DataFrame:
+def basic_transform(df: pd.DataFrame, keep_timestamp: bool = False) -> pd.DataFrame:
     """Basic transformation of the MovieLens dataset"""
     # ----------------------------------------------------
     # Note:
@@ -20,59 +22,178 @@ def basic_transform(df: pd.DataFrame) -> pd.DataFrame:
     # ----------------------------------------------------
     # make the user ids go from 0...N-1
     df["userId"] = df["userId"] - 1
-    # create a mapping for movie ids
-    unique_movie_ids = set(df["movieId"].values)
-    movie2idx: dict = {}
-    count = 0
-    for movie_id in unique_movie_ids:
-        movie2idx[movie_id] = count
-        count += 1
-    # add them to the data frame
-    # takes awhile
-    df["movie_idx"] = df.apply(lambda row: movie2idx[row["movieId"]], axis=1)
-    df = df.drop(columns=["timestamp"])
+    # map the movie ids to 0...M-1 in increasing movie id order
+    # and add them to the data frame
+    movie_idx, _ = pd.factorize(df["movieId"], sort=True)
+    df["movie_idx"] = movie_idx
+    if not keep_timestamp:
+        df = df.drop(columns=["timestamp"])
     return df
 
 
-def split_train_test(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Split the MovieLens dataset into train and test sets"""
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    # uint64 arrays wrap around silently, which is what the mixer relies on
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def hash_split_mask(
+    users: np.ndarray, movies: np.ndarray, test_size: float = 0.2, seed: int = 0
+) -> np.ndarray:
+    """
+    Test set membership of (user, movie) pairs from a seeded 64-bit hash.
+
+    Each pair is hashed on its own (splitmix64 of the packed ids mixed with the
+    seed), so the assignment doesn't depend on row order or on which rows are
+    processed together, and is the same across runs and machines.
+    """
+    key = (np.asarray(users).astype(np.uint64) << np.uint64(32)) | (
+        np.asarray(movies).astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    )
+    salt = _splitmix64(np.array([seed], dtype=np.uint64))
+    h = _splitmix64(key ^ salt)
+    # top 53 bits as a uniform float in [0, 1)
+    return (h >> np.uint64(11)).astype(np.float64) * 2.0**-53 < test_size
+
+
+def holdout_mask(df: pd.DataFrame, n: int = 1) -> pd.Series:
+    """Test set membership holding out the last `n` ratings of each user by timestamp"""
+    order = df.sort_values(["userId", "timestamp"], kind="stable")
+    grouped = order.groupby("userId", sort=False)
+    rank_from_end = grouped.cumcount(ascending=False)
+    # users with n ratings or less keep all of them for training
+    count = grouped["userId"].transform("size")
+    return ((rank_from_end < n) & (count > n)).reindex(df.index)
+
+
+def split_train_test(
+    df: pd.DataFrame,
+    method: str = "random",
+    test_size: float = 0.2,
+    seed: int = None,
+    holdout: int = 1,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Split the MovieLens dataset into train and test sets
+
+    Methods:
+      - random: shuffles the data and cuts it at 1 - test_size.
+      - hash: `hash_split_mask` on (userId, movieId), reproducible for a given seed.
+      - holdout: last `holdout` ratings of every user by timestamp (`holdout_mask`),
+        needs `basic_transform(df, keep_timestamp=True)`.
+    """
     # load in the data
-    logger.info("Splitting data into train and test set")
-    N = df["userId"].max() + 1  # number of users
-    M = df["movie_idx"].max() + 1  # number of movies
-    # split into train and test
-    df = shuffle(df)
-    cutoff = int(0.8 * len(df))
-    df_train = df.iloc[:cutoff]
-    df_test = df.iloc[cutoff:]
-    return df_train, df_test
+    logger.info(f"Splitting data into train and test set ({method})")
+    if method == "random":
+        # split into train and test
+        from sklearn.utils import shuffle
+
+        df = shuffle(df, random_state=seed)
+        cutoff = int((1 - test_size) * len(df))
+        df_train = df.iloc[:cutoff]
+        df_test = df.iloc[cutoff:]
+        return df_train, df_test
+    if method == "hash":
+        mask = hash_split_mask(
+            df["userId"].to_numpy(), df["movieId"].to_numpy(), test_size, seed or 0
+        )
+    elif method == "holdout":
+        mask = holdout_mask(df, holdout).to_numpy()
+    else:
+        raise ValueError(f"Unknown split method: {method}")
+    return df[~mask], df[mask]
+
+
+def split_parquet(
+    input_file: Path,
+    train_file: Path,
+    test_file: Path,
+    test_size: float = 0.2,
+    seed: int = 0,
+    output_file: Path = None,
+) -> np.ndarray:
+    """
+    `basic_transform` and hash split a MovieLens ratings parquet file one row
+    group at a time.
+
+    A first pass reads the movieId column of every row group to number the
+    movies, the second transforms every row group (userId - 1, movie_idx,
+    no timestamp) and writes its rows to `train_file` or `test_file`, and
+    all of them to `output_file` when given. Only one row group is in memory
+    at once and the files hold the same rows as
+    `split_train_test(basic_transform(df), method="hash")` on the whole file.
+
+    Returns:
+      np.ndarray: the sorted MovieLens movie ids, movie_idx indexes them
+    """
+    source = pq.ParquetFile(input_file)
+    movie_ids = np.unique(
+        np.concatenate(
+            [
+                np.unique(source.read_row_group(i, columns=["movieId"])["movieId"].to_numpy())
+                for i in range(source.num_row_groups)
+            ]
+        )
+    )
+    n_train = n_test = 0
+    with contextlib.ExitStack() as stack:
+        writers = None
+        for i in range(source.num_row_groups):
+            table = source.read_row_group(i, columns=["userId", "movieId", "rating"])
+            users = table["userId"].to_numpy() - 1
+            movies = table["movieId"].to_numpy()
+            table = pa.table(
+                {
+                    "userId": users,
+                    "movieId": movies,
+                    "rating": table["rating"],
+                    "movie_idx": np.searchsorted(movie_ids, movies).astype(np.int64),
+                }
+            )
+            if writers is None:
+                files = [train_file, test_file] + ([output_file] if output_file else [])
+                writers = [
+                    stack.enter_context(pq.ParquetWriter(f, table.schema)) for f in files
+                ]
+            mask = hash_split_mask(users, movies, test_size, seed)
+            writers[0].write_table(table.filter(pa.array(~mask)))
+            writers[1].write_table(table.filter(pa.array(mask)))
+            if output_file:
+                writers[2].write_table(table)
+            n_test += int(mask.sum())
+            n_train += len(mask) - int(mask.sum())
+    logger.info(f"Split {input_file}: {n_train} train rows, {n_test} test rows")
+    return movie_ids
+
+
+def read_split_arrays(path: Path) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(userId, movie_idx, rating) arrays of a `split_parquet` file, without a data frame"""
+    table = pq.read_table(path, columns=["userId", "movie_idx", "rating"])
+    return tuple(table[c].to_numpy() for c in ("userId", "movie_idx", "rating"))
 
 
 def convert_data_to_dict(df: pd.DataFrame, subset: str) -> tuple[dict, dict, dict]:
     """Convert the MovieLens dataset to DICT format"""
+    logger.info(f"Calling: update_dictionaries for subset {subset}")
+    users = df["userId"].to_numpy()
+    movies = df["movie_idx"].to_numpy()
+    ratings = df["rating"].to_numpy()
+
+    def group(keys: np.ndarray, values: np.ndarray) -> dict:
+        # stable sort keeps the values of every key in data frame order
+        order = np.argsort(keys, kind="stable")
+        unique, starts = np.unique(keys[order], return_index=True)
+        groups = np.split(values[order], starts[1:])
+        return dict(zip(unique.tolist(), (g.tolist() for g in groups)))
+
     # a dictionary to tell us which users have rated which movies
-    user2movie = {}
+    user2movie = group(users, movies)
     # a dictionary to tell us which movies have been rated by which users
-    movie2user = {}
+    movie2user = group(movies, users)
     # a dictionary to look up ratings
-    usermovie2rating = {}
-    logger.info(f"Calling: update_dictionaries for subset {subset}")
-
-    def update_dictionaries(row):
-        i = int(row.userId)
-        j = int(row.movie_idx)
-        # Initialize lists if they don't exist
-        if i not in user2movie:
-            user2movie[i] = []
-        if j not in movie2user:
-            movie2user[j] = []
-        # Append values to lists
-        user2movie[i].append(j)
-        movie2user[j].append(i)
-        usermovie2rating[(i, j)] = row.rating
-
-    tqdm.pandas(desc=f"Processing {subset} data")
-    df.progress_apply(update_dictionaries, axis=1)
+    usermovie2rating = dict(zip(zip(users.tolist(), movies.tolist()), ratings.tolist()))
     return user2movie, movie2user, usermovie2rating
 
 
@@ -80,17 +201,9 @@ def save_as_sparse_data(df: pd.DataFrame, data_dir: Path, subset: str):
     """Convert the MovieLens dataset to sparse matrix format"""
     N = df["userId"].max() + 1  # number of users
     M = df["movie_idx"].max() + 1  # number of movies
-    A = lil_matrix((N, M))
     logger.info(f"Calling: update_data for subset {subset}")
-
-    def update_data(row):
-        i = int(row.userId)
-        j = int(row.movie_idx)
-        A[i, j] = row.rating
-
-    tqdm.pandas(desc=f"Processing sparse data for {subset} subset")
-    df.progress_apply(update_data, axis=1)
-    # mask, to tell us which entries exist and which do not
-    A = A.tocsr()
-    mask = A > 0
+    A = coo_matrix(
+        (df["rating"].to_numpy(), (df["userId"].to_numpy(), df["movie_idx"].to_numpy())),
+        shape=(N, M),
+    ).tocsr()
     save_npz(data_dir / f"A{subset}.npz", A)
@@ -0,0 +1,80 @@
+import numpy as np
+from typing import Iterator
+from scipy.sparse import csr_matrix
+
+from modeling.recommendation.factors import Factors
+
+# default bound on the memory used by one block of scores (in bytes)
+MEMORY_BUDGET = 256 * 2**20
+
+
+class Recommender:
+    """
+    Top-K movies for batches of users from trained `Factors`.
+
+    Users are scored in blocks, one (block, K) x (K, M) matrix multiply per
+    block sized to `memory_budget`, the movies a user has already rated (the
+    user's row of `seen`) are masked out and the top K are picked with
+    `np.argpartition` before sorting only those K.
+    """
+
+    def __init__(
+        self, factors: Factors, seen: csr_matrix = None, memory_budget: int = MEMORY_BUDGET
+    ):
+        self.factors = factors
+        self.seen = seen
+        # float32 copies for scoring, half the memory traffic of float64
+        self.U = np.ascontiguousarray(factors.U, dtype=np.float32)
+        self.c = np.asarray(factors.c, dtype=np.float32)
+        M = len(self.U)
+        # scores (float32) plus argpartition indices (int64) per movie of a block
+        self.block_size = max(1, memory_budget // (M * 12))
+
+    def scores(self, users: np.ndarray) -> np.ndarray:
+        """Predicted ratings of every movie for `users`, seen movies set to -inf"""
+        f = self.factors
+        W = np.asarray(f.W[users], dtype=np.float32)
+        S = W @ self.U.T
+        S += self.c
+        S += np.asarray(f.b[users] + f.mu, dtype=np.float32)[:, None]
+        if self.seen is not None:
+            seen = self.seen[users]
+            rows = np.repeat(np.arange(len(users)), np.diff(seen.indptr))
+            S[rows, seen.indices] = -np.inf
+        return S
+
+    def recommend(self, users: np.ndarray, k: int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+          - users (np.ndarray): user indices
+          - k (int): number of movies per user
+
+        Returns:
+          tuple[np.ndarray, np.ndarray]: movie indices and predicted ratings, both
+          (len(users), k) with the best movie first
+        """
+        users = np.asarray(users)
+        k = min(k, len(self.U))
+        movies = np.empty((len(users), k), dtype=np.int64)
+        ratings = np.empty((len(users), k), dtype=np.float32)
+        for s in range(0, len(users), self.block_size):
+            e = min(s + self.block_size, len(users))
+            movies[s:e], ratings[s:e] = self._top_k(users[s:e], k)
+        return movies, ratings
+
+    def recommend_all(self, k: int = 10) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Yield (users, movies, ratings) blocks covering every user"""
+        N = len(self.factors.W)
+        for s in range(0, N, self.block_size):
+            users = np.arange(s, min(s + self.block_size, N))
+            yield users, *self._top_k(users, min(k, len(self.U)))
+
+    def _top_k(self, users: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        S = self.scores(users)
+        top = np.argpartition(S, -k, axis=1)[:, -k:]
+        top_scores = np.take_along_axis(S, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return (
+            np.take_along_axis(top, order, axis=1),
+            np.take_along_axis(top_scores, order, axis=1),
+        )
@@ -0,0 +1,130 @@
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from modeling.recommendation.store import RatingsStore
+
+
+class MatrixFactorization(nn.Module):
+    """prediction[i, j] = W[i].dot(U[j]) + b[i] + c[j] + mu with embedding tables"""
+
+    def __init__(self, N: int, M: int, K: int, mu: float, sparse: bool = False):
+        super().__init__()
+        self.user_embedding = nn.Embedding(N, K, sparse=sparse)
+        self.movie_embedding = nn.Embedding(M, K, sparse=sparse)
+        self.user_bias = nn.Embedding(N, 1, sparse=sparse)
+        self.movie_bias = nn.Embedding(M, 1, sparse=sparse)
+        self.register_buffer("mu", torch.tensor(mu, dtype=torch.float32))
+
+        # Initialize small factors and zero biases
+        nn.init.normal_(self.user_embedding.weight, std=0.1)
+        nn.init.normal_(self.movie_embedding.weight, std=0.1)
+        nn.init.zeros_(self.user_bias.weight)
+        nn.init.zeros_(self.movie_bias.weight)
+
+    def lookup(self, users: torch.Tensor, movies: torch.Tensor) -> tuple[torch.Tensor, ...]:
+        """Rows W[users], U[movies], b[users] and c[movies]"""
+        return (
+            self.user_embedding(users),
+            self.movie_embedding(movies),
+            self.user_bias(users).squeeze(-1),
+            self.movie_bias(movies).squeeze(-1),
+        )
+
+    def forward(self, users: torch.Tensor, movies: torch.Tensor) -> torch.Tensor:
+        w, u, b, c = self.lookup(users, movies)
+        return (w * u).sum(-1) + b + c + self.mu
+
+
+def shuffled_batches(n: int, batch_size: int, generator: torch.Generator):
+    """Yield index tensors of a random permutation of range(n), `batch_size` at a time"""
+    permutation = torch.randperm(n, generator=generator)
+    yield from torch.split(permutation, batch_size)
+
+
+class SGD:
+    """
+    Mini-batch SGD / Adam over the train ratings with torch on CPU.
+
+    The ratings are three tensors (user, movie, rating) sharing the store
+    arrays and every batch is a slice of a random permutation gathered from
+    them, so there is no per-rating Python code. Every rating adds the
+    penalty reg * ((|W_i|^2 + b_i^2) / n_i + (|U_j|^2 + c_j^2) / m_j), with
+    n_i / m_j the number of ratings of the user / movie: summed over an
+    epoch it is the regularization of ALS, so both share `reg`. W, U, b and
+    c are numpy views of the embedding tables.
+    """
+
+    def __init__(
+        self,
+        store: RatingsStore,
+        K: int,
+        mu: float,
+        batch_size: int = 8192,
+        lr: float = 0.01,
+        optimizer: str = "adam",
+        sparse: bool = False,
+        loss: str = "mse",
+        threads: int = None,
+        rng: np.random.Generator = None,
+    ):
+        if threads:
+            torch.set_num_threads(threads)
+        N, M = store.shape
+        rng = np.random.default_rng() if rng is None else rng
+        self.model = MatrixFactorization(N, M, K, mu, sparse=sparse)
+        self.users = torch.from_numpy(store.train_rows.astype(np.int64))
+        self.movies = torch.from_numpy(store.user_indices.astype(np.int64))
+        self.ratings = torch.from_numpy(store.user_data.astype(np.float32))
+        # inverse rating counts spread the regularization over the ratings
+        self.user_weight = 1.0 / np.maximum(np.diff(store.user_indptr), 1)
+        self.movie_weight = 1.0 / np.maximum(np.diff(store.movie_indptr), 1)
+        self.user_weight = torch.from_numpy(self.user_weight.astype(np.float32))
+        self.movie_weight = torch.from_numpy(self.movie_weight.astype(np.float32))
+        self.batch_size = batch_size
+        self.loss = loss
+        params = self.model.parameters()
+        if optimizer == "sgd":
+            self.optimizer = torch.optim.SGD(params, lr=lr)
+        elif sparse:
+            self.optimizer = torch.optim.SparseAdam(list(params), lr=lr)
+        else:
+            self.optimizer = torch.optim.Adam(params, lr=lr)
+        m = self.model
+        self.W = m.user_embedding.weight.detach().numpy()
+        self.U = m.movie_embedding.weight.detach().numpy()
+        self.b = m.user_bias.weight.detach().numpy()[:, 0]
+        self.c = m.movie_bias.weight.detach().numpy()[:, 0]
+        # draw the initial factors from `rng` so that seeded runs are reproducible
+        self.W[:] = 0.1 * rng.standard_normal(self.W.shape)
+        self.U[:] = 0.1 * rng.standard_normal(self.U.shape)
+
+    def epoch(self, reg: float, seed: int) -> float:
+        """One pass over the shuffled ratings, returns the mean training loss"""
+        generator = torch.Generator().manual_seed(seed)
+        m = self.model
+        total = 0.0
+        for batch in shuffled_batches(len(self.ratings), self.batch_size, generator):
+            users, movies = self.users[batch], self.movies[batch]
+            w, u, b, c = m.lookup(users, movies)
+            prediction = (w * u).sum(-1) + b + c + m.mu
+            if self.loss == "huber":
+                error = F.huber_loss(prediction, self.ratings[batch], reduction="none")
+            else:
+                error = (prediction - self.ratings[batch]) ** 2
+            penalty = self.user_weight[users] * ((w**2).sum(-1) + b**2)
+            penalty += self.movie_weight[movies] * ((u**2).sum(-1) + c**2)
+            loss = (error + reg * penalty).mean()
+            self.optimizer.zero_grad()
+            loss.backward()
+            self.optimizer.step()
+            total += loss.item() * len(batch)
+        return total / len(self.ratings)
+
+    def load(self, W: np.ndarray, U: np.ndarray, b: np.ndarray, c: np.ndarray):
+        """Copy saved parameters into the embedding tables"""
+        self.W[:], self.U[:], self.b[:], self.c[:] = W, U, b, c
+
+    def close(self):
+        pass
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from dataclasses import dataclass
+from scipy.sparse import coo_matrix, csr_matrix, csc_matrix
+
+from modeling.config import logger
+from modeling.recommendation.helper import ArraysDirectory, load_data
+
+STORE_DIR = "ratings_store"
+
+
+@dataclass
+class RatingsStore(ArraysDirectory):
+    """
+    Ratings as flat numpy arrays, one `.npy` file per field.
+
+    The train ratings are kept twice, user-major (CSR: user_indptr, user_indices
+    holding movie indices, user_data) and movie-major (CSC: movie_indptr,
+    movie_indices holding user indices, movie_data); the test ratings are COO
+    arrays. user_ids / movie_ids map the indices back to the MovieLens ids.
+    `RatingsStore.open` memory-maps the files, so opening is near-instant and
+    the pages are shared by every process reading the same store.
+    """
+
+    user_indptr: np.ndarray
+    user_indices: np.ndarray
+    user_data: np.ndarray
+    movie_indptr: np.ndarray
+    movie_indices: np.ndarray
+    movie_data: np.ndarray
+    test_rows: np.ndarray
+    test_cols: np.ndarray
+    test_ratings: np.ndarray
+    user_ids: np.ndarray
+    movie_ids: np.ndarray
+    path: Path = None
+
+    description = "ratings store"
+    missing_hint = "Try running preprocessing step before this step."
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self.user_indptr) - 1, len(self.movie_indptr) - 1
+
+    @property
+    def train(self) -> csr_matrix:
+        """Train ratings (users x movies) sharing the store arrays"""
+        return csr_matrix(
+            (self.user_data, self.user_indices, self.user_indptr), shape=self.shape
+        )
+
+    @property
+    def train_csc(self) -> csc_matrix:
+        """Train ratings (users x movies) in movie-major order sharing the store arrays"""
+        return csc_matrix(
+            (self.movie_data, self.movie_indices, self.movie_indptr), shape=self.shape
+        )
+
+    @property
+    def train_rows(self) -> np.ndarray:
+        """User index of every train rating, aligned with user_indices / user_data"""
+        return np.repeat(
+            np.arange(self.shape[0], dtype=self.user_indices.dtype),
+            np.diff(self.user_indptr),
+        )
+
+    @property
+    def mu(self) -> float:
+        """Global mean of the train ratings"""
+        return float(self.user_data.mean(dtype=np.float64))
+
+    @classmethod
+    def from_arrays(
+        cls,
+        train: tuple[np.ndarray, np.ndarray, np.ndarray],
+        test: tuple[np.ndarray, np.ndarray, np.ndarray],
+        user_ids: np.ndarray = None,
+        movie_ids: np.ndarray = None,
+    ) -> "RatingsStore":
+        """Build the store from (rows, cols, ratings) arrays of the train and test sets"""
+        rows, cols, ratings = train
+        test_rows, test_cols, test_ratings = test
+        # the test set may contain users / movies the train set doesn't have data on
+        N = int(max(rows.max(initial=-1), test_rows.max(initial=-1))) + 1
+        M = int(max(cols.max(initial=-1), test_cols.max(initial=-1))) + 1
+        if user_ids is None:
+            user_ids = np.arange(N)
+        if movie_ids is None:
+            movie_ids = np.arange(M)
+        A = coo_matrix((ratings.astype(np.float32), (rows, cols)), shape=(N, M))
+        A_csr = A.tocsr()
+        A_csr.sort_indices()
+        A_csc = A.tocsc()
+        A_csc.sort_indices()
+        index_dtype = A_csr.indices.dtype
+        return cls(
+            user_indptr=A_csr.indptr,
+            user_indices=A_csr.indices,
+            user_data=A_csr.data,
+            movie_indptr=A_csc.indptr,
+            movie_indices=A_csc.indices,
+            movie_data=A_csc.data,
+            test_rows=np.asarray(test_rows, dtype=index_dtype),
+            test_cols=np.asarray(test_cols, dtype=index_dtype),
+            test_ratings=np.asarray(test_ratings, dtype=np.float32),
+            user_ids=np.asarray(user_ids, dtype=np.int64),
+            movie_ids=np.asarray(movie_ids, dtype=np.int64),
+        )
+
+    @classmethod
+    def from_frames(cls, df_train: pd.DataFrame, df_test: pd.DataFrame) -> "RatingsStore":
+        """Build the store from the train / test splits of `basic_transform` output"""
+        df = pd.concat([df_train, df_test])
+        M = int(df["movie_idx"].max()) + 1
+        movie_ids = np.full(M, -1, dtype=np.int64)
+        movie_ids[df["movie_idx"].to_numpy()] = df["movieId"].to_numpy()
+        # basic_transform shifts the MovieLens user ids down by one
+        N = int(df["userId"].max()) + 1
+        user_ids = np.arange(1, N + 1)
+
+        def columns(d: pd.DataFrame):
+            return (
+                d["userId"].to_numpy(),
+                d["movie_idx"].to_numpy(),
+                d["rating"].to_numpy(),
+            )
+
+        return cls.from_arrays(columns(df_train), columns(df_test), user_ids, movie_ids)
+
+    @classmethod
+    def from_pickles(cls, data_dir: Path) -> "RatingsStore":
+        """Convert the dictionaries pickled by older preprocess runs, see `load_data`"""
+        data_dir = Path(data_dir)
+        _, _, usermovie2rating, usermovie2rating_test = load_data(data_dir)
+
+        def columns(d: dict):
+            keys = np.array(list(d.keys()), dtype=np.int64).reshape(-1, 2)
+            ratings = np.fromiter(d.values(), dtype=np.float64, count=len(d))
+            return keys[:, 0], keys[:, 1], ratings
+
+        train, test = columns(usermovie2rating), columns(usermovie2rating_test)
+        N = int(max(train[0].max(initial=-1), test[0].max(initial=-1))) + 1
+        user_ids = np.arange(1, N + 1)
+        movie_ids = None
+        # the pickles only hold indices, recover the movie ids from the edited ratings
+        edited = data_dir / "edited_rating.parquet"
+        if edited.exists():
+            df = pd.read_parquet(edited, columns=["movieId", "movie_idx"])
+            M = int(max(train[1].max(initial=-1), test[1].max(initial=-1))) + 1
+            M = max(M, int(df["movie_idx"].max()) + 1)
+            movie_ids = np.full(M, -1, dtype=np.int64)
+            movie_ids[df["movie_idx"].to_numpy()] = df["movieId"].to_numpy()
+        else:
+            logger.warning(f"{edited} not found, movie ids default to movie indices")
+        return cls.from_arrays(train, test, user_ids, movie_ids)
+
+    def files(self) -> dict[str, Path]:
+        """Paths of the `.npy` files of a saved store"""
+        return {name: self.path / f"{name}.npy" for name in self.array_names()}
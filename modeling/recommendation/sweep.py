@@ -0,0 +1,157 @@
+import itertools
+import math
+import shutil
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+from multiprocessing import Pool
+
+from modeling.config import logger
+from modeling.recommendation.matrix_factorization import train_for_recommendation
+from modeling.recommendation.store import STORE_DIR, RatingsStore
+
+SWEEP_DIR = "sweep"
+
+# store of the worker process, opened once by `_init_worker`
+_worker: dict = {}
+
+
+def grid(space: dict[str, list]) -> list[dict]:
+    """Every combination of the values of `space`"""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+
+
+def random_search(space: dict, n_trials: int, seed: int = None) -> list[dict]:
+    """
+    `n_trials` random combinations of `space`: a list is sampled uniformly, a
+    (low, high) tuple log-uniformly (rounded when both bounds are ints).
+    """
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(n_trials):
+        trial = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                if isinstance(low, int) and isinstance(high, int):
+                    value = int(round(value))
+                trial[name] = value
+            else:
+                trial[name] = values[rng.integers(len(values))]
+        trials.append(trial)
+    return trials
+
+
+def _init_worker(data_dir: str):
+    # every worker memory-maps the same store files, so the ratings pages are shared
+    _worker["store"] = RatingsStore.open(Path(data_dir) / STORE_DIR)
+
+
+def _run_trial(
+    data_dir: str,
+    sweep_dir: str,
+    trial: int,
+    params: dict,
+    epochs: int,
+    seed: int,
+    resume: bool,
+) -> dict:
+    """Train the trial up to `epochs` epochs, resuming from its previous rung"""
+    t0 = datetime.now()
+    train_losses, test_losses = train_for_recommendation(
+        Path(data_dir),
+        ann=False,
+        epochs=epochs,
+        resume=resume,
+        # a single checkpoint at the end of the rung
+        checkpoint_every=epochs,
+        seed=seed,
+        K=params["K"],
+        reg=params["reg"],
+        output_dir=Path(sweep_dir) / f"trial-{trial}",
+        store=_worker["store"],
+    )
+    return {
+        "trial": trial,
+        "epochs_run": len(test_losses),
+        "train_mse": train_losses[-1],
+        "test_mse": test_losses[-1],
+        "wall_time": (datetime.now() - t0).total_seconds(),
+    }
+
+
+def sweep(
+    data_dir: Path,
+    trials: list[dict],
+    workers: int = 1,
+    min_epochs: int = None,
+    eta: int = 3,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Args:
+      - data_dir (Path): directory of the ratings store, trials are saved in `<data_dir>/sweep`
+      - trials (list[dict]): hyperparameters K, reg and epochs of every trial
+      - workers (int): number of trials trained at once
+      - min_epochs (int): epochs of the first successive halving rung, every trial
+        runs its full epochs when None
+      - eta (int): only the best 1 / eta trials of a rung are promoted to the next
+        one, which trains them eta times longer
+      - seed (int): seed of the first trial, trial i uses seed + i
+
+    Returns:
+      pd.DataFrame: one row per trial with its hyperparameters, epochs run,
+      last train / test MSE, wall time and status, sorted by test MSE
+    """
+    data_dir = Path(data_dir)
+    sweep_dir = data_dir / SWEEP_DIR
+    shutil.rmtree(sweep_dir, ignore_errors=True)
+    sweep_dir.mkdir(parents=True)
+    results = {
+        i: {**params, "epochs_run": 0, "wall_time": 0.0, "status": "running"}
+        for i, params in enumerate(trials)
+    }
+    max_epochs = max(params["epochs"] for params in trials)
+    budget = max_epochs if min_epochs is None else min_epochs
+    alive = list(results)
+    with Pool(workers, initializer=_init_worker, initargs=(str(data_dir),)) as pool:
+        while True:
+            # a trial never trains past its own epochs
+            epochs = {i: min(budget, trials[i]["epochs"]) for i in alive}
+            tasks = [
+                (
+                    str(data_dir),
+                    str(sweep_dir),
+                    i,
+                    trials[i],
+                    epochs[i],
+                    seed + i,
+                    results[i]["epochs_run"] > 0,
+                )
+                for i in alive
+                if results[i]["epochs_run"] < epochs[i]
+            ]
+            logger.info(f"Sweep rung of {budget} epochs: training {len(tasks)} trials")
+            for result in pool.starmap(_run_trial, tasks):
+                r = results[result.pop("trial")]
+                r["wall_time"] += result.pop("wall_time")
+                r.update(result)
+            if budget >= max_epochs:
+                break
+            # successive halving, keep the best 1 / eta of the rung
+            alive.sort(key=lambda i: results[i]["test_mse"])
+            keep = max(1, math.ceil(len(alive) / eta))
+            for i in alive[keep:]:
+                results[i]["status"] = "pruned"
+            alive = alive[:keep]
+            budget = min(budget * eta, max_epochs)
+    for i in alive:
+        results[i]["status"] = "completed"
+    df = pd.DataFrame.from_dict(results, orient="index").rename_axis("trial")
+    df = df.sort_values("test_mse").reset_index()
+    df.to_csv(sweep_dir / "results.csv", index=False)
+    logger.info(f"Saved sweep results to {sweep_dir / 'results.csv'}")
+    return df
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+
+from modeling.config import logger
+
+# shape of MovieLens 20M
+MOVIELENS_RATINGS = 20_000_263
+MOVIELENS_USERS = 138_493
+MOVIELENS_MOVIES = 26_744
+MOVIELENS_MAX_MOVIE_ID = 131_262
+
+# share of each half star rating 0.5..5 in MovieLens 20M
+RATING_SHARES = np.array(
+    [0.012, 0.034, 0.017, 0.072, 0.044, 0.214, 0.111, 0.267, 0.077, 0.152]
+)
+
+
+def power_law_counts(
+    total: int, n: int, exponent: float, cap: int, rng: np.random.Generator
+) -> np.ndarray:
+    """`n` counts summing to about `total`, Zipf-like in rank with `exponent`, between 1 and `cap`"""
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -exponent
+    rng.shuffle(weights)
+    weights *= total / weights.sum()
+    # scale up the counts below the cap for what the capped ones lose
+    scale = 1.0
+    for _ in range(20):
+        counts = np.clip(np.round(weights * scale), 1, cap)
+        scale *= total / counts.sum()
+    return counts.astype(np.int64)
+
+
+def synthetic_ratings(
+    n_ratings: int,
+    n_users: int = None,
+    n_movies: int = None,
+    user_exponent: float = 0.8,
+    movie_exponent: float = 1.0,
+    chunk_size: int = 1_000_000,
+    seed: int = 0,
+):
+    """
+    Yield MovieLens shaped ratings data frames (userId, movieId, rating, timestamp)
+    of about `chunk_size` rows, about `n_ratings` rows in total.
+
+    Args:
+      - n_ratings (int): number of ratings
+      - n_users, n_movies (int): scaled from MovieLens 20M by default, users
+        linearly and movies with the square root of n_ratings / 20M
+      - user_exponent, movie_exponent (float): power law exponents of the number of
+        ratings per user and of the movie popularity
+      - chunk_size (int): ratings per data frame
+      - seed (int): seed of the generator
+
+    Users are 1..n_users like MovieLens, movie ids a sorted random subset of
+    1..131262 (or wider). Every user rates distinct movies drawn by popularity,
+    so (user, movie) pairs are unique without a global deduplication and the
+    users of one chunk never appear in another one. Ratings follow the half star
+    shares of MovieLens shifted by user and movie biases, timestamps are
+    datetime64[s] between 1995 and 2015.
+    """
+    rng = np.random.default_rng(seed)
+    scale = n_ratings / MOVIELENS_RATINGS
+    n_users = n_users or max(100, int(MOVIELENS_USERS * scale))
+    n_movies = n_movies or max(100, int(MOVIELENS_MOVIES * np.sqrt(scale)))
+    # a user can't rate more than half of the movies, distinct draws stay cheap
+    counts = power_law_counts(n_ratings, n_users, user_exponent, n_movies // 2, rng)
+    popularity = np.arange(1, n_movies + 1, dtype=np.float64) ** -movie_exponent
+    rng.shuffle(popularity)
+    cdf = np.cumsum(popularity / popularity.sum())
+    movie_ids = np.sort(
+        rng.choice(max(MOVIELENS_MAX_MOVIE_ID, 2 * n_movies), n_movies, replace=False) + 1
+    )
+    user_bias = rng.normal(0, 0.4, n_users)
+    movie_bias = rng.normal(0, 0.5, n_movies)
+    rating_cdf = np.cumsum(RATING_SHARES / RATING_SHARES.sum())
+    t0, t1 = np.datetime64("1995-01-01", "s"), np.datetime64("2015-03-31", "s")
+    ends = np.cumsum(counts)
+    bounds = np.searchsorted(ends, np.arange(chunk_size, ends[-1], chunk_size))
+    for first, last in zip(np.r_[0, bounds], np.r_[bounds, n_users]):
+        if first == last:
+            continue
+        n = counts[first:last]
+        users = np.repeat(np.arange(first, last), n)
+        movies = np.searchsorted(cdf, rng.random(len(users)))
+        movies = np.minimum(movies, n_movies - 1)
+        # heavy users draw without replacement with an exponential race
+        # (the smallest E_j / p_j win), the repeats would hardly ever end
+        heavy = np.flatnonzero(n > n_movies // 16)
+        starts = np.r_[0, np.cumsum(n)]
+        for i in heavy:
+            race = rng.exponential(size=n_movies) / popularity
+            movies[starts[i] : starts[i + 1]] = np.argpartition(race, n[i])[: n[i]]
+        # redraw the repeated movies of the others until they're all distinct,
+        # checking only the users that still had repeats
+        todo = np.flatnonzero(np.repeat(n <= n_movies // 16, n))
+        for _ in range(50):
+            key = users[todo] * n_movies + movies[todo]
+            order = np.argsort(key, kind="stable")
+            duplicate = np.zeros(len(todo), dtype=bool)
+            duplicate[order[1:]] = key[order[1:]] == key[order[:-1]]
+            if not duplicate.any():
+                break
+            redraw = np.searchsorted(cdf, rng.random(int(duplicate.sum())))
+            movies[todo[duplicate]] = np.minimum(redraw, n_movies - 1)
+            todo = todo[np.isin(users[todo], users[todo[duplicate]])]
+        else:
+            keep = np.zeros(len(users), dtype=bool)
+            keep[np.unique(users * n_movies + movies, return_index=True)[1]] = True
+            users, movies = users[keep], movies[keep]
+        # shift the MovieLens rating quantiles by the biases
+        u = rng.random(len(users))
+        shift = (user_bias[users] + movie_bias[movies]) / 4.5
+        stars = np.searchsorted(rating_cdf, np.clip(u + shift, 0, 1 - 1e-12))
+        seconds = rng.integers(0, int((t1 - t0).astype(np.int64)), len(users))
+        yield pd.DataFrame(
+            {
+                "userId": (users + 1).astype(np.int32),
+                "movieId": movie_ids[movies].astype(np.int32),
+                "rating": ((stars + 1) / 2).astype(np.float32),
+                "timestamp": t0 + seconds.astype("timedelta64[s]"),
+            }
+        )
+
+
+def write_synthetic_ratings(parquet_file: Path, n_ratings: int, **kwargs) -> int:
+    """Write `synthetic_ratings` to `parquet_file` one row group per chunk, returns the rows"""
+    parquet_file = Path(parquet_file)
+    parquet_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = parquet_file.with_name(parquet_file.name + ".tmp")
+    rows = 0
+    writer = None
+    try:
+        for df in synthetic_ratings(n_ratings, **kwargs):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_file, table.schema)
+            writer.write_table(table)
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    tmp_file.replace(parquet_file)
+    logger.info(f"Saved {rows} synthetic ratings to {parquet_file}")
+    return rows
@@ -0,0 +1,75 @@
+import re
+import sys
+import subprocess
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# heavy dependencies only the subcommands that use them may import
+HEAVY_MODULES = {
+    "torch",
+    "mlx",
+    "kaggle",
+    "sklearn",
+    "scipy",
+    "pandas",
+    "matplotlib",
+    "numpy",
+}
+# import time budget of the CLI, on top of the interpreter startup
+MAX_IMPORT_SECONDS = 0.2
+# commands that must start without the heavy dependencies
+LIGHT_COMMANDS = [("version",), ("--help",), ("recommendation", "--help")]
+
+
+def imported_modules(*args: str) -> dict[str, float]:
+    """
+    Run `python -m modeling <args>` with -X importtime, returns the modules it
+    imported with the cumulative seconds of the top level imports
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "modeling", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    # import time: self [us] | cumulative | imported package
+    pattern = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$", re.M)
+    for match in pattern.finditer(result.stderr):
+        cumulative, indent, name = match.groups()
+        modules[name] = int(cumulative) / 1e6 if not indent else 0.0
+    return modules
+
+
+class TestCliStartup(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        for args in LIGHT_COMMANDS:
+            with self.subTest(args=args):
+                loaded = {name.split(".")[0] for name in imported_modules(*args)}
+                self.assertIn("modeling", loaded)
+                self.assertEqual(loaded & HEAVY_MODULES, set())
+
+    def test_import_time(self):
+        for args in LIGHT_COMMANDS:
+            with self.subTest(args=args):
+                # best of a few runs, the first one may pay for a cold disk cache
+                seconds = min(
+                    sum(t for name, t in imported_modules(*args).items() if name != "site")
+                    for _ in range(3)
+                )
+                self.assertLess(seconds, MAX_IMPORT_SECONDS)
+
+    def test_lazy_short_help(self):
+        # the static short help of the lazy groups matches their docstrings
+        from modeling.__main__ import cli
+
+        for name, (_, short_help) in cli.lazy_subcommands.items():
+            with self.subTest(name=name):
+                self.assertEqual(cli.get_command(None, name).get_short_help_str(), short_help)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from modeling.llm.parity import attention_difference, logits_difference
+
+# largest difference relative to the largest logit, as `modeling llm parity`
+TOLERANCE = 1e-4
+# small blocks so the 40 token prompts go through several of them
+BLOCK_SIZE = 8
+PROMPT_TOKENS = 40
+
+
+class TestLogitsParity(unittest.TestCase):
+    """The MLX and torch models sharing their weights give the same logits"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.diff = logits_difference(prompt_tokens=24, decode_tokens=8, seed=0)
+
+    def assertClose(self, key: str):
+        self.assertLess(self.diff[key], TOLERANCE * self.diff["max_logit"])
+
+    def test_forward(self):
+        self.assertClose("forward")
+
+    def test_cached_decode(self):
+        self.assertClose("cached")
+
+
+class TestAttentionParity(unittest.TestCase):
+    """The fused and chunked attentions give the logits of the eager one"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.diffs = {
+            attention: attention_difference(
+                attention, prompt_tokens=PROMPT_TOKENS, block_size=BLOCK_SIZE, seed=0
+            )
+            for attention in ("sdpa", "chunked")
+        }
+
+    def assertClose(self, key: str):
+        for attention, diff in self.diffs.items():
+            with self.subTest(attention=attention):
+                self.assertLess(diff[key], TOLERANCE * diff["max_logit"])
+
+    def test_forward(self):
+        self.assertClose("forward")
+
+    def test_chunked_prefill_then_decode(self):
+        self.assertClose("cached")
+
+    def test_left_padded_batch(self):
+        # the longest prompt of the batch spans several blocks
+        self.assertGreater(PROMPT_TOKENS, 2 * BLOCK_SIZE)
+        self.assertClose("batch")
+
+
+if __name__ == "__main__":
+    unittest.main()